@@ -0,0 +1,220 @@
+# archive.py
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+import kpi
+from models import Report
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------
+# تنظیمات (از متغیرهای محیطی)
+# -------------------------------
+
+ARCHIVE_PATH = os.getenv("ARCHIVE_DB", "archive.db")
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "7"))
+HISTORY_MAX = 50
+
+# فیلدهایی که /history رویشان جستجو می‌کند؛ هر کدام ایندکس خودش را دارد
+FIELDS = ("borehole", "rig", "region", "date")
+
+
+class ArchivedReport(NamedTuple):
+    id: int
+    date: str
+    region: str
+    borehole: str
+    rig: str
+    meters: float
+
+
+def date_key(date: str | None) -> str | None:
+    """
+    تاریخ گزارش («روز/ماه/سال»، مثل 05/07/1403) یا «سال/ماه/روز» → 1403-07-05.
+    این شکل به ترتیب الفبایی هم مرتب است و ORDER BY روی ایندکس انجام می‌شود.
+    """
+    if not date:
+        return None
+    parts = re.split(r"[/\-.]", date.strip())
+    if len(parts) != 3 or not all(p.isdigit() for p in parts):
+        return None
+    if len(parts[0]) == 4:
+        y, m, d = parts
+    else:
+        d, m, y = parts
+    return f"{int(y):04d}-{int(m):02d}-{int(d):02d}"
+
+
+class ReportArchive:
+    """
+    گزارش‌های نهایی‌شده در SQLite (حالت WAL).
+
+    ستون‌های جستجو جدا از JSON کامل گزارش نگه داشته می‌شوند و هر کدام با
+    date_key یک ایندکس مرکب دارند؛ «آخرین N گزارش گمانه‌ی X» فقط N ردیف از
+    ایندکس می‌خواند و با رشد آرشیو کند نمی‌شود.
+    """
+
+    def __init__(self, path: str = ARCHIVE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._exporters = []
+        # timeout: در حالت چند-worker چند پروسه در همین فایل می‌نویسند
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS reports ("
+                " id INTEGER PRIMARY KEY,"
+                " user_id INTEGER,"
+                " region TEXT COLLATE NOCASE,"
+                " borehole TEXT COLLATE NOCASE,"
+                " rig TEXT COLLATE NOCASE,"
+                " date TEXT,"
+                " date_key TEXT,"
+                " meters REAL,"
+                " data TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            for field in ("borehole", "rig", "region"):
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS reports_{field} ON reports ({field}, date_key)"
+                )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS reports_date ON reports (date_key)")
+            kpi.init_schema(self._conn)
+
+        # آرشیوی که پیش از شاخص‌ها ساخته شده، یک بار کامل جمع زده می‌شود
+        has_reports = self._conn.execute("SELECT 1 FROM reports LIMIT 1").fetchone()
+        has_rollups = self._conn.execute("SELECT 1 FROM rollups LIMIT 1").fetchone()
+        if has_reports and not has_rollups:
+            self.rebuild_stats()
+
+    def add(self, user_id: int, report: Report) -> int:
+        """
+        ثبت گزارش نهایی و برگرداندن شناسه‌اش (که در report.archive_id هم نوشته می‌شود).
+        گزارشی که archive_id دارد ردیف تازه نمی‌سازد و همان ردیف به‌روز می‌شود.
+        """
+        meters = (report.day.length or 0) + (report.night.length or 0)
+        data = report.to_dict()
+        data.pop("archive_id", None)
+        row = (
+            user_id,
+            report.region,
+            report.borehole,
+            report.rig,
+            report.date,
+            date_key(report.date),
+            meters,
+            json.dumps(data, ensure_ascii=False),
+        )
+        with self._lock, self._conn:
+            report_id = None
+            if report.archive_id is not None:
+                # سهم قبلی همین گزارش در شاخص‌ها با سهم نسخه‌ی جدید جایگزین می‌شود
+                old = self._conn.execute(
+                    "SELECT data FROM reports WHERE id = ?", (report.archive_id,)
+                ).fetchone()
+                if old is not None:
+                    kpi.retract(self._conn, json.loads(old[0]))
+                cur = self._conn.execute(
+                    "UPDATE reports SET user_id = ?, region = ?, borehole = ?, rig = ?,"
+                    " date = ?, date_key = ?, meters = ?, data = ? WHERE id = ?",
+                    row + (report.archive_id,),
+                )
+                if cur.rowcount:
+                    report_id = report.archive_id
+            created = report_id is None
+            if created:
+                cur = self._conn.execute(
+                    "INSERT INTO reports"
+                    " (user_id, region, borehole, rig, date, date_key, meters, data, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    row + (time.time(),),
+                )
+                report_id = cur.lastrowid
+            kpi.apply(self._conn, report)
+        report.archive_id = report_id
+
+        # ثبت دوباره هم به exporterها می‌رسد؛ آرشیو ستونی نسخه‌ی تازه را با همان
+        # report_id اضافه می‌کند و خواننده فقط آخرین نسخه را می‌بیند
+        for exporter in self._exporters:
+            try:
+                exporter(report_id, report)
+            except Exception:
+                logger.exception("archive exporter failed")
+        return report_id
+
+    def add_exporter(self, exporter):
+        """exporter(report_id, report) بعد از هر ثبت یا ثبت دوباره صدا زده می‌شود (مثل آرشیو ستونی)."""
+        self._exporters.append(exporter)
+
+    def query(self, field: str, value: str, limit: int = HISTORY_LIMIT) -> list[ArchivedReport]:
+        """آخرین گزارش‌ها (جدیدترین اول) که field آن‌ها value است."""
+        if field not in FIELDS:
+            raise ValueError(f"فیلد نامعتبر: {field}")
+        limit = max(1, min(limit, HISTORY_MAX))
+
+        if field == "date":
+            value = date_key(value)
+            if value is None:
+                return []
+            where = "date_key = ?"
+        else:
+            where = f"{field} = ?"
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, date, region, borehole, rig, meters FROM reports"
+                f" WHERE {where} ORDER BY date_key DESC, id DESC LIMIT ?",
+                (value.strip(), limit),
+            ).fetchall()
+        return [ArchivedReport(*row) for row in rows]
+
+    def get(self, report_id: int) -> Report | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM reports WHERE id = ?", (report_id,)
+            ).fetchone()
+        return Report.from_dict(json.loads(row[0])) if row else None
+
+    def iter_reports(self, batch: int = 1000):
+        """(id, Report) همه‌ی گزارش‌ها به ترتیب ثبت، دسته‌دسته."""
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, data FROM reports WHERE id > ? ORDER BY id LIMIT ?", (last, batch)
+                ).fetchall()
+            if not rows:
+                return
+            for report_id, data in rows:
+                yield report_id, Report.from_dict(json.loads(data))
+            last = rows[-1][0]
+
+    # ---------- شاخص‌ها (kpi) ----------
+
+    def stats(self, scope: str, key: str) -> kpi.Rollup | None:
+        with self._lock:
+            return kpi.get(self._conn, scope, key)
+
+    def fleet(self, scope: str = "rig") -> list[kpi.Rollup]:
+        with self._lock:
+            return kpi.get_scope(self._conn, scope)
+
+    def rebuild_stats(self) -> int:
+        with self._lock:
+            return kpi.rebuild(self._conn)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def from_env() -> ReportArchive:
+    return ReportArchive(ARCHIVE_PATH)
@@ -0,0 +1,299 @@
+# bench.py
+#
+# بنچمارک مسیرهای داغ: رندر PDF، شکل‌دهی متن فارسی، grid_to_xy و یک گفتگوی
+# کامل start_flow → flow_router → handle_callback با Update و CallbackQuery جعلی.
+#
+#   python bench.py --out baseline.json
+#   python bench.py --out new.json --compare baseline.json --threshold 0.15
+#
+# خروجی JSON است؛ با --compare هر بنچمارکی که میانه‌اش بیش از threshold
+# کندتر شده باشد گزارش می‌شود و کد خروج 1 است (برای CI پیش از deploy).
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# bot_flow در import جلسه و آرشیو را از env می‌سازد؛ بنچمارک نباید به فایل‌های
+# واقعی ربات دست بزند.
+_TMP = tempfile.mkdtemp(prefix="drill-bench-")
+os.environ["SESSION_STORE"] = "memory"
+os.environ["ARCHIVE_DB"] = os.path.join(_TMP, "archive.db")
+os.environ.pop("COLUMNAR_DIR", None)
+
+import pdf_generator  # noqa: E402
+from models import Report, Shift  # noqa: E402
+
+
+# ==========================
+# داده‌ی نمونه
+# ==========================
+
+def _shift(start: float, end: float, notes: str = "") -> Shift:
+    return Shift(
+        supervisors=["علی رضایی"],
+        helpers=["حسن", "Reza Karimi"],
+        workshop_bosses=["مهدی"],
+        start=start,
+        end=end,
+        length=end - start,
+        size="NQ",
+        mud=["سوپرمیکس", "CMC"],
+        water=3500.0,
+        diesel=180.0,
+        notes=notes or "حفاری بدون مشکل انجام شد.",
+    )
+
+
+def _report(night: bool, notes: str = "") -> dict:
+    report = Report(
+        region="سنگان",
+        borehole="BH-12",
+        rig="DB 1200",
+        angle_deg=60.0,
+        date="05/07/1403",
+        day=_shift(120.5, 134.0, notes),
+    )
+    if night:
+        report.night = _shift(134.0, 150.0, notes)
+    return report.to_dict()
+
+
+LONG_NOTES = " ".join(
+    ["تعویض سرمته در متراژ 130 و ادامه‌ی حفاری با سایز NQ؛ فشار پمپ 35 bar."] * 12
+)
+
+REPORTS = {
+    "day_only": _report(night=False),
+    "day_night": _report(night=True),
+    "long_notes": _report(night=True, notes=LONG_NOTES),
+}
+
+SHAPE_TEXTS = [
+    "گمانه BH-12 با دستگاه DB 1200",
+    "سوپرمیکس + CMC",
+    "فشار پمپ 35 bar در متراژ 134.5",
+    "علی رضایی، Reza Karimi",
+    "تعویض سرمته (PQ → HQ) در شیفت شب",
+]
+
+
+# ==========================
+# Update و CallbackQuery جعلی
+# ==========================
+
+class FakeMessage:
+    chat_id = 1
+    message_id = 1
+
+    async def reply_text(self, text, **kwargs):
+        return self
+
+    async def reply_document(self, *args, **kwargs):
+        return self
+
+
+class FakeQuery:
+    def __init__(self, user, data):
+        self.from_user = user
+        self.data = data
+        self.message = FakeMessage()
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, text, **kwargs):
+        return self.message
+
+
+class _User:
+    __slots__ = ("id",)
+
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+class FakeUpdate:
+    def __init__(self, user_id, text=None, data=None):
+        self.effective_user = _User(user_id)
+        self.message = FakeMessage()
+        if text is not None:
+            self.message.text = text
+        self.callback_query = FakeQuery(self.effective_user, data) if data is not None else None
+
+
+# (نوع، مقدار): "t" پیام متنی، "c" داده‌ی callback
+CONVERSATION = (
+    ("t", "سنگان"), ("t", "BH-12"), ("c", "rig_DB1200"), ("t", "60"),
+    ("t", "1403"), ("t", "7"), ("t", "5"),
+    ("c", "shift_day"), ("t", "علی"), ("t", "حسن, رضا"), ("t", "مهدی"),
+    ("t", "120.5"), ("t", "134"), ("c", "size_NQ"), ("c", "mud_super"), ("c", "mud_cmc"),
+    ("c", "mud_done"), ("t", "3500"), ("t", "180"), ("c", "edit_water"), ("t", "3600"),
+    ("c", "shift_ok_day"), ("t", "بدون مشکل"), ("c", "need_night"),
+    ("c", "shift_night"), ("t", "رضا"), ("t", "-"), ("t", "مهدی"),
+    ("t", "134"), ("t", "150"), ("c", "size_HQ"), ("c", "mud_sawdust"), ("c", "mud_done"),
+    ("t", "3000"), ("t", "150"), ("c", "shift_ok_night"), ("t", "شب آرام"),
+)
+
+
+async def run_conversation(bot_flow, user_id: int):
+    await bot_flow.start_flow(FakeUpdate(user_id, "/start"), None)
+    for kind, value in CONVERSATION:
+        if kind == "t":
+            await bot_flow.flow_router(FakeUpdate(user_id, value), None)
+        else:
+            await bot_flow.handle_callback(FakeUpdate(user_id, data=value), None)
+    if bot_flow.store.get_step(user_id) != bot_flow.STEP_DONE:
+        raise RuntimeError("گفتگوی بنچمارک به مرحله‌ی پایان نرسید")
+
+
+# ==========================
+# اندازه‌گیری
+# ==========================
+
+def measure(fn, repeat: int, number: int) -> dict:
+    """fn را repeat دور و هر دور number بار اجرا می‌کند؛ زمان‌ها به میلی‌ثانیه برای هر فراخوانی."""
+    fn()  # گرم کردن (فونت، پس‌زمینه، import)
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) * 1000 / number)
+    samples.sort()
+    return {
+        "median_ms": statistics.median(samples),
+        "min_ms": samples[0],
+        "mean_ms": statistics.fmean(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def benchmarks(scale: float):
+    """(نام، تابع، repeat، number)"""
+    def r(n):
+        return max(1, int(n * scale))
+
+    for name, data in REPORTS.items():
+        yield f"generate_pdf[{name}]", (lambda d=data: pdf_generator.generate_pdf(d)), r(15), 1
+
+    def shape_cached():
+        for text in SHAPE_TEXTS:
+            pdf_generator.fa_shape(text)
+
+    def shape_uncached():
+        pdf_generator._shape_cached.cache_clear()
+        for text in SHAPE_TEXTS:
+            pdf_generator.fa_shape(text)
+
+    yield "fa_shape[cached]", shape_cached, r(20), 500
+    yield "fa_shape[uncached]", shape_uncached, r(20), 20
+
+    def grid():
+        for row in range(0, 60, 3):
+            for col in range(0, 50, 5):
+                pdf_generator.grid_to_xy(col + 0.5, row + 0.5)
+
+    yield "grid_to_xy[200]", grid, r(20), 200
+
+    import bot_flow
+
+    loop = asyncio.new_event_loop()
+    counter = iter(range(10**9))
+
+    def conversation():
+        # هر بار کاربر تازه، تا جلسه‌ی قبلی روی نتیجه اثر نگذارد
+        user_id = next(counter)
+        loop.run_until_complete(run_conversation(bot_flow, user_id))
+        bot_flow.store.delete(user_id)
+
+    yield "conversation[full]", conversation, r(20), 5
+
+
+def run(selected: str | None, scale: float) -> dict:
+    results = {}
+    for name, fn, repeat, number in benchmarks(scale):
+        if selected and selected not in name:
+            continue
+        results[name] = measure(fn, repeat, number)
+        if name.startswith("generate_pdf"):
+            # حجم خروجی هم مثل زمان باید بین دو اجرا مقایسه‌پذیر باشد
+            results[name]["bytes"] = pdf_generator.output_stats()["last_bytes"]
+        print(f"{name:28s} {results[name]['median_ms']:10.4f} ms", file=sys.stderr)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """بنچمارک‌هایی که میانه‌شان بیش از threshold (نسبی) کندتر شده."""
+    regressions = []
+    print(f"{'benchmark':28s} {'base':>10s} {'now':>10s} {'change':>8s}")
+    for name, now in current.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:28s} {'-':>10s} {now['median_ms']:10.4f}      new")
+            continue
+        change = now["median_ms"] / base["median_ms"] - 1
+        flag = "  ← regression" if change > threshold else ""
+        print(f"{name:28s} {base['median_ms']:10.4f} {now['median_ms']:10.4f} {change:+8.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="بنچمارک مسیرهای داغ ربات")
+    parser.add_argument("--out", help="ذخیره‌ی نتیجه به JSON")
+    parser.add_argument("--compare", help="JSON اجرای قبلی برای مقایسه")
+    parser.add_argument("--threshold", type=float, default=0.10, help="کندی مجاز نسبی (پیش‌فرض 0.10)")
+    parser.add_argument("--filter", help="فقط بنچمارک‌هایی که نامشان این را دارد")
+    parser.add_argument("--scale", type=float, default=1.0, help="ضریب تعداد تکرارها")
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, args.scale)
+    doc = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "pdf_profile": pdf_generator.PDF_PROFILE.name,
+        },
+        "results": results,
+    }
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+    else:
+        json.dump(doc, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+# bot_app.py
+#
+# Application ربات و هر چیزی که باید در هر پروسه فقط یک نسخه داشته باشد:
+# render_pool، زمان‌بند ارسال، پردازشگر آپدیت‌ها، پروفایلر و هندلرها.
+# main.py فقط نقطه‌ی ورود است؛ sharding هم همین ماژول را import می‌کند، پس
+# در پروسه‌ی dispatcher همان اشیائی را می‌بیند که main.py ساخته.
+
+import time
+
+# زمان راه‌اندازی از همین‌جا اندازه گرفته می‌شود (بدون بالا آمدن خود مفسر)
+_STARTED = time.perf_counter()
+
+import asyncio
+import logging
+import os
+from telegram import Update
+from telegram.error import BadRequest
+from telegram.ext import (
+    ApplicationBuilder,
+    CommandHandler,
+    MessageHandler,
+    CallbackQueryHandler,
+    ContextTypes,
+    filters,
+)
+
+from bot_flow import (
+    start_flow,
+    flow_router,
+    handle_callback,
+    history_command,
+    stats_command,
+    bulk_command,
+    bulk_document,
+    store,
+    reports,
+    columns,
+    pdfs,
+    sweep_sessions,
+)
+import metrics
+import profiler as profiling
+from outbound import OutboundScheduler
+from update_processor import PerUserUpdateProcessor
+import session_store
+import pdf_cache
+from render_pool import RenderPool, RenderBusy, RenderTimeout
+
+# مدت هر مرحله‌ی راه‌اندازی (ثانیه): imports، ready و در صورت فعال بودن warm_up
+startup = {"imports": time.perf_counter() - _STARTED}
+
+TOKEN = os.getenv("BOT_TOKEN")
+
+# polling یا webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# بیش از ۱: یک dispatcher و چند worker که کاربرها بر اساس user id بینشان تقسیم می‌شوند
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+
+# حالت webhook: سرور محلی (HTTP، یا HTTPS اگر cert/key داده شود) + آدرس عمومی برای تلگرام
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")            # مثل https://bot.example.com/telegram
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")      # هدر X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_CERT = os.getenv("WEBHOOK_CERT")
+WEBHOOK_KEY = os.getenv("WEBHOOK_KEY")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# آدرس Bot API (برای تست با سرور جعلی محلی، مثل http://127.0.0.1:8081/bot)
+BOT_API_URL = os.getenv("BOT_API_URL")
+BOT_API_FILE_URL = os.getenv("BOT_API_FILE_URL")
+
+# اندازه‌ی pool اتصال‌های خروجی به Bot API
+CONNECTION_POOL_SIZE = int(os.getenv("BOT_CONNECTION_POOL_SIZE", "32"))
+POOL_TIMEOUT = float(os.getenv("BOT_POOL_TIMEOUT", "5"))
+
+# بعد از بالا آمدن polling/webhook، workerهای رندر در پس‌زمینه گرم شوند
+PDF_WARMUP = os.getenv("PDF_WARMUP", "0") == "1"
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# این ربات فقط پیام و callback می‌خواهد؛ بقیه‌ی نوع‌ها از سمت تلگرام فیلتر می‌شوند
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+logger = logging.getLogger(__name__)
+
+# رندر PDF روی pool جدا انجام می‌شود تا event loop آزاد بماند
+render_pool = RenderPool.from_env()
+
+# همه‌ی ارسال‌ها به Bot API از این زمان‌بند می‌گذرند (سقف هر چت و سقف سراسری)؛
+# در حالت چند-worker، dispatcher با تغییر تعداد workerها سهم هر کدام را می‌فرستد
+outbound = OutboundScheduler.from_env(BOT_WORKERS)
+
+# آپدیت‌های کاربرهای مختلف موازی، آپدیت‌های هر کاربر به ترتیب
+updates = PerUserUpdateProcessor.from_env()
+
+PDF_CAPTION = "📄 گزارش روزانه حفاری"
+
+# پروفایل نمونه‌ای در محل: /profile برای ادمین‌ها، یا SIGUSR1/SIGUSR2
+profiler = profiling.Profiler.from_env()
+profiler.sessions = lambda: store.count_by_step()
+
+# شاخص‌های لحظه‌ای هنگام scrape خوانده می‌شوند
+metrics.RENDER_QUEUE.fn = lambda: render_pool.depth
+metrics.SESSIONS.fn = lambda: store.count_by_step()
+metrics.STARTUP.fn = lambda: startup
+metrics.OUTBOUND_QUEUE.fn = lambda: outbound.queued
+metrics.UPDATE_QUEUE.fn = lambda: updates.waiting
+
+
+async def send_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+
+    report = store.get_data(user_id)
+    if report is None:
+        await update.message.reply_text("هنوز هیچ گزارشی برای شما ثبت نشده.")
+        return
+
+    # حداقل یکی از شیفت‌ها باید متراژ داشته باشد
+    if not report.day.start and not report.night.start:
+        await update.message.reply_text("گزارش ناقص است. ابتدا حداقل یک شیفت را کامل ثبت کن.")
+        return
+
+    report_data = report.to_dict()
+    key = pdf_cache.report_key(report_data)
+    cached = pdfs.get(user_id, key)
+
+    # همین گزارش قبلاً فرستاده شده: فقط file_id، بدون رندر و بدون آپلود
+    if cached is not None and cached.file_id:
+        try:
+            await update.message.reply_document(document=cached.file_id, caption=PDF_CAPTION)
+            metrics.PDF_REQUESTS.inc("file_id")
+            return
+        except BadRequest:
+            # file_id دیگر معتبر نیست؛ همان بایت‌ها دوباره آپلود می‌شوند
+            pdfs.set_file_id(key, None)
+
+    if cached is not None:
+        pdf_bytes = cached.pdf
+        metrics.PDF_REQUESTS.inc("cached")
+    else:
+        # رندر در حافظه و بیرون از event loop؛ بقیه‌ی کاربران منتظر این رندر نمی‌مانند
+        started = time.perf_counter()
+        try:
+            pdf_bytes = await render_pool.render(report_data)
+        except RenderBusy:
+            metrics.PDF_REQUESTS.inc("busy")
+            await update.message.reply_text("⏳ سرور مشغول ساخت گزارش‌های دیگر است. چند لحظه بعد دوباره /pdf را بزن.")
+            return
+        except RenderTimeout:
+            metrics.PDF_REQUESTS.inc("timeout")
+            await update.message.reply_text("⛔ ساخت PDF بیش از حد طول کشید. دوباره تلاش کن.")
+            return
+        metrics.RENDER_SECONDS.observe(time.perf_counter() - started)
+        metrics.PDF_BYTES.observe(len(pdf_bytes))
+        metrics.PDF_REQUESTS.inc("rendered")
+        pdfs.put(user_id, key, pdf_bytes)
+
+    sent = await update.message.reply_document(
+        document=pdf_bytes,
+        filename="daily_drilling_report.pdf",
+        caption=PDF_CAPTION,
+    )
+    if sent.document is not None:
+        pdfs.set_file_id(key, sent.document.file_id)
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile on [نرخ] | off | dump | status — فقط برای ADMIN_IDS"""
+    if not profiling.is_admin(update.effective_user.id):
+        return
+
+    args = context.args or []
+    action = args[0].lower() if args else "status"
+
+    if action == "on":
+        try:
+            rate = float(args[1]) if len(args) > 1 else None
+        except ValueError:
+            await update.message.reply_text("⛔ نرخ نمونه‌برداری باید عدد بین 0 و 1 باشد.")
+            return
+        profiler.start(rate)
+    elif action == "off":
+        paths = await profiler.stop()
+        await update.message.reply_text("پروفایل خاموش شد.\n" + "\n".join(paths))
+        return
+    elif action == "dump":
+        paths = await profiler.dump()
+        await update.message.reply_text("\n".join(paths) or "هنوز نمونه‌ای نیست.")
+        return
+
+    await update.message.reply_text(profiler.status())
+
+
+async def warm_up(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        startup["warm_up"] = await render_pool.warm_up()
+    except Exception:
+        logger.exception("warm-up failed")
+        return
+    logger.info("render workers warmed up in %.0f ms", startup["warm_up"] * 1000)
+
+
+def schedule_warm_up(app):
+    """warm_up وقتی اجرا می‌شود که app شروع به کار کرده (JobQueue بعد از start راه می‌افتد)."""
+    if not PDF_WARMUP:
+        return
+    if app.job_queue is not None:
+        app.job_queue.run_once(warm_up, 0, name="pdf_warm_up")
+    else:
+        app.create_task(warm_up(None))
+
+
+async def on_startup(app):
+    if metrics.ENABLED:
+        app.bot_data["metrics_server"] = await metrics.start_server()
+    profiler.install_signals(asyncio.get_running_loop())
+    schedule_warm_up(app)
+    startup["ready"] = time.perf_counter() - _STARTED
+    logger.info(
+        "ready in %.0f ms (imports %.0f ms)", startup["ready"] * 1000, startup["imports"] * 1000
+    )
+
+
+async def on_shutdown(app):
+    server = app.bot_data.pop("metrics_server", None)
+    if server is not None:
+        server.close()
+    render_pool.shutdown()
+    # نوشتن تغییرات معوق جلسه‌ها پیش از خروج
+    store.close()
+    reports.close()
+    if columns is not None:
+        columns.close()
+
+
+def application_builder():
+    """ApplicationBuilder با توکن، آدرس Bot API و pool اتصال تنظیم‌شده."""
+    builder = ApplicationBuilder().token(TOKEN).rate_limiter(outbound).concurrent_updates(updates)
+    if metrics.ENABLED:
+        # همان pool، ولی با ثبت زمان و خطای هر فراخوانی Bot API
+        builder = (
+            builder
+            .request(metrics.InstrumentedRequest(
+                connection_pool_size=CONNECTION_POOL_SIZE,
+                pool_timeout=POOL_TIMEOUT,
+            ))
+            .get_updates_request(metrics.InstrumentedRequest(connection_pool_size=1))
+        )
+    else:
+        builder = builder.connection_pool_size(CONNECTION_POOL_SIZE).pool_timeout(POOL_TIMEOUT)
+    if BOT_API_URL:
+        builder = builder.base_url(BOT_API_URL)
+        if BOT_API_FILE_URL:
+            builder = builder.base_file_url(BOT_API_FILE_URL)
+    return builder
+
+
+def instrument(name: str, handler):
+    """پروفایل نمونه‌ای (وقتی روشن است) و با METRICS_PORT زمان هندلر در drill_handler_seconds."""
+    handler = profiler.profiled(handler)
+    if metrics.ENABLED:
+        handler = metrics.timed(name)(handler)
+    return handler
+
+
+def build_application(with_updater: bool = True):
+    builder = application_builder().post_init(on_startup).post_shutdown(on_shutdown)
+    if not with_updater:
+        # worker‌های sharding آپدیت را از dispatcher می‌گیرند، نه از تلگرام
+        builder = builder.updater(None)
+    app = builder.build()
+
+    app.add_handler(CommandHandler("start", instrument("start", start_flow)))
+    app.add_handler(CommandHandler("pdf", instrument("pdf", send_pdf)))  # دستور تولید PDF
+    app.add_handler(CommandHandler("history", instrument("history", history_command)))
+    app.add_handler(CommandHandler("stats", instrument("stats", stats_command)))
+    app.add_handler(CommandHandler("bulk", instrument("bulk", bulk_command)))  # کل گزارش در یک پیام
+    app.add_handler(CommandHandler("profile", profile_command))
+    app.add_handler(CallbackQueryHandler(instrument("handle_callback", handle_callback)))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, instrument("flow_router", flow_router)))
+    app.add_handler(MessageHandler(
+        filters.Document.FileExtension("csv") | filters.Document.FileExtension("json"),
+        instrument("bulk_document", bulk_document),
+    ))
+
+    # جلسه‌های بیکار دوره‌ای از حافظه بیرون می‌روند تا مصرف حافظه ثابت بماند
+    if app.job_queue is not None:
+        app.job_queue.run_repeating(
+            sweep_sessions,
+            interval=session_store.SWEEP_INTERVAL,
+            first=session_store.SWEEP_INTERVAL,
+        )
+    else:
+        logger.warning("JobQueue در دسترس نیست (python-telegram-bot[job-queue])؛ جلسه‌های بیکار پاک نمی‌شوند")
+
+    return app
+
+
+def run_application(app):
+    """اجرای app در حالت BOT_MODE (polling یا webhook)."""
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            raise SystemExit("برای BOT_MODE=webhook باید WEBHOOK_URL تنظیم شود.")
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            cert=WEBHOOK_CERT,
+            key=WEBHOOK_KEY,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+    elif BOT_MODE == "polling":
+        app.run_polling(allowed_updates=ALLOWED_UPDATES)
+    else:
+        raise SystemExit(f"BOT_MODE نامعتبر: {BOT_MODE}")
@@ -1,12 +1,50 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import logging
+import os
+import sqlite3
+
+from telegram import CallbackQuery, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
+import archive
+import bulk_entry
+import kpi
+from edit_coalescer import EditCoalescer
+import metrics
+import pdf_cache
+import session_store
+from fsm import FlowMachine, parse_digits, parse_float, split_names
+from models import MUD_OPTIONS, RIGS, SIZES, Report
+
 # ==========================
 # ساختار داده و مراحل
 # ==========================
 
-user_states = {}
-user_data = {}
+logger = logging.getLogger(__name__)
+
+# مرحله و داده‌ی گزارش هر کاربر (حافظه یا SQLite، بسته به SESSION_STORE)
+store = session_store.from_env()
+
+# جدول مرحله/callback → هندلر؛ هندلرها پایین‌تر با دکوراتور ثبت می‌شوند
+flow = FlowMachine(lambda user_id: store.get_step(user_id))
+if metrics.ENABLED:
+    flow.add_hook(metrics.flow_hook)
+
+# گزارش‌های نهایی‌شده (برای /history)
+reports = archive.from_env()
+
+# PDFهای رندرشده و file_id تلگرام، بر اساس hash محتوای گزارش
+pdfs = pdf_cache.from_env()
+
+# ویرایش‌های پشت‌سرهم کیبورد گل حفاری در یک ویرایش ادغام می‌شوند
+mud_edits = EditCoalescer()
+
+# آرشیو ستونی برای تحلیل چندساله (اختیاری، با COLUMNAR_DIR)؛ columnar و
+# numpy فقط وقتی import می‌شوند که لازم باشند
+columns = None
+if os.getenv("COLUMNAR_DIR"):
+    import columnar
+    columns = columnar.ColumnarWriter(columnar.COLUMNAR_DIR)
+    reports.add_exporter(columns.append_report)
 
 # مراحل هدر
 STEP_REGION = "region"
@@ -50,190 +88,144 @@ STEP_DONE = "done"
 async def start_flow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
-    user_data[user_id] = {
-        "region": None,
-        "borehole": None,
-        "rig": None,
-        "angle_deg": None,
-        "date": None,
-
-        "shifts": {
-            "day": {
-                "supervisors": [],
-                "helpers": [],
-                "workshop_bosses": [],
-                "start": None,
-                "end": None,
-                "length": None,
-                "size": None,
-                "mud": [],
-                "water": None,
-                "diesel": None,
-                "notes": "",
-            },
-            "night": {
-                "supervisors": [],
-                "helpers": [],
-                "workshop_bosses": [],
-                "start": None,
-                "end": None,
-                "length": None,
-                "size": None,
-                "mud": [],
-                "water": None,
-                "diesel": None,
-                "notes": "",
-            },
-        },
-        "current_shift": None,
-        "edit_field": None,  # برای ویرایش متراژ/آب/گازوئیل
-    }
-
-    user_states[user_id] = STEP_REGION
+    store.set_data(user_id, Report())
+
+    store.set_step(user_id, STEP_REGION)
     await update.message.reply_text("🔸 لطفاً *منطقه* را وارد کنید:", parse_mode="Markdown")
 
 
 # ==========================
 # مدیریت پیام‌های متنی
 # ==========================
+#
+# هر مرحله هندلر خودش را با @flow.step ثبت می‌کند؛ flow_router فقط مرحله‌ی
+# کاربر را می‌خواند و به جدول fsm می‌سپارد.
 
 async def flow_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = (update.message.text or "").strip()
 
-    if user_id not in user_states:
+    step = store.get_step(user_id)
+    if step is None:
         await update.message.reply_text("برای شروع /start را بزن.")
         return
 
-    step = user_states[user_id]
+    return await flow.dispatch_message(update, user_id, step, text, default=invalid_input)
 
-    # --- منطقه ---
-    if step == STEP_REGION:
-        user_data[user_id]["region"] = text
-        user_states[user_id] = STEP_BOREHOLE
-        return await update.message.reply_text(
-            "🔸 شماره گمانه را وارد کنید (ترجیحاً با اعداد انگلیسی):"
-        )
 
-    # --- شماره گمانه ---
-    if step == STEP_BOREHOLE:
-        user_data[user_id]["borehole"] = text
-        user_states[user_id] = STEP_RIG
+async def invalid_input(update, user_id, text):
+    return await update.message.reply_text("⛔ ورودی نامعتبر.")
 
-        buttons = [
-            [InlineKeyboardButton("DB 1200", callback_data="rig_DB1200")],
-            [InlineKeyboardButton("DBC-S15-A", callback_data="rig_DBC")],
-        ]
-        return await update.message.reply_text(
-            "🔸 دستگاه حفاری را انتخاب کن:",
-            reply_markup=InlineKeyboardMarkup(buttons),
-        )
 
-    # --- زاویه ---
-    if step == STEP_ANGLE:
-        try:
-            ang = float(text.replace(",", "."))
-        except ValueError:
-            return await update.message.reply_text("⛔ زاویه باید عدد باشد.")
-
-        user_data[user_id]["angle_deg"] = ang
-        user_states[user_id] = STEP_DATE_YEAR
-        return await update.message.reply_text("🔸 سال گزارش:")
-
-    # --- سال ---
-    if step == STEP_DATE_YEAR:
-        if not text.isdigit():
-            return await update.message.reply_text("⛔ سال باید عدد باشد.")
-        user_data[user_id]["date_year"] = int(text)
-        user_states[user_id] = STEP_DATE_MONTH
-        return await update.message.reply_text("🔸 ماه:")
-
-    # --- ماه ---
-    if step == STEP_DATE_MONTH:
-        if not text.isdigit():
-            return await update.message.reply_text("⛔ ماه باید عدد باشد.")
-        user_data[user_id]["date_month"] = int(text)
-        user_states[user_id] = STEP_DATE_DAY
-        return await update.message.reply_text("🔸 روز:")
-
-    # --- روز ---
-    if step == STEP_DATE_DAY:
-        if not text.isdigit():
-            return await update.message.reply_text("⛔ روز باید عدد باشد.")
-        day = int(text)
-        y = user_data[user_id]["date_year"]
-        m = user_data[user_id]["date_month"]
-
-        user_data[user_id]["date"] = f"{day:02d}/{m:02d}/{y}"
-        del user_data[user_id]["date_year"]
-        del user_data[user_id]["date_month"]
-
-        d = user_data[user_id]
-        summary = (
-            "✅ هدر ثبت شد:\n"
-            f"• منطقه: {d['region']}\n"
-            f"• گمانه: {d['borehole']}\n"
-            f"• دستگاه: {d['rig']}\n"
-            f"• زاویه: {d['angle_deg']} درجه\n"
-            f"• تاریخ: {d['date']}\n\n"
-            "حالا شیفت را انتخاب کن."
-        )
-        await update.message.reply_text(summary)
-        return await ask_shift_choice(update, user_id)
-
-    # --- مسئول/مسئولین شیفت ---
-    if step == STEP_SHIFT_SUPERVISORS:
-        shift = user_data[user_id]["current_shift"]
-        user_data[user_id]["shifts"][shift]["supervisors"] = split_names(text)
-        user_states[user_id] = STEP_SHIFT_HELPERS
-        return await update.message.reply_text(
-            f"🔹 نام پرسنل کمکی شیفت {fa_shift(shift)} را وارد کن "
-            "(اگر چند نفر است، با «،» یا ',' جدا کن):"
-        )
+# --- منطقه ---
+@flow.step(STEP_REGION, to=(STEP_BOREHOLE,))
+async def handle_region(update, user_id, text):
+    store.get_data(user_id).region = text
+    store.set_step(user_id, STEP_BOREHOLE)
+    return await update.message.reply_text(
+        "🔸 شماره گمانه را وارد کنید (ترجیحاً با اعداد انگلیسی):"
+    )
 
-    # --- پرسنل کمکی ---
-    if step == STEP_SHIFT_HELPERS:
-        shift = user_data[user_id]["current_shift"]
-        user_data[user_id]["shifts"][shift]["helpers"] = split_names(text)
-        user_states[user_id] = STEP_SHIFT_WORKSHOP
-        return await update.message.reply_text(
-            f"🔹 نام سرپرست کارگاه برای شیفت {fa_shift(shift)} (اگر دو نفرند، با «،» جدا کن):"
-        )
 
-    # --- سرپرست کارگاه ---
-    if step == STEP_SHIFT_WORKSHOP:
-        shift = user_data[user_id]["current_shift"]
-        user_data[user_id]["shifts"][shift]["workshop_bosses"] = split_names(text)
-        return await ask_start_depth(update, user_id)
+# --- شماره گمانه ---
+@flow.step(STEP_BOREHOLE, to=(STEP_RIG,))
+async def handle_borehole(update, user_id, text):
+    store.get_data(user_id).borehole = text
+    store.set_step(user_id, STEP_RIG)
 
-    # --- متراژ شروع ---
-    if step == STEP_START_DEPTH:
-        return await handle_start_depth(update, user_id, text)
+    buttons = [[InlineKeyboardButton(name, callback_data=f"rig_{key}")] for key, name in RIGS.items()]
+    return await update.message.reply_text(
+        "🔸 دستگاه حفاری را انتخاب کن:",
+        reply_markup=InlineKeyboardMarkup(buttons),
+    )
 
-    # --- متراژ پایان ---
-    if step == STEP_END_DEPTH:
-        return await handle_end_depth(update, user_id, text)
 
-    # --- آب ---
-    if step == STEP_WATER:
-        return await handle_water(update, user_id, text)
+# --- زاویه ---
+@flow.step(STEP_ANGLE, parse=parse_float, error="⛔ زاویه باید عدد باشد.", to=(STEP_DATE_YEAR,))
+async def handle_angle(update, user_id, ang):
+    store.get_data(user_id).angle_deg = ang
+    store.set_step(user_id, STEP_DATE_YEAR)
+    return await update.message.reply_text("🔸 سال گزارش:")
 
-    # --- گازوئیل ---
-    if step == STEP_DIESEL:
-        return await handle_diesel(update, user_id, text)
 
-    # --- ویرایش یک فیلد از شیفت ---
-    if step == STEP_EDIT_FIELD:
-        return await handle_edit_field(update, user_id, text)
+# --- سال ---
+@flow.step(STEP_DATE_YEAR, parse=parse_digits, error="⛔ سال باید عدد باشد.", to=(STEP_DATE_MONTH,))
+async def handle_year(update, user_id, year):
+    store.get_data(user_id).date_year = year
+    store.set_step(user_id, STEP_DATE_MONTH)
+    return await update.message.reply_text("🔸 ماه:")
 
-    # --- توضیحات (برای شیفت روز یا شب) ---
-    if step == STEP_NOTES:
-        return await handle_notes(update, user_id, text)
 
-    if step == STEP_DONE:
-        return await update.message.reply_text("گزارش ثبت شده است. برای گزارش جدید /start را بزن.")
+# --- ماه ---
+@flow.step(STEP_DATE_MONTH, parse=parse_digits, error="⛔ ماه باید عدد باشد.", to=(STEP_DATE_DAY,))
+async def handle_month(update, user_id, month):
+    store.get_data(user_id).date_month = month
+    store.set_step(user_id, STEP_DATE_DAY)
+    return await update.message.reply_text("🔸 روز:")
 
-    return await update.message.reply_text("⛔ ورودی نامعتبر.")
+
+# --- روز ---
+@flow.step(STEP_DATE_DAY, parse=parse_digits, error="⛔ روز باید عدد باشد.", to=(STEP_CHOOSE_SHIFT,))
+async def handle_day(update, user_id, day):
+    report = store.get_data(user_id)
+    y = report.date_year
+    m = report.date_month
+
+    report.date = f"{day:02d}/{m:02d}/{y}"
+    report.date_year = None
+    report.date_month = None
+
+    await update.message.reply_text(header_summary(report) + "\n\nحالا شیفت را انتخاب کن.")
+    return await ask_shift_choice(update, user_id)
+
+
+def header_summary(report: Report) -> str:
+    return (
+        "✅ هدر ثبت شد:\n"
+        f"• منطقه: {report.region}\n"
+        f"• گمانه: {report.borehole}\n"
+        f"• دستگاه: {report.rig}\n"
+        f"• زاویه: {report.angle_deg} درجه\n"
+        f"• تاریخ: {report.date}"
+    )
+
+
+# --- مسئول/مسئولین شیفت ---
+@flow.step(STEP_SHIFT_SUPERVISORS, to=(STEP_SHIFT_HELPERS,))
+async def handle_supervisors(update, user_id, text):
+    report = store.get_data(user_id)
+    shift = report.current_shift
+    report.shift(shift).supervisors = split_names(text)
+    store.set_step(user_id, STEP_SHIFT_HELPERS)
+    return await update.message.reply_text(
+        f"🔹 نام پرسنل کمکی شیفت {fa_shift(shift)} را وارد کن "
+        "(اگر چند نفر است، با «،» یا ',' جدا کن):"
+    )
+
+
+# --- پرسنل کمکی ---
+@flow.step(STEP_SHIFT_HELPERS, to=(STEP_SHIFT_WORKSHOP,))
+async def handle_helpers(update, user_id, text):
+    report = store.get_data(user_id)
+    shift = report.current_shift
+    report.shift(shift).helpers = split_names(text)
+    store.set_step(user_id, STEP_SHIFT_WORKSHOP)
+    return await update.message.reply_text(
+        f"🔹 نام سرپرست کارگاه برای شیفت {fa_shift(shift)} (اگر دو نفرند، با «،» جدا کن):"
+    )
+
+
+# --- سرپرست کارگاه ---
+@flow.step(STEP_SHIFT_WORKSHOP, to=(STEP_START_DEPTH,))
+async def handle_workshop(update, user_id, text):
+    report = store.get_data(user_id)
+    report.shift(report.current_shift).workshop_bosses = split_names(text)
+    return await ask_start_depth(update, user_id)
+
+
+@flow.step(STEP_DONE)
+async def handle_done(update, user_id, text):
+    return await update.message.reply_text("گزارش ثبت شده است. برای گزارش جدید /start را بزن.")
 
 
 # ==========================
@@ -246,70 +238,88 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
     await query.answer()
 
-    if user_id not in user_states:
+    if store.get_step(user_id) is None:
         return await query.edit_message_text("جلسه منقضی شده → /start")
 
-    # --- دستگاه ---
-    if data.startswith("rig_"):
-        user_data[user_id]["rig"] = "DB 1200" if data == "rig_DB1200" else "DBC-S15-A"
-        user_states[user_id] = STEP_ANGLE
-        return await query.edit_message_text("🔸 زاویه حفاری:")
-
-    # --- انتخاب شیفت ---
-    if data in ("shift_day", "shift_night"):
-        shift = "day" if data == "shift_day" else "night"
-        user_data[user_id]["current_shift"] = shift
-        user_states[user_id] = STEP_SHIFT_SUPERVISORS
-        return await query.edit_message_text(
-            f"🔹 نام مسئول یا مسئولین شیفت {fa_shift(shift)} را وارد کن "
-            "(اگر چند نفرند، با «،» جدا کن):"
-        )
+    return await flow.dispatch_callback(query, user_id, data)
 
-    # --- سایز حفاری ---
-    if data.startswith("size_"):
-        size = data.replace("size_", "")
-        return await set_size(query, user_id, size)
-
-    # --- پایان انتخاب گل حفاری ---
-    if data == "mud_done":
-        return await ask_water(query, user_id)
-
-    # --- انتخاب/حذف گل حفاری ---
-    if data.startswith("mud_"):
-        return await toggle_mud(query, user_id, data.replace("mud_", ""))
-
-    # --- تأیید شیفت (روز یا شب) ---
-    if data in ("shift_ok_day", "shift_ok_night"):
-        shift = "day" if data == "shift_ok_day" else "night"
-        user_data[user_id]["current_shift"] = shift
-        user_states[user_id] = STEP_NOTES
-        return await query.edit_message_text(
-            f"📝 توضیحات شیفت {fa_shift(shift)} را بنویس."
-        )
 
-    # --- ویرایش فیلدهای شیفت ---
-    if data in ("edit_start", "edit_end", "edit_water", "edit_diesel"):
-        field = data.replace("edit_", "")
-        user_data[user_id]["edit_field"] = field
-        user_states[user_id] = STEP_EDIT_FIELD
-
-        names = {
-            "start": "متراژ شروع",
-            "end": "متراژ پایان",
-            "water": "مقدار آب مصرفی (لیتر)",
-            "diesel": "مقدار گازوئیل (لیتر)",
-        }
-        shift = user_data[user_id]["current_shift"]
-        return await query.edit_message_text(
-            f"✏️ مقدار جدید {names[field]} برای شیفت {fa_shift(shift)} را وارد کن:"
-        )
+# --- دستگاه ---
+@flow.callback(prefix="rig_", to=(STEP_ANGLE,))
+async def choose_rig(query, user_id, rig):
+    store.get_data(user_id).rig = RIGS[rig]
+    store.set_step(user_id, STEP_ANGLE)
+    return await query.edit_message_text("🔸 زاویه حفاری:")
+
+
+# --- انتخاب شیفت ---
+@flow.callback("shift_day", "shift_night", to=(STEP_SHIFT_SUPERVISORS,))
+async def choose_shift(query, user_id, data):
+    shift = "day" if data == "shift_day" else "night"
+    store.get_data(user_id).current_shift = shift
+    store.set_step(user_id, STEP_SHIFT_SUPERVISORS)
+    return await query.edit_message_text(
+        f"🔹 نام مسئول یا مسئولین شیفت {fa_shift(shift)} را وارد کن "
+        "(اگر چند نفرند، با «،» جدا کن):"
+    )
+
+
+# --- پایان انتخاب گل حفاری ---
+@flow.callback("mud_done", to=(STEP_WATER,))
+async def mud_done(query, user_id, data):
+    # ویرایش معوق کیبورد نباید بعد از سؤال آب روی همین پیام بنشیند
+    await mud_edits.settle(query)
+    return await ask_water(query, user_id)
+
+
+# --- تأیید شیفت (روز یا شب) ---
+# گزارش ثبت‌شده با دکمه‌های قدیمی دوباره نهایی نمی‌شود
+@flow.callback("shift_ok_day", "shift_ok_night", skip=(STEP_DONE,),
+               to=(STEP_NOTES, STEP_SHIFT_REVIEW, STEP_ASK_NEXT_SHIFT, STEP_DONE))
+async def confirm_shift(query, user_id, data):
+    shift = "day" if data == "shift_ok_day" else "night"
+    report = store.get_data(user_id)
+    report.current_shift = shift
+    if report.shift(shift).notes:
+        # توضیحات از قبل با /bulk آمده
+        return await next_shift(query, user_id, shift)
+    store.set_step(user_id, STEP_NOTES)
+    return await query.edit_message_text(
+        f"📝 توضیحات شیفت {fa_shift(shift)} را بنویس."
+    )
+
+
+# --- ویرایش فیلدهای شیفت ---
+EDIT_FIELD_NAMES = {
+    "start": "متراژ شروع",
+    "end": "متراژ پایان",
+    "water": "مقدار آب مصرفی (لیتر)",
+    "diesel": "مقدار گازوئیل (لیتر)",
+}
+
+
+@flow.callback(*(f"edit_{field}" for field in EDIT_FIELD_NAMES), to=(STEP_EDIT_FIELD,))
+async def choose_edit_field(query, user_id, data):
+    field = data.replace("edit_", "")
+    report = store.get_data(user_id)
+    report.edit_field = field
+    store.set_step(user_id, STEP_EDIT_FIELD)
+
+    shift = report.current_shift
+    return await query.edit_message_text(
+        f"✏️ مقدار جدید {EDIT_FIELD_NAMES[field]} برای شیفت {fa_shift(shift)} را وارد کن:"
+    )
 
-    # --- بعد از توضیحات: آیا شیفت شب هم هست؟ ---
-    if data == "need_night":
-        return await ask_shift_choice(query, user_id, only_night=True)
 
-    if data == "no_more_shift":
-        return await finish_shifts_callback(query, user_id)
+# --- بعد از توضیحات: آیا شیفت شب هم هست؟ ---
+@flow.callback("need_night", skip=(STEP_DONE,), to=(STEP_CHOOSE_SHIFT,))
+async def need_night(query, user_id, data):
+    return await ask_shift_choice(query, user_id, only_night=True)
+
+
+@flow.callback("no_more_shift", skip=(STEP_DONE,), to=(STEP_DONE,))
+async def no_more_shift(query, user_id, data):
+    return await finish_shifts_callback(query, user_id)
 
 
 # ==========================
@@ -317,7 +327,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ==========================
 
 async def ask_shift_choice(update_or_query, user_id, only_night: bool = False):
-    user_states[user_id] = STEP_CHOOSE_SHIFT
+    store.set_step(user_id, STEP_CHOOSE_SHIFT)
 
     if only_night:
         buttons = [[InlineKeyboardButton("شیفت شب", callback_data="shift_night")]]
@@ -336,8 +346,9 @@ async def ask_shift_choice(update_or_query, user_id, only_night: bool = False):
 # ==========================
 
 async def ask_start_depth(update_or_query, user_id):
-    user_states[user_id] = STEP_START_DEPTH
-    shift = user_data[user_id]["current_shift"]
+    store.set_step(user_id, STEP_START_DEPTH)
+    report = store.get_data(user_id)
+    shift = report.current_shift
     return await send_msg(
         update_or_query,
         f"🔹 متراژ شروع شیفت {fa_shift(shift)}:",
@@ -345,16 +356,13 @@ async def ask_start_depth(update_or_query, user_id):
     )
 
 
-async def handle_start_depth(update, user_id, text):
-    try:
-        val = float(text.replace(",", "."))
-    except ValueError:
-        return await update.message.reply_text("⛔ مقدار نامعتبر.")
+@flow.step(STEP_START_DEPTH, parse=parse_float, error="⛔ مقدار نامعتبر.", to=(STEP_END_DEPTH,))
+async def handle_start_depth(update, user_id, val):
+    report = store.get_data(user_id)
+    shift = report.current_shift
+    report.shift(shift).start = val
 
-    shift = user_data[user_id]["current_shift"]
-    user_data[user_id]["shifts"][shift]["start"] = val
-
-    user_states[user_id] = STEP_END_DEPTH
+    store.set_step(user_id, STEP_END_DEPTH)
     return await update.message.reply_text(
         f"🔹 متراژ پایان شیفت {fa_shift(shift)}:"
     )
@@ -364,27 +372,19 @@ async def handle_start_depth(update, user_id, text):
 # متراژ پایان + رفتن به سایز
 # ==========================
 
-async def handle_end_depth(update, user_id, text):
-    try:
-        val = float(text.replace(",", "."))
-    except ValueError:
-        return await update.message.reply_text("⛔ مقدار نامعتبر.")
-
-    shift = user_data[user_id]["current_shift"]
-    start = user_data[user_id]["shifts"][shift]["start"]
+@flow.step(STEP_END_DEPTH, parse=parse_float, error="⛔ مقدار نامعتبر.", to=(STEP_SIZE,))
+async def handle_end_depth(update, user_id, val):
+    report = store.get_data(user_id)
+    shift = report.current_shift
+    start = report.shift(shift).start
     length = val - start
 
-    user_data[user_id]["shifts"][shift]["end"] = val
-    user_data[user_id]["shifts"][shift]["length"] = length
+    report.shift(shift).end = val
+    report.shift(shift).length = length
 
-    user_states[user_id] = STEP_SIZE
+    store.set_step(user_id, STEP_SIZE)
 
-    buttons = [
-        [InlineKeyboardButton("BQ", callback_data="size_BQ")],
-        [InlineKeyboardButton("NQ", callback_data="size_NQ")],
-        [InlineKeyboardButton("HQ", callback_data="size_HQ")],
-        [InlineKeyboardButton("PQ", callback_data="size_PQ")],
-    ]
+    buttons = [[InlineKeyboardButton(size, callback_data=f"size_{size}")] for size in SIZES]
 
     return await update.message.reply_text(
         f"🔹 متراژ این شیفت: {length:.2f} متر\n"
@@ -397,25 +397,26 @@ async def handle_end_depth(update, user_id, text):
 # انتخاب سایز → گل حفاری
 # ==========================
 
-async def set_size(query, user_id, size):
-    shift = user_data[user_id]["current_shift"]
-    user_data[user_id]["shifts"][shift]["size"] = size
+# کیبورد ثابت است؛ یک بار ساخته می‌شود (InlineKeyboardMarkup تغییرناپذیر است)
+MUD_MARKUP = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(label, callback_data=f"mud_{key}")] for key, label in MUD_OPTIONS.items()]
+    + [[InlineKeyboardButton("✅ اتمام انتخاب", callback_data="mud_done")]]
+)
 
-    user_states[user_id] = STEP_MUD
 
-    mud_btns = [
-        [InlineKeyboardButton("سوپرمیکس", callback_data="mud_super")],
-        [InlineKeyboardButton("CMC", callback_data="mud_cmc")],
-        [InlineKeyboardButton("خاک اره", callback_data="mud_sawdust")],
-        [InlineKeyboardButton("گازوئیل", callback_data="mud_diesel")],
-        [InlineKeyboardButton("✅ اتمام انتخاب", callback_data="mud_done")],
-    ]
+@flow.callback(prefix="size_", to=(STEP_MUD,))
+async def set_size(query, user_id, size):
+    report = store.get_data(user_id)
+    shift = report.current_shift
+    report.shift(shift).size = size
+
+    store.set_step(user_id, STEP_MUD)
 
     return await query.message.reply_text(
         "🔹 گل حفاری را انتخاب کنید (چندتایی).\n"
         "برای حذف، دوباره همان گزینه را بزنید.\n"
         "در پایان، «اتمام انتخاب» را بزنید.",
-        reply_markup=InlineKeyboardMarkup(mud_btns),
+        reply_markup=MUD_MARKUP,
     )
 
 
@@ -423,37 +424,27 @@ async def set_size(query, user_id, size):
 # انتخاب / حذف گل حفاری
 # ==========================
 
+@flow.callback(prefix="mud_")
 async def toggle_mud(query, user_id, key):
-    shift = user_data[user_id]["current_shift"]
-    lst = user_data[user_id]["shifts"][shift].setdefault("mud", [])
+    report = store.get_data(user_id)
+    shift = report.current_shift
+    lst = report.shift(shift).mud
 
-    translate = {
-        "super": "سوپرمیکس",
-        "cmc": "CMC",
-        "sawdust": "خاک اره",
-        "diesel": "گازوئیل",
-    }
-
-    val = translate[key]
+    val = MUD_OPTIONS[key]
 
     if val in lst:
         lst.remove(val)
     else:
         lst.append(val)
+    store.touch(user_id)
 
-    mud_btns = [
-        [InlineKeyboardButton("سوپرمیکس", callback_data="mud_super")],
-        [InlineKeyboardButton("CMC", callback_data="mud_cmc")],
-        [InlineKeyboardButton("خاک اره", callback_data="mud_sawdust")],
-        [InlineKeyboardButton("گازوئیل", callback_data="mud_diesel")],
-        [InlineKeyboardButton("✅ اتمام انتخاب", callback_data="mud_done")],
-    ]
-
-    return await query.edit_message_text(
+    # چند ضربه‌ی سریع → یک ویرایش با وضعیت نهایی (بدون انتظار برای Bot API)
+    mud_edits.edit(
+        query,
         f"🔹 انتخاب فعلی: { ' + '.join(lst) if lst else 'هیچ'}\n"
         "برای حذف، دوباره روی همان گزینه بزن.\n"
         "در پایان، «اتمام انتخاب» را بزن.",
-        reply_markup=InlineKeyboardMarkup(mud_btns),
+        reply_markup=MUD_MARKUP,
     )
 
 
@@ -462,24 +453,22 @@ async def toggle_mud(query, user_id, key):
 # ==========================
 
 async def ask_water(query, user_id):
-    user_states[user_id] = STEP_WATER
-    shift = user_data[user_id]["current_shift"]
+    store.set_step(user_id, STEP_WATER)
+    report = store.get_data(user_id)
+    shift = report.current_shift
 
     return await query.edit_message_text(
         f"🔹 مقدار آب مصرفی شیفت {fa_shift(shift)} (لیتر):"
     )
 
 
-async def handle_water(update, user_id, text):
-    try:
-        val = float(text.replace(",", "."))
-    except ValueError:
-        return await update.message.reply_text("⛔ مقدار آب نامعتبر.")
-
-    shift = user_data[user_id]["current_shift"]
-    user_data[user_id]["shifts"][shift]["water"] = val
+@flow.step(STEP_WATER, parse=parse_float, error="⛔ مقدار آب نامعتبر.", to=(STEP_DIESEL,))
+async def handle_water(update, user_id, val):
+    report = store.get_data(user_id)
+    shift = report.current_shift
+    report.shift(shift).water = val
 
-    user_states[user_id] = STEP_DIESEL
+    store.set_step(user_id, STEP_DIESEL)
     return await update.message.reply_text(
         f"🔹 مقدار گازوئیل شیفت {fa_shift(shift)} (لیتر):"
     )
@@ -489,41 +478,39 @@ async def handle_water(update, user_id, text):
 # گازوئیل → خلاصه و امکان ویرایش
 # ==========================
 
-async def handle_diesel(update, user_id, text):
-    try:
-        val = float(text.replace(",", "."))
-    except ValueError:
-        return await update.message.reply_text("⛔ مقدار گازوئیل نامعتبر.")
-
-    shift = user_data[user_id]["current_shift"]
-    user_data[user_id]["shifts"][shift]["diesel"] = val
+@flow.step(STEP_DIESEL, parse=parse_float, error="⛔ مقدار گازوئیل نامعتبر.", to=(STEP_SHIFT_REVIEW,))
+async def handle_diesel(update, user_id, val):
+    report = store.get_data(user_id)
+    shift = report.current_shift
+    report.shift(shift).diesel = val
 
     # بعد از کامل شدن داده‌ها، خلاصه شیفت و دکمه‌های ویرایش
     return await ask_shift_review(update, user_id)
 
 
 async def ask_shift_review(update_or_query, user_id):
-    shift = user_data[user_id]["current_shift"]
-    sh = user_data[user_id]["shifts"][shift]
-    user_states[user_id] = STEP_SHIFT_REVIEW
+    report = store.get_data(user_id)
+    shift = report.current_shift
+    sh = report.shift(shift)
+    store.set_step(user_id, STEP_SHIFT_REVIEW)
 
-    sup = "، ".join(sh["supervisors"]) if sh["supervisors"] else "-"
-    helpers = "، ".join(sh["helpers"]) if sh["helpers"] else "-"
-    bosses = "، ".join(sh["workshop_bosses"]) if sh["workshop_bosses"] else "-"
-    mud = " + ".join(sh["mud"]) if sh["mud"] else "-"
+    sup = "، ".join(sh.supervisors) if sh.supervisors else "-"
+    helpers = "، ".join(sh.helpers) if sh.helpers else "-"
+    bosses = "، ".join(sh.workshop_bosses) if sh.workshop_bosses else "-"
+    mud = " + ".join(sh.mud) if sh.mud else "-"
 
     msg = (
         f"🔍 خلاصه شیفت {fa_shift(shift)}:\n"
         f"• مسئول(ین) شیفت: {sup}\n"
         f"• پرسنل کمکی: {helpers}\n"
         f"• سرپرست کارگاه: {bosses}\n"
-        f"• متراژ شروع: {sh['start']} متر\n"
-        f"• متراژ پایان: {sh['end']} متر\n"
-        f"• متراژ شیفت: {sh['length']:.2f} متر\n"
-        f"• سایز حفاری: {sh['size']}\n"
+        f"• متراژ شروع: {sh.start} متر\n"
+        f"• متراژ پایان: {sh.end} متر\n"
+        f"• متراژ شیفت: {sh.length:.2f} متر\n"
+        f"• سایز حفاری: {sh.size}\n"
         f"• گل حفاری: {mud}\n"
-        f"• آب مصرفی: {sh['water']} لیتر\n"
-        f"• گازوئیل: {sh['diesel']} لیتر\n\n"
+        f"• آب مصرفی: {sh.water} لیتر\n"
+        f"• گازوئیل: {sh.diesel} لیتر\n\n"
         "اگر موردی اشتباه است، گزینه ویرایش را بزن."
     )
 
@@ -552,30 +539,28 @@ async def ask_shift_review(update_or_query, user_id):
 # ویرایش فیلدهای شیفت
 # ==========================
 
-async def handle_edit_field(update: Update, user_id: int, text: str):
-    field = user_data[user_id].get("edit_field")
-    shift = user_data[user_id]["current_shift"]
-    sh = user_data[user_id]["shifts"][shift]
-
-    try:
-        val = float(text.replace(",", "."))
-    except ValueError:
-        return await update.message.reply_text("⛔ مقدار عددی نامعتبر است. دوباره وارد کن.")
+@flow.step(STEP_EDIT_FIELD, parse=parse_float, error="⛔ مقدار عددی نامعتبر است. دوباره وارد کن.", to=(STEP_SHIFT_REVIEW,))
+async def handle_edit_field(update: Update, user_id: int, val: float):
+    report = store.get_data(user_id)
+    field = report.edit_field
+    shift = report.current_shift
+    sh = report.shift(shift)
+    pdfs.invalidate_user(user_id)
 
     if field == "start":
-        sh["start"] = val
-        if sh["end"] is not None:
-            sh["length"] = sh["end"] - sh["start"]
+        sh.start = val
+        if sh.end is not None:
+            sh.length = sh.end - sh.start
     elif field == "end":
-        sh["end"] = val
-        if sh["start"] is not None:
-            sh["length"] = sh["end"] - sh["start"]
+        sh.end = val
+        if sh.start is not None:
+            sh.length = sh.end - sh.start
     elif field == "water":
-        sh["water"] = val
+        sh.water = val
     elif field == "diesel":
-        sh["diesel"] = val
+        sh.diesel = val
 
-    user_states[user_id] = STEP_SHIFT_REVIEW
+    store.set_step(user_id, STEP_SHIFT_REVIEW)
     return await ask_shift_review(update, user_id)
 
 
@@ -583,26 +568,36 @@ async def handle_edit_field(update: Update, user_id: int, text: str):
 # توضیحات هر شیفت
 # ==========================
 
+@flow.step(STEP_NOTES, to=(STEP_ASK_NEXT_SHIFT, STEP_SHIFT_REVIEW, STEP_DONE))
 async def handle_notes(update: Update, user_id: int, text: str):
-    shift = user_data[user_id]["current_shift"]
-    user_data[user_id]["shifts"][shift]["notes"] = text
+    report = store.get_data(user_id)
+    shift = report.current_shift
+    report.shift(shift).notes = text
+    return await next_shift(update, user_id, shift)
+
+
+async def next_shift(update_or_query, user_id: int, shift: str):
+    report = store.get_data(user_id)
+
+    # شیفت شب از قبل پر است (ورود یکجا) → مستقیم خلاصه‌ی آن
+    if shift == "day" and report.night.start is not None:
+        report.current_shift = "night"
+        return await ask_shift_review(update_or_query, user_id)
 
     # اگر شیفت روز است → بپرس آیا شیفت شب هم هست؟
     if shift == "day":
-        user_states[user_id] = STEP_ASK_NEXT_SHIFT
+        store.set_step(user_id, STEP_ASK_NEXT_SHIFT)
         buttons = [
             [InlineKeyboardButton("بله، شیفت شب داریم", callback_data="need_night")],
             [InlineKeyboardButton("خیر، فقط همین شیفت", callback_data="no_more_shift")],
         ]
         markup = InlineKeyboardMarkup(buttons)
-        return await update.message.reply_text(
-            "آیا شیفت شب هم باید ثبت شود؟",
-            reply_markup=markup,
-        )
+        return await send_msg(update_or_query, "آیا شیفت شب هم باید ثبت شود؟", markup)
 
     # اگر شیفت شب است → مستقیم جمع‌بندی نهایی
-    if shift == "night":
-        return await finish_shifts_text(update, user_id)
+    if isinstance(update_or_query, CallbackQuery):
+        return await finish_shifts_callback(update_or_query, user_id)
+    return await finish_shifts_text(update_or_query, user_id)
 
 
 # ==========================
@@ -610,11 +605,11 @@ async def handle_notes(update: Update, user_id: int, text: str):
 # ==========================
 
 def build_shifts_summary(user_id: int) -> str:
-    d = user_data[user_id]["shifts"]
+    d = store.get_data(user_id)
 
-    total_len = (d["day"]["length"] or 0) + (d["night"]["length"] or 0)
-    total_water = (d["day"]["water"] or 0) + (d["night"]["water"] or 0)
-    total_diesel = (d["day"]["diesel"] or 0) + (d["night"]["diesel"] or 0)
+    total_len = (d.day.length or 0) + (d.night.length or 0)
+    total_water = (d.day.water or 0) + (d.night.water or 0)
+    total_diesel = (d.day.diesel or 0) + (d.night.diesel or 0)
 
     msg = (
         "🔰 **جمع‌بندی شیفت‌ها:**\n"
@@ -626,49 +621,49 @@ def build_shifts_summary(user_id: int) -> str:
 
 
 def build_full_preview(user_id: int) -> str:
-    d = user_data[user_id]
-    s = d["shifts"]
+    d = store.get_data(user_id)
 
     lines = []
     lines.append("🧾 پیش‌نمایش گزارش روزانه")
     lines.append("────────────────────")
-    lines.append(f"منطقه: {d['region']}")
-    lines.append(f"شماره گمانه: {d['borehole']}")
-    lines.append(f"دستگاه حفاری: {d['rig']}")
-    lines.append(f"زاویه: {d['angle_deg']} درجه")
-    lines.append(f"تاریخ: {d['date']}")
+    lines.append(f"منطقه: {d.region}")
+    lines.append(f"شماره گمانه: {d.borehole}")
+    lines.append(f"دستگاه حفاری: {d.rig}")
+    lines.append(f"زاویه: {d.angle_deg} درجه")
+    lines.append(f"تاریخ: {d.date}")
     lines.append("")
 
     for key in ("day", "night"):
-        sh = s[key]
-        if sh["start"] is None:
+        sh = d.shift(key)
+        if sh.start is None:
             continue
 
         lines.append(f"─── شیفت {fa_shift(key)} ───")
-        sup = "، ".join(sh["supervisors"]) if sh["supervisors"] else "-"
-        helpers = "، ".join(sh["helpers"]) if sh["helpers"] else "-"
-        bosses = "، ".join(sh["workshop_bosses"]) if sh["workshop_bosses"] else "-"
-        mud = " + ".join(sh["mud"]) if sh["mud"] else "-"
+        sup = "، ".join(sh.supervisors) if sh.supervisors else "-"
+        helpers = "، ".join(sh.helpers) if sh.helpers else "-"
+        bosses = "، ".join(sh.workshop_bosses) if sh.workshop_bosses else "-"
+        mud = " + ".join(sh.mud) if sh.mud else "-"
 
         lines.append(f"مسئول(ین) شیفت: {sup}")
         lines.append(f"پرسنل کمکی: {helpers}")
         lines.append(f"سرپرست کارگاه: {bosses}")
-        lines.append(f"متراژ شروع: {sh['start']} متر")
-        lines.append(f"متراژ پایان: {sh['end']} متر")
-        lines.append(f"متراژ شیفت: {sh['length']:.2f} متر")
-        lines.append(f"سایز حفاری: {sh['size']}")
+        lines.append(f"متراژ شروع: {sh.start} متر")
+        lines.append(f"متراژ پایان: {sh.end} متر")
+        lines.append(f"متراژ شیفت: {sh.length:.2f} متر")
+        lines.append(f"سایز حفاری: {sh.size}")
         lines.append(f"گل حفاری: {mud}")
-        lines.append(f"آب مصرفی: {sh['water']} لیتر")
-        lines.append(f"گازوئیل: {sh['diesel']} لیتر")
+        lines.append(f"آب مصرفی: {sh.water} لیتر")
+        lines.append(f"گازوئیل: {sh.diesel} لیتر")
         lines.append(f"توضیحات شیفت {fa_shift(key)}:")
-        lines.append(sh["notes"] or "-")
+        lines.append(sh.notes or "-")
         lines.append("")
 
     return "\n".join(lines)
 
 
 async def finish_shifts_callback(query, user_id):
-    user_states[user_id] = STEP_DONE
+    store.set_step(user_id, STEP_DONE)
+    archive_report(user_id)
     summary = build_shifts_summary(user_id)
     preview = build_full_preview(user_id)
 
@@ -681,7 +676,8 @@ async def finish_shifts_callback(query, user_id):
 
 
 async def finish_shifts_text(update, user_id):
-    user_states[user_id] = STEP_DONE
+    store.set_step(user_id, STEP_DONE)
+    archive_report(user_id)
     summary = build_shifts_summary(user_id)
     preview = build_full_preview(user_id)
 
@@ -693,6 +689,200 @@ async def finish_shifts_text(update, user_id):
     )
 
 
+def archive_report(user_id: int):
+    try:
+        # اولین بار ردیف تازه؛ اگر همین گزارش قبلاً ثبت شده (archive_id دارد) همان ردیف به‌روز می‌شود
+        reports.add(user_id, store.get_data(user_id))
+        store.touch(user_id)
+    except sqlite3.Error:
+        # گزارش در جلسه می‌ماند و /pdf کار می‌کند؛ فقط در تاریخچه نمی‌آید
+        logger.exception("archiving report of user %s failed", user_id)
+
+
+# ==========================
+# ورود یکجا: /bulk <متن> یا فایل CSV/JSON
+# ==========================
+
+async def bulk_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # متن بعد از /bulk با همان خط‌بندی (context.args خط‌ها را به هم می‌چسباند)
+    parts = (update.message.text or "").split(None, 1)
+    if len(parts) < 2:
+        return await update.message.reply_text(bulk_entry.TEMPLATE)
+    return await start_bulk(update, bulk_entry.parse_text, parts[1])
+
+
+async def bulk_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    doc = update.message.document
+    if doc.file_size and doc.file_size > bulk_entry.MAX_BYTES:
+        return await update.message.reply_text(
+            f"⛔ فایل بزرگ‌تر از {bulk_entry.MAX_BYTES // 1024} کیلوبایت است."
+        )
+    file = await doc.get_file()
+    data = bytes(await file.download_as_bytearray())
+    return await start_bulk(update, bulk_entry.parse_file, data, doc.file_name)
+
+
+async def start_bulk(update: Update, parse, *args):
+    """گزارش کامل در یک دور: اعتبارسنجی، جایگزینی جلسه و رفتن به خلاصه‌ی شیفت."""
+    user_id = update.effective_user.id
+    try:
+        report = parse(*args)
+    except bulk_entry.BulkError as e:
+        return await update.message.reply_text(
+            "⛔ گزارش ثبت نشد:\n" + "\n".join(f"• {err}" for err in e.errors)
+        )
+
+    store.set_data(user_id, report)
+    await update.message.reply_text(header_summary(report))
+    return await ask_shift_review(update, user_id)
+
+
+# ==========================
+# تاریخچه: /history [borehole|rig|region|date] <مقدار> [limit=N | -n N]
+# ==========================
+
+HISTORY_FIELD_NAMES = {
+    "borehole": "گمانه",
+    "rig": "دستگاه",
+    "region": "منطقه",
+    "date": "تاریخ",
+}
+
+
+def _take_limit(args):
+    """limit=N یا -n N (یا --limit N) هر جای آرگومان‌ها؛ (limit یا None, باقی آرگومان‌ها)."""
+    limit, rest = None, []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg.lower().startswith("limit=") and arg[6:].isdigit():
+            limit = int(arg[6:])
+        elif arg.lower() in ("-n", "--limit") and i + 1 < len(args) and args[i + 1].isdigit():
+            limit = int(args[i + 1])
+            i += 1
+        else:
+            rest.append(arg)
+        i += 1
+    return limit, rest
+
+
+def _valid_history_value(field: str, value: str) -> bool:
+    """مقدار بدون عدد آخر هنوز یک مقدار کامل است؟ فقط برای دستگاه و تاریخ قابل تشخیص است."""
+    if field == "rig":
+        return value in RIGS.values()
+    if field == "date":
+        return archive.date_key(value) is not None
+    # گمانه و منطقه متن آزادند («BH 12»)؛ عدد آخر جزو مقدار می‌ماند
+    return False
+
+
+def parse_history_args(args):
+    """
+    (field, value, limit)؛ بدون نام فیلد، جستجو روی شماره گمانه است.
+    تعداد فقط با limit=N یا -n N خوانده می‌شود، یا وقتی عدد آخر را که برداریم
+    باقی هنوز مقدار معتبری است (/history rig DB 1200 10).
+    """
+    limit, args = _take_limit(list(args))
+    field = "borehole"
+    if args and args[0].lower() in archive.FIELDS:
+        field = args.pop(0).lower()
+
+    if limit is None and len(args) > 1 and args[-1].isdigit():
+        if _valid_history_value(field, " ".join(args[:-1])):
+            limit = int(args.pop())
+
+    return field, " ".join(args), archive.HISTORY_LIMIT if limit is None else limit
+
+
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    field, value, limit = parse_history_args(context.args or [])
+    if not value:
+        return await update.message.reply_text(
+            "مثال‌ها:\n"
+            "/history BH-12\n"
+            "/history BH-12 limit=10\n"
+            "/history rig DB 1200 -n 10\n"
+            "/history region سنگان\n"
+            "/history date 05/07/1403"
+        )
+
+    rows = reports.query(field, value, limit)
+    if not rows:
+        return await update.message.reply_text(
+            f"گزارشی برای {HISTORY_FIELD_NAMES[field]} «{value}» پیدا نشد."
+        )
+
+    lines = [f"🗂 آخرین گزارش‌های {HISTORY_FIELD_NAMES[field]} «{value}»:"]
+    for r in rows:
+        lines.append(f"• {r.date} | {r.region} | {r.borehole} | {r.rig} | {r.meters:.2f} متر")
+    return await update.message.reply_text("\n".join(lines))
+
+
+# ==========================
+# آمار: /stats [borehole|rig] <مقدار>
+# ==========================
+
+def format_rollup(title: str, r) -> str:
+    lines = [
+        title,
+        f"• مجموع متراژ: {r.meters:.2f} متر",
+        f"• تعداد شیفت: {r.shifts}",
+        f"• متراژ هر شیفت: {r.meters_per_shift:.2f} متر",
+        f"• آب به ازای هر متر: {r.water_per_meter:.1f} لیتر",
+        f"• گازوئیل به ازای هر متر: {r.diesel_per_meter:.2f} لیتر",
+    ]
+    if r.mud:
+        usage = sorted(r.mud.items(), key=lambda item: -item[1])
+        lines.append("• گل حفاری: " + "، ".join(
+            f"{name} {100 * n / r.shifts:.0f}٪" for name, n in usage
+        ))
+    return "\n".join(lines)
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = list(context.args or [])
+    scope = "borehole"
+    if args and args[0].lower() in kpi.SCOPES:
+        scope = args.pop(0).lower()
+    key = " ".join(args)
+
+    # بدون آرگومان: خلاصه‌ی ناوگان، یک خط برای هر دستگاه
+    if not key:
+        rigs = reports.fleet("rig")
+        if not rigs:
+            return await update.message.reply_text("هنوز هیچ گزارشی در آرشیو نیست.")
+        meters = sum(r.meters for r in rigs)
+        shifts = sum(r.shifts for r in rigs)
+        lines = [f"📊 ناوگان: {meters:.2f} متر در {shifts} شیفت"]
+        for r in rigs:
+            lines.append(
+                f"• {r.key}: {r.meters:.2f} متر، {r.meters_per_shift:.2f} متر/شیفت، "
+                f"آب {r.water_per_meter:.1f} و گازوئیل {r.diesel_per_meter:.2f} لیتر/متر"
+            )
+        return await update.message.reply_text("\n".join(lines))
+
+    r = reports.stats(scope, key)
+    if r is None:
+        return await update.message.reply_text(
+            f"آماری برای {HISTORY_FIELD_NAMES[scope]} «{key}» نیست."
+        )
+    return await update.message.reply_text(
+        format_rollup(f"📊 آمار {HISTORY_FIELD_NAMES[scope]} «{r.key}»:", r)
+    )
+
+
+# ==========================
+# پاک‌سازی جلسه‌های بیکار
+# ==========================
+
+async def sweep_sessions(context: ContextTypes.DEFAULT_TYPE):
+    """کار دوره‌ای JobQueue: جلسه‌هایی که SESSION_TTL دست نخورده‌اند از حافظه بیرون می‌روند."""
+    evicted = store.evict_idle(session_store.SESSION_TTL)
+    if evicted:
+        pdfs.forget_users(evicted)
+        logger.info("evicted %d idle sessions", len(evicted))
+
+
 # ==========================
 # ابزارها
 # ==========================
@@ -701,11 +891,6 @@ def fa_shift(key: str) -> str:
     return "روز" if key == "day" else "شب"
 
 
-def split_names(raw: str):
-    parts = [p.strip() for p in raw.replace("،", ",").split(",")]
-    return [p for p in parts if p]
-
-
 async def send_msg(update_or_query, text: str, markup=None):
     try:
         return await update_or_query.message.reply_text(text, reply_markup=markup)
@@ -0,0 +1,379 @@
+# bulk_entry.py
+#
+# ورود یکجای گزارش: کل گزارش در یک پیام (/bulk) یا یک فایل CSV/JSON، به‌جای
+# حدود بیست پیام رفت‌وبرگشت. همه‌ی فیلدها در یک دور بررسی و همه‌ی خطاها با هم
+# گزارش می‌شوند؛ نتیجه همان Report ای است که فلوی مرحله‌به‌مرحله می‌سازد.
+#
+#   متن:  خط‌های «کلید: مقدار»؛ خطی مثل [روز] یا «شیفت شب» شیفت را عوض می‌کند
+#   JSON: همان شکل Report.to_dict، یا کلیدهای متن با شیء "day"/"night"
+#   CSV:  دو ستونی (کلید، مقدار) مثل متن، یا جدولی با یک سطر برای هر شیفت
+
+import csv
+import io
+import json
+import os
+import re
+
+from fsm import InvalidInput, parse_digits, parse_float, split_names
+from models import MUD_OPTIONS, RIGS, SHIFT_KEYS, SIZES, Report
+
+# -------------------------------
+# تنظیمات (از متغیرهای محیطی)
+# -------------------------------
+
+MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", str(64 * 1024)))   # سقف حجم فایل آپلودی
+
+# فیلد → (برچسب فارسی، نام‌های دیگر). کلیدها بدون حساسیت به حروف و پرانتز مقایسه می‌شوند
+HEADER_FIELDS = {
+    "region": ("منطقه", "region"),
+    "borehole": ("گمانه", "شماره گمانه", "borehole"),
+    "rig": ("دستگاه", "دستگاه حفاری", "rig"),
+    "angle_deg": ("زاویه", "angle", "angle_deg"),
+    "date": ("تاریخ", "date"),
+}
+SHIFT_FIELDS = {
+    "supervisors": ("مسئول", "مسئولین", "مسئول شیفت", "مسئولین شیفت", "supervisors"),
+    "helpers": ("کمکی", "پرسنل کمکی", "helpers"),
+    "workshop_bosses": ("سرپرست", "سرپرست کارگاه", "workshop", "workshop_bosses"),
+    "start": ("شروع", "متراژ شروع", "start"),
+    "end": ("پایان", "متراژ پایان", "end"),
+    "size": ("سایز", "سایز حفاری", "size"),
+    "mud": ("گل", "گل حفاری", "mud"),
+    "water": ("آب", "آب مصرفی", "water"),
+    "diesel": ("گازوئیل", "diesel"),
+    "notes": ("توضیحات", "notes"),
+}
+REQUIRED_SHIFT_FIELDS = ("start", "end", "size", "water", "diesel")
+
+# کلیدهایی که از خروجی خود ربات (Report.to_dict یا پیش‌نمایش) می‌آیند و محاسبه‌شده‌اند
+IGNORED_KEYS = ("length", "متراژ شیفت", "current_shift", "edit_field", "archive_id")
+
+SHIFT_NAMES = {"روز": "day", "day": "day", "شب": "night", "night": "night"}
+FA_SHIFT = {"day": "روز", "night": "شب"}
+
+TEMPLATE = (
+    "📋 کل گزارش را در یک پیام بفرست (یا فایل CSV/JSON آپلود کن):\n\n"
+    "/bulk\n"
+    "منطقه: سنگان\n"
+    "گمانه: BH-12\n"
+    "دستگاه: DB 1200\n"
+    "زاویه: 60\n"
+    "تاریخ: 1403/07/05\n"
+    "[روز]\n"
+    "مسئول: علی، رضا\n"
+    "کمکی: حسن\n"
+    "سرپرست: مهدی\n"
+    "شروع: 120.5\n"
+    "پایان: 134\n"
+    "سایز: NQ\n"
+    "گل: سوپرمیکس + CMC\n"
+    "آب: 3500\n"
+    "گازوئیل: 180\n"
+    "توضیحات: ...\n"
+    "[شب]\n"
+    "...\n\n"
+    f"دستگاه: {' یا '.join(RIGS.values())}\n"
+    f"سایز: {' / '.join(SIZES)}\n"
+    f"گل: {' + '.join(MUD_OPTIONS.values())}\n"
+    "شیفت شب اختیاری است؛ اسم‌ها، گل و توضیحات را می‌شود خالی گذاشت."
+)
+
+
+class BulkError(ValueError):
+    """گزارش یکجا رد شد؛ errors همه‌ی خطاها را به ترتیب دارد."""
+
+    def __init__(self, errors):
+        super().__init__("\n".join(errors))
+        self.errors = list(errors)
+
+
+def _norm(key: str) -> str:
+    key = re.sub(r"\(.*?\)", " ", str(key))
+    key = key.replace("_", " ").replace("ي", "ی").replace("ك", "ک")
+    return " ".join(key.lower().split())
+
+
+def _compact(value: str) -> str:
+    return re.sub(r"[^0-9a-z]", "", value.lower())
+
+
+_KEYS = {}
+for _section, _fields in (("header", HEADER_FIELDS), ("shift", SHIFT_FIELDS)):
+    for _field, _aliases in _fields.items():
+        for _alias in _aliases:
+            _KEYS[_norm(_alias)] = (_section, _field)
+_IGNORED = {_norm(key) for key in IGNORED_KEYS}
+_LABELS = {field: aliases[0] for field, aliases in {**HEADER_FIELDS, **SHIFT_FIELDS}.items()}
+
+_RIG_NAMES = {_compact(key): name for key, name in RIGS.items()}
+_RIG_NAMES.update({_compact(name): name for name in RIGS.values()})
+_MUD_NAMES = {_norm(key): label for key, label in MUD_OPTIONS.items()}
+_MUD_NAMES.update({_norm(label): label for label in MUD_OPTIONS.values()})
+
+
+def shift_name(text: str) -> str | None:
+    """«[روز]»، «شیفت شب»، «night» → کلید شیفت؛ در غیر این صورت None."""
+    words = [w for w in _norm(str(text).strip("[]-─=*#: ")).split() if w not in ("شیفت", "shift")]
+    return SHIFT_NAMES.get(" ".join(words))
+
+
+def _text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return "، ".join(t for t in (_text(v) for v in value) if t)
+    return str(value).strip()
+
+
+# ==========================
+# تبدیل مقدارها (همان قواعد فلو)
+# ==========================
+
+def parse_rig(value: str) -> str:
+    name = _RIG_NAMES.get(_compact(value))
+    if name is None and _compact(value).startswith("dbc"):
+        name = RIGS["DBC"]
+    if name is None:
+        raise InvalidInput(value)
+    return name
+
+
+def parse_date(value: str) -> str:
+    """1403/07/05 یا 05/07/1403 → «05/07/1403» (همان قالب handle_day)."""
+    parts = [p for p in re.split(r"[/\-.\s]+", value.strip()) if p]
+    if len(parts) != 3:
+        raise InvalidInput(value)
+    a, b, c = (parse_digits(p) for p in parts)
+    if len(parts[0]) == 4:
+        year, month, day = a, b, c
+    elif len(parts[2]) == 4:
+        day, month, year = a, b, c
+    else:
+        raise InvalidInput(value)
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        raise InvalidInput(value)
+    return f"{day:02d}/{month:02d}/{year}"
+
+
+def parse_size(value: str) -> str:
+    size = value.strip().upper()
+    if size not in SIZES:
+        raise InvalidInput(value)
+    return size
+
+
+def parse_mud(value: str) -> list:
+    if value.strip() in ("-", "هیچ"):
+        return []
+    mud, unknown = [], []
+    for token in re.split(r"[+،,]", value):
+        token = token.strip()
+        if not token:
+            continue
+        name = _MUD_NAMES.get(_norm(token))
+        if name is None:
+            unknown.append(token)
+        elif name not in mud:
+            mud.append(name)
+    if unknown:
+        raise InvalidInput("، ".join(unknown))
+    return mud
+
+
+# ==========================
+# جمع‌آوری و اعتبارسنجی
+# ==========================
+
+class _Collector:
+    def __init__(self):
+        self.header = {}
+        self.shifts = {key: {} for key in SHIFT_KEYS}
+        self.errors = []
+
+    def put(self, key, value, shift: str = "day", where: str = ""):
+        norm = _norm(key)
+        target = _KEYS.get(norm)
+        if target is None:
+            if norm not in _IGNORED:
+                self.errors.append(f"{where}کلید ناشناخته «{key}»")
+            return
+        value = _text(value)
+        if not value:
+            return
+        section, field = target
+        (self.header if section == "header" else self.shifts[shift])[field] = value
+
+    def put_shift(self, name, fields, where: str = ""):
+        shift = shift_name(name)
+        if shift is None or not isinstance(fields, dict):
+            self.errors.append(f"{where}شیفت ناشناخته «{name}»")
+            return
+        for key, value in fields.items():
+            self.put(key, value, shift, where)
+
+    def _convert(self, prefix: str, field: str, raw: str, parse):
+        try:
+            return parse(raw)
+        except InvalidInput:
+            self.errors.append(f"{prefix}{_LABELS[field]} نامعتبر است: «{raw}»")
+            return None
+
+    def build(self) -> Report:
+        report = Report()
+        h = self.header
+
+        for field, parse in (("region", str), ("borehole", str), ("rig", parse_rig),
+                             ("angle_deg", parse_float), ("date", parse_date)):
+            if field not in h:
+                self.errors.append(f"{_LABELS[field]} وارد نشده")
+            else:
+                setattr(report, field, self._convert("", field, h[field], parse))
+
+        filled = [key for key in SHIFT_KEYS if self.shifts[key]]
+        if not filled:
+            self.errors.append("هیچ شیفتی وارد نشده")
+        for key in filled:
+            self._build_shift(report, key, self.shifts[key])
+
+        if self.errors:
+            raise BulkError(self.errors)
+        report.current_shift = filled[0]
+        return report
+
+    def _build_shift(self, report: Report, key: str, fields: dict):
+        prefix = f"شیفت {FA_SHIFT[key]}: "
+        sh = report.shift(key)
+        for field in REQUIRED_SHIFT_FIELDS:
+            if field not in fields:
+                self.errors.append(f"{prefix}{_LABELS[field]} وارد نشده")
+
+        sh.supervisors = split_names(fields.get("supervisors", ""))
+        sh.helpers = split_names(fields.get("helpers", ""))
+        sh.workshop_bosses = split_names(fields.get("workshop_bosses", ""))
+        for field in ("start", "end", "water", "diesel"):
+            if field in fields:
+                setattr(sh, field, self._convert(prefix, field, fields[field], parse_float))
+        if "size" in fields:
+            sh.size = self._convert(prefix, "size", fields["size"], parse_size)
+        if "mud" in fields:
+            sh.mud = self._convert(prefix, "mud", fields["mud"], parse_mud) or []
+        sh.notes = fields.get("notes", "")
+
+        if sh.start is not None and sh.end is not None:
+            sh.length = sh.end - sh.start
+            if sh.length < 0:
+                self.errors.append(f"{prefix}متراژ پایان ({sh.end}) از شروع ({sh.start}) کمتر است")
+
+
+# ==========================
+# قالب‌های ورودی
+# ==========================
+
+def parse_text(text: str) -> Report:
+    """متن پیام /bulk؛ متنی که با { شروع شود JSON خوانده می‌شود."""
+    if text.lstrip().startswith("{"):
+        return parse_json(text)
+
+    c = _Collector()
+    shift = "day"
+    for n, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        key, sep, value = line.partition(":")
+        if not value.strip() and shift_name(key):     # «[روز]» یا «شیفت شب:»
+            shift = shift_name(key)
+            continue
+        if not sep:
+            c.errors.append(f"خط {n}: «{line}» به شکل «کلید: مقدار» نیست")
+            continue
+        c.put(key, value, shift, f"خط {n}: ")
+    return c.build()
+
+
+def parse_json(text: str) -> Report:
+    try:
+        obj = json.loads(text)
+    except ValueError as e:
+        raise BulkError([f"JSON نامعتبر: {e}"]) from None
+    if not isinstance(obj, dict):
+        raise BulkError(["JSON باید یک شیء {...} باشد"])
+
+    c = _Collector()
+    for key, value in obj.items():
+        if isinstance(value, dict) and _norm(key) == "shifts":
+            for name, fields in value.items():
+                c.put_shift(name, fields)
+        elif isinstance(value, dict):
+            c.put_shift(key, value)
+        else:
+            c.put(key, value)
+    return c.build()
+
+
+def parse_csv(text: str) -> Report:
+    rows = [[cell.strip() for cell in row] for row in csv.reader(io.StringIO(text))]
+    if not any(any(row) for row in rows):
+        raise BulkError(["فایل CSV خالی است"])
+
+    head = rows[0]
+    known = [cell for cell in head if _norm(cell) in _KEYS or _norm(cell) in ("shift", "شیفت")]
+    if len(known) < 2:
+        # دو ستونی: هر سطر «کلید، مقدار»؛ سطر تک‌خانه‌ای با نام شیفت، شیفت را عوض
+        # می‌کند و سطر تک‌خانه‌ای «کلید: مقدار» (متن /bulk که با پسوند csv ذخیره
+        # شده) همان‌طور مثل خط متن خوانده می‌شود
+        lines = []
+        for row in rows:
+            rest = [cell for cell in row[1:] if cell]
+            if not row or (not rest and (shift_name(row[0]) or ":" in row[0])):
+                lines.append(row[0] if row else "")
+            else:
+                lines.append(f"{row[0]}: {', '.join(rest)}")
+        return parse_text("\n".join(lines))
+
+    # جدولی: سطر اول نام ستون‌ها، هر سطر بعدی یک شیفت (به ترتیب روز و شب اگر ستون شیفت نباشد)
+    c = _Collector()
+    shift_col = next((i for i, cell in enumerate(head) if _norm(cell) in ("shift", "شیفت")), None)
+    columns = []
+    for i, cell in enumerate(head):
+        if i == shift_col or not cell:
+            continue
+        if _norm(cell) in _KEYS:
+            columns.append((i, cell))
+        elif _norm(cell) not in _IGNORED:
+            c.errors.append(f"ستون ناشناخته «{cell}»")
+
+    data = [(n, row) for n, row in enumerate(rows[1:], 2) if any(row)]
+    if len(data) > len(SHIFT_KEYS):
+        c.errors.append(f"حداکثر {len(SHIFT_KEYS)} سطر (روز و شب) مجاز است")
+    for order, (n, row) in enumerate(data[:len(SHIFT_KEYS)]):
+        shift = SHIFT_KEYS[order]
+        if shift_col is not None and shift_col < len(row) and row[shift_col]:
+            shift = shift_name(row[shift_col])
+            if shift is None:
+                c.errors.append(f"سطر {n}: شیفت ناشناخته «{row[shift_col]}»")
+                continue
+        for i, cell in columns:
+            if i < len(row):
+                c.put(cell, row[i], shift, f"سطر {n}: ")
+    return c.build()
+
+
+def _decode(data: bytes) -> str:
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        # CSVهای Excel فارسی ویندوز
+        return data.decode("cp1256", errors="replace")
+
+
+def parse_file(data: bytes, filename: str) -> Report:
+    if len(data) > MAX_BYTES:
+        raise BulkError([f"فایل بزرگ‌تر از {MAX_BYTES // 1024} کیلوبایت است"])
+    text = _decode(data)
+    name = (filename or "").lower()
+    if name.endswith(".json"):
+        return parse_json(text)
+    if name.endswith(".csv"):
+        return parse_csv(text)
+    raise BulkError(["فقط فایل CSV یا JSON پذیرفته می‌شود"])
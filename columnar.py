@@ -0,0 +1,413 @@
+# columnar.py
+#
+# آرشیو ستونی شیفت‌ها برای نگه‌داری چندساله و تحلیل.
+#
+# هر شیفت یک ردیف است. ستون‌های عددی آرایه‌ی typed (float64، خالی = NaN)،
+# متن‌های تکراری (منطقه، گمانه، دستگاه، سایز، نام‌ها، گل) dictionary-encoded
+# و توضیحات به شکل utf-8 + offset ذخیره می‌شوند. ردیف‌ها در chunkهای جدا
+# (هر فایل یک chunk، فقط اضافه می‌شود) نوشته می‌شوند:
+#
+#   DRC1 | بلوک ستون‌ها (هر کدام هم‌تراز 8 بایت) | footer JSON | طول footer (u4) | DRC1
+#
+# هر بلوک یا خام است (و با mmap بدون کپی به np.frombuffer می‌رسد) یا اگر
+# فشرده‌سازی واقعاً کمکی کند zlib است. footer محل هر بلوک را دارد، پس خواننده
+# فقط بلوک‌های ستون‌های خواسته‌شده را لمس می‌کند.
+#
+# گزارشی که بعد از ویرایش دوباره ثبت شود، ردیف‌هایش دوباره با version تازه‌تر
+# اضافه می‌شوند؛ خواننده برای هر report_id فقط ردیف‌های آخرین version را
+# برمی‌گرداند (آخرین نوشتن برنده است)، پس فایل‌ها همچنان فقط اضافه می‌شوند.
+
+import csv
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from models import SHIFT_KEYS, Report
+
+# -------------------------------
+# تنظیمات (از متغیرهای محیطی)
+# -------------------------------
+
+COLUMNAR_DIR = os.getenv("COLUMNAR_DIR")                      # خالی = خاموش
+CHUNK_ROWS = int(os.getenv("COLUMNAR_CHUNK_ROWS", "4096"))
+FLUSH_INTERVAL = float(os.getenv("COLUMNAR_FLUSH_INTERVAL", "300"))   # ثانیه؛ سقف عمر ردیف‌های معوق
+COMPRESS = os.getenv("COLUMNAR_COMPRESS", "auto")             # auto، always یا never
+
+MAGIC = b"DRC1"
+ALIGN = 8
+
+# نام ستون → نوع
+SCHEMA = {
+    "report_id": "i8",
+    "version": "i8",       # زمان ثبت (ns)؛ chunkهای قدیمی بدون این ستون = 0
+    "date": "i4",          # yyyymmdd، 0 = نامعلوم
+    "shift": "dict",
+    "region": "dict",
+    "borehole": "dict",
+    "rig": "dict",
+    "size": "dict",
+    "start": "f8",
+    "end": "f8",
+    "length": "f8",
+    "water": "f8",
+    "diesel": "f8",
+    "supervisors": "list",
+    "helpers": "list",
+    "workshop_bosses": "list",
+    "mud": "list",
+    "notes": "str",
+}
+
+
+def shift_rows(report_id: int, report: Report, version: int = 0):
+    """ردیف‌های ستونی یک گزارش: یکی برای هر شیفتی که ثبت شده."""
+    # import اینجا تا columnar به archive وابسته نباشد
+    from archive import date_key
+
+    key = date_key(report.date)
+    date = int(key.replace("-", "")) if key else 0
+    for shift in SHIFT_KEYS:
+        sh = report.shift(shift)
+        if sh.start is None:
+            continue
+        yield {
+            "report_id": report_id,
+            "version": version,
+            "date": date,
+            "shift": shift,
+            "region": report.region,
+            "borehole": report.borehole,
+            "rig": report.rig,
+            "size": sh.size,
+            "start": sh.start,
+            "end": sh.end,
+            "length": sh.length,
+            "water": sh.water,
+            "diesel": sh.diesel,
+            "supervisors": list(sh.supervisors),
+            "helpers": list(sh.helpers),
+            "workshop_bosses": list(sh.workshop_bosses),
+            "mud": list(sh.mud),
+            "notes": sh.notes,
+        }
+
+
+# ==========================
+# کدگذاری
+# ==========================
+
+def _codes_dtype(n: int):
+    if n <= 0xFF:
+        return np.uint8
+    if n <= 0xFFFF:
+        return np.uint16
+    return np.uint32
+
+
+def _dict_encode(values):
+    index = {}
+    codes = [index.setdefault(v, len(index)) for v in values]
+    return np.asarray(codes, dtype=_codes_dtype(len(index))), list(index)
+
+
+def _encode_column(kind: str, values: list) -> tuple[dict, dict]:
+    """(آرایه‌ها به نام بلوک، متادیتای ستون)"""
+    if kind == "f8":
+        arr = np.asarray([np.nan if v is None else v for v in values], dtype="<f8")
+        return {"data": arr}, {}
+    if kind in ("i4", "i8"):
+        return {"data": np.asarray(values, dtype="<" + kind)}, {}
+    if kind == "dict":
+        codes, dictionary = _dict_encode(values)
+        return {"codes": codes}, {"values": dictionary}
+    if kind == "list":
+        offsets = np.zeros(len(values) + 1, dtype="<u4")
+        np.cumsum([len(v) for v in values], out=offsets[1:])
+        codes, dictionary = _dict_encode([item for v in values for item in v])
+        return {"offsets": offsets, "codes": codes}, {"values": dictionary}
+    if kind == "str":
+        raw = [(v or "").encode("utf-8") for v in values]
+        offsets = np.zeros(len(raw) + 1, dtype="<u4")
+        np.cumsum([len(b) for b in raw], out=offsets[1:])
+        return {"offsets": offsets, "bytes": np.frombuffer(b"".join(raw), dtype=np.uint8)}, {}
+    raise ValueError(f"نوع ستون نامعتبر: {kind}")
+
+
+def _pack_block(arr: np.ndarray, compress: str):
+    raw = arr.tobytes()
+    if compress != "never" and raw:
+        packed = zlib.compress(raw, 6)
+        # اعداد اعشاری معمولاً فشرده نمی‌شوند؛ خام می‌مانند تا mmap بی‌کپی بماند
+        if compress == "always" or len(packed) < 0.8 * len(raw):
+            return "zlib", packed
+    return "raw", raw
+
+
+def write_chunk(path: str, rows: list[dict], compress: str = COMPRESS):
+    """نوشتن یک chunk؛ اول در فایل موقت و بعد rename، تا خواننده chunk نیمه‌کاره نبیند."""
+    tmp = path + ".tmp"
+    columns = {}
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        pos = len(MAGIC)
+        for name, kind in SCHEMA.items():
+            arrays, meta = _encode_column(kind, [row[name] for row in rows])
+            blocks = {}
+            for block, arr in arrays.items():
+                pad = -pos % ALIGN
+                f.write(b"\0" * pad)
+                pos += pad
+                codec, payload = _pack_block(arr, compress)
+                f.write(payload)
+                blocks[block] = {
+                    "dtype": arr.dtype.str,
+                    "count": int(arr.size),
+                    "codec": codec,
+                    "offset": pos,
+                    "length": len(payload),
+                }
+                pos += len(payload)
+            columns[name] = {"kind": kind, "blocks": blocks, **meta}
+
+        footer = json.dumps({"rows": len(rows), "columns": columns}, ensure_ascii=False).encode()
+        f.write(footer)
+        f.write(struct.pack("<I", len(footer)))
+        f.write(MAGIC)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# ==========================
+# نوشتن (فقط اضافه)
+# ==========================
+
+class ColumnarWriter:
+    """
+    ردیف‌ها در حافظه جمع می‌شوند و هر CHUNK_ROWS ردیف یک فایل chunk می‌شوند.
+    یک thread پس‌زمینه هم هر flush_interval ثانیه ردیف‌های معوق را می‌نویسد،
+    پس کرش حداکثر همین بازه را از دست می‌دهد؛ منبع اصلی همچنان آرشیو SQLite
+    است و `python columnar.py build` (build_from_archive) راه بازسازی کامل است.
+    """
+
+    def __init__(self, directory: str, chunk_rows: int = CHUNK_ROWS, compress: str = COMPRESS,
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.directory = directory
+        self.chunk_rows = max(1, chunk_rows)
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self._stop = threading.Event()
+        self._flusher = None
+        if flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="columnar-flush", daemon=True)
+            self._flusher.start()
+
+    def append_report(self, report_id: int, report: Report):
+        """exporter آرشیو؛ ثبت دوباره‌ی همان report_id نسخه‌ی قبلی را کنار می‌زند."""
+        with self._lock:
+            self._pending.extend(shift_rows(report_id, report, time.time_ns()))
+            if len(self._pending) >= self.chunk_rows:
+                self._write_pending()
+
+    def _write_pending(self):
+        rows, self._pending = self._pending, []
+        # نام مرتب بر اساس زمان؛ pid برای چند worker که در یک پوشه می‌نویسند
+        name = f"chunk-{time.time_ns():020d}-{os.getpid()}.col"
+        write_chunk(os.path.join(self.directory, name), rows, self.compress)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                self._write_pending()
+
+    def close(self):
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+
+# ==========================
+# خواندن
+# ==========================
+
+class Chunk:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if mm[:4] != MAGIC or mm[-4:] != MAGIC:
+            raise ValueError(f"فایل chunk نامعتبر: {path}")
+        (footer_len,) = struct.unpack("<I", mm[-8:-4])
+        meta = json.loads(mm[-8 - footer_len:-8])
+        self.rows = meta["rows"]
+        self.columns = meta["columns"]
+
+    def _block(self, spec: dict) -> np.ndarray:
+        if spec["codec"] == "raw":
+            # بدون کپی: آرایه مستقیم روی صفحه‌های mmap‌شده‌ی فایل
+            return np.frombuffer(self._mm, dtype=spec["dtype"], count=spec["count"], offset=spec["offset"])
+        payload = self._mm[spec["offset"]:spec["offset"] + spec["length"]]
+        return np.frombuffer(zlib.decompress(payload), dtype=spec["dtype"], count=spec["count"])
+
+    def column(self, name: str, decode: bool = True):
+        if name == "version" and name not in self.columns:
+            return np.zeros(self.rows, dtype="<i8")
+        col = self.columns[name]
+        blocks = {block: self._block(spec) for block, spec in col["blocks"].items()}
+        kind = col["kind"]
+
+        if kind in ("f8", "i4", "i8"):
+            return blocks["data"]
+        if kind == "dict":
+            if not decode:
+                return blocks["codes"], col["values"]
+            return np.asarray(col["values"], dtype=object)[blocks["codes"]]
+        if kind == "list":
+            values = np.asarray(col["values"], dtype=object)[blocks["codes"]]
+            offsets = blocks["offsets"]
+            return [list(values[offsets[i]:offsets[i + 1]]) for i in range(self.rows)]
+        if kind == "str":
+            data = blocks["bytes"].tobytes()
+            offsets = blocks["offsets"]
+            return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(self.rows)]
+        raise ValueError(f"نوع ستون نامعتبر: {kind}")
+
+
+class ColumnarReader:
+    def __init__(self, directory: str):
+        self.directory = directory
+        names = sorted(n for n in os.listdir(directory) if n.endswith(".col"))
+        self.chunks = [Chunk(os.path.join(directory, n)) for n in names]
+        self._masks = self._latest_masks()
+
+    def _latest_masks(self):
+        """
+        برای هر chunk ماسک ردیف‌هایی که آخرین version گزارش خودشان‌اند
+        (None یعنی همه). فقط ستون‌های report_id و version خوانده می‌شوند.
+        """
+        if not self.chunks:
+            return []
+        ids = [chunk.column("report_id") for chunk in self.chunks]
+        versions = [chunk.column("version") for chunk in self.chunks]
+        all_ids, all_versions = np.concatenate(ids), np.concatenate(versions)
+        order = np.lexsort((all_versions, all_ids))
+        sorted_ids = all_ids[order]
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = sorted_ids[1:] != sorted_ids[:-1]
+        latest_ids, latest_versions = sorted_ids[last], all_versions[order][last]
+
+        masks = []
+        for chunk_ids, chunk_versions in zip(ids, versions):
+            keep = chunk_versions == latest_versions[np.searchsorted(latest_ids, chunk_ids)]
+            masks.append(None if keep.all() else keep)
+        return masks
+
+    @property
+    def rows(self) -> int:
+        return sum(
+            chunk.rows if mask is None else int(mask.sum())
+            for chunk, mask in zip(self.chunks, self._masks)
+        )
+
+    def iter_chunks(self, columns, decode: bool = True):
+        """برای هر chunk یک دیکشنری نام ستون → مقدار؛ فقط همین ستون‌ها خوانده می‌شوند."""
+        for name in columns:
+            if name not in SCHEMA:
+                raise KeyError(name)
+        for chunk, mask in zip(self.chunks, self._masks):
+            values = {name: chunk.column(name, decode) for name in columns}
+            if mask is not None:
+                values = {name: _select(value, mask) for name, value in values.items()}
+            yield values
+
+    def read(self, columns) -> dict:
+        """ستون‌های خواسته‌شده از همه‌ی chunkها، پشت سر هم."""
+        parts = {name: [] for name in columns}
+        for chunk in self.iter_chunks(columns):
+            for name, value in chunk.items():
+                parts[name].append(value)
+
+        out = {}
+        for name, values in parts.items():
+            if SCHEMA[name] in ("list", "str"):
+                out[name] = [v for part in values for v in part]
+            elif values:
+                out[name] = np.concatenate(values)
+            else:
+                out[name] = np.empty(0, dtype=object if SCHEMA[name] == "dict" else SCHEMA[name])
+        return out
+
+
+def _select(value, mask: np.ndarray):
+    """ردیف‌های mask از خروجی Chunk.column (آرایه، فهرست، یا (codes, values))."""
+    if isinstance(value, np.ndarray):
+        return value[mask]
+    if isinstance(value, tuple):
+        codes, dictionary = value
+        return codes[mask], dictionary
+    return [v for v, keep in zip(value, mask) if keep]
+
+
+def export_csv(reader: ColumnarReader, out, columns):
+    """خروجی CSV فقط با ستون‌های داده‌شده؛ chunk به chunk، بدون بار کردن کل آرشیو."""
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    for chunk in reader.iter_chunks(columns):
+        cells = []
+        for name in columns:
+            kind, values = SCHEMA[name], chunk[name]
+            if kind == "f8":
+                cells.append(["" if np.isnan(v) else f"{v:g}" for v in values])
+            elif kind == "list":
+                cells.append([" + ".join(v) for v in values])
+            else:
+                cells.append(["" if v is None else v for v in values])
+        writer.writerows(zip(*cells))
+
+
+def build_from_archive(arc, directory: str, chunk_rows: int = CHUNK_ROWS) -> int:
+    """ساخت دوباره‌ی آرشیو ستونی از کل آرشیو SQLite؛ تعداد ردیف‌ها را برمی‌گرداند."""
+    for name in os.listdir(directory) if os.path.isdir(directory) else ():
+        if name.endswith(".col"):
+            os.remove(os.path.join(directory, name))
+    writer = ColumnarWriter(directory, chunk_rows, flush_interval=0)
+    for report_id, report in arc.iter_reports():
+        writer.append_report(report_id, report)
+    writer.close()
+    return ColumnarReader(directory).rows
+
+
+if __name__ == "__main__":
+    # python columnar.py build
+    # python columnar.py export out.csv date,borehole,length,mud
+    import sys
+
+    import archive
+
+    directory = COLUMNAR_DIR or "columnar"
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "build":
+        arc = archive.from_env()
+        print(build_from_archive(arc, directory), "rows")
+        arc.close()
+    elif cmd == "export" and len(sys.argv) == 4:
+        with open(sys.argv[2], "w", newline="", encoding="utf-8") as out:
+            export_csv(ColumnarReader(directory), out, sys.argv[3].split(","))
+    else:
+        raise SystemExit("usage: columnar.py build | export <out.csv> <col1,col2,...>")
@@ -0,0 +1,106 @@
+# edit_coalescer.py
+import asyncio
+import logging
+import os
+
+from telegram.error import BadRequest, TelegramError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------
+# تنظیمات (از متغیرهای محیطی)
+# -------------------------------
+
+# کمترین فاصله‌ی دو ویرایش پشت‌سرهم یک پیام (ثانیه)
+EDIT_INTERVAL = float(os.getenv("MUD_EDIT_INTERVAL", "0.5"))
+
+
+class _Slot:
+    __slots__ = ("query", "latest", "pending", "sent", "task", "in_flight")
+
+    def __init__(self):
+        self.query = None
+        self.latest = None      # (text, reply_markup) آخرین وضعیت خواسته‌شده
+        self.pending = False    # latest هنوز به ارسال نرسیده
+        self.sent = None        # آخرین وضعیتی که واقعاً ارسال شد
+        self.task = None
+        self.in_flight = None
+
+
+class EditCoalescer:
+    """
+    ادغام ویرایش‌های پشت‌سرهم یک پیام.
+
+    اولین ویرایش فوراً فرستاده می‌شود؛ ویرایش‌هایی که تا interval بعد از آن
+    برسند روی هم می‌افتند و فقط آخرین وضعیت در یک ویرایش فرستاده می‌شود.
+    وضعیتی که با آخرین ارسال یکی است اصلاً فرستاده نمی‌شود.
+    """
+
+    def __init__(self, interval: float = EDIT_INTERVAL):
+        self.interval = interval
+        self._slots = {}    # (chat_id, message_id) → _Slot
+
+    @staticmethod
+    def _key(query):
+        return query.message.chat_id, query.message.message_id
+
+    def __len__(self):
+        return len(self._slots)
+
+    def edit(self, query, text: str, reply_markup=None):
+        """ثبت وضعیت تازه‌ی پیام query؛ منتظر ارسال نمی‌ماند."""
+        key = self._key(query)
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _Slot()
+        elif slot.pending:
+            metrics.MESSAGE_EDITS.inc("coalesced")
+        slot.query = query
+        slot.latest = (text, reply_markup)
+        slot.pending = True
+        if slot.task is None:
+            slot.task = asyncio.create_task(self._run(key, slot))
+
+    async def _run(self, key, slot: _Slot):
+        try:
+            while slot.latest != slot.sent:
+                text, markup = state = slot.latest
+                slot.pending = False
+                slot.in_flight = asyncio.ensure_future(
+                    slot.query.edit_message_text(text, reply_markup=markup)
+                )
+                try:
+                    # shield: settle() این task را لغو می‌کند ولی درخواست در راه باید کامل شود
+                    await asyncio.shield(slot.in_flight)
+                    metrics.MESSAGE_EDITS.inc("sent")
+                except BadRequest as e:
+                    if "not modified" not in str(e).lower():
+                        logger.warning("edit failed: %s", e)
+                except TelegramError as e:
+                    logger.warning("edit failed: %s", e)
+                slot.sent = state
+                slot.in_flight = None
+                await asyncio.sleep(self.interval)
+        finally:
+            if self._slots.get(key) is slot:
+                del self._slots[key]
+
+    async def settle(self, query):
+        """
+        کنار گذاشتن ویرایش‌های معوق پیام query و صبر تا درخواست در راه تمام شود؛
+        پیش از اینکه هندلر بعدی خودش همان پیام را ویرایش کند صدا زده می‌شود.
+        """
+        slot = self._slots.pop(self._key(query), None)
+        if slot is None:
+            return
+        if slot.pending:
+            metrics.MESSAGE_EDITS.inc("dropped")
+        slot.task.cancel()
+        if slot.in_flight is not None:
+            try:
+                await slot.in_flight
+                metrics.MESSAGE_EDITS.inc("sent")
+            except TelegramError:
+                pass
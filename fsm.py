@@ -0,0 +1,164 @@
+# fsm.py
+#
+# موتور ماشین حالت گفتگو: هر مرحله و هر callback یک هندلر ثبت‌شده دارد و
+# توزیع با یک lookup دیکشنری انجام می‌شود، نه زنجیره‌ی if. هزینه‌ی هر پیام
+# با بزرگ شدن فرم ثابت می‌ماند.
+#
+#   @flow.step(STEP_WATER, parse=parse_float, error="⛔ مقدار آب نامعتبر.", to=(STEP_DIESEL,))
+#   async def handle_water(update, user_id, val): ...
+#
+#   @flow.callback(prefix="size_", to=(STEP_MUD,))
+#   async def set_size(query, user_id, size): ...
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidInput(ValueError):
+    """ورودی کاربر از validator مرحله رد نشد."""
+
+
+# ==========================
+# validatorهای رایج
+# ==========================
+
+def parse_float(text: str) -> float:
+    try:
+        return float(text.replace(",", "."))
+    except ValueError:
+        raise InvalidInput(text) from None
+
+
+def parse_digits(text: str) -> int:
+    if not text.isdigit():
+        raise InvalidInput(text)
+    return int(text)
+
+
+def split_names(raw: str):
+    parts = [p.strip() for p in raw.replace("،", ",").split(",")]
+    return [p for p in parts if p]
+
+
+# ==========================
+# ماشین حالت
+# ==========================
+
+class _Route:
+    __slots__ = ("handler", "parse", "error", "to", "skip")
+
+    def __init__(self, handler, parse=None, error=None, to=(), skip=()):
+        self.handler = handler
+        self.parse = parse
+        self.error = error
+        self.to = frozenset(to)
+        self.skip = frozenset(skip)
+
+
+class FlowMachine:
+    """
+    جدول مرحله → هندلر برای پیام‌های متنی و data → هندلر برای callbackها.
+
+    get_step برای خواندن مرحله‌ی کاربر بعد از هر هندلر است؛ اگر هندلر کاربر
+    را به مرحله‌ای برد که در to اعلام نشده بود، فقط هشدار log می‌شود.
+    hookها با (kind, key, elapsed) صدا زده می‌شوند: kind یکی از "step" و
+    "callback"، key نام مرحله یا callback، و elapsed زمان هندلر به ثانیه.
+    """
+
+    def __init__(self, get_step):
+        self._get_step = get_step
+        self._steps = {}
+        self._exact = {}
+        self._prefix = {}
+        self._hooks = []
+
+    # ---------- ثبت ----------
+
+    def step(self, step: str, *, parse=None, error: str | None = None, to=()):
+        def register(handler):
+            if step in self._steps:
+                raise ValueError(f"مرحله‌ی تکراری: {step}")
+            self._steps[step] = _Route(handler, parse, error, to)
+            return handler
+        return register
+
+    def callback(self, *data: str, prefix: str | None = None, to=(), skip=()):
+        """
+        ثبت هندلر callback برای یک یا چند data دقیق، یا برای یک پیشوند.
+        پیشوند باید به «_» ختم شود (مثل "size_")؛ هندلر باقی data را می‌گیرد.
+        data دقیق همیشه بر پیشوند مقدم است ("mud_done" در برابر "mud_").
+        وقتی کاربر در یکی از مراحل skip است callback نادیده گرفته می‌شود
+        (دکمه‌های کهنه‌ی پیام‌های قبلی).
+        """
+        if prefix is not None and not prefix.endswith("_"):
+            raise ValueError(f"پیشوند callback باید به _ ختم شود: {prefix}")
+
+        def register(handler):
+            route = _Route(handler, to=to, skip=skip)
+            for key in data:
+                self._exact[key] = route
+            if prefix is not None:
+                self._prefix[prefix] = route
+            return handler
+        return register
+
+    def add_hook(self, hook):
+        self._hooks.append(hook)
+
+    @property
+    def transitions(self) -> dict:
+        """گراف اعلام‌شده: مرحله → مجموعه‌ی مراحل مقصد."""
+        return {step: set(route.to) for step, route in self._steps.items()}
+
+    # ---------- توزیع ----------
+
+    async def dispatch_message(self, update, user_id: int, step: str, text: str, default=None):
+        route = self._steps.get(step)
+        if route is None:
+            return await default(update, user_id, text) if default else None
+
+        value = text
+        if route.parse is not None:
+            try:
+                value = route.parse(text)
+            except InvalidInput:
+                if route.error:
+                    return await update.message.reply_text(route.error)
+                return None
+
+        return await self._run("step", step, route, step, update, user_id, value)
+
+    async def dispatch_callback(self, query, user_id: int, data: str):
+        route = self._exact.get(data)
+        key, arg = data, data
+        if route is None:
+            cut = data.find("_") + 1
+            if cut:
+                key, arg = data[:cut], data[cut:]
+                route = self._prefix.get(key)
+        if route is None:
+            logger.warning("unhandled callback %r", data)
+            return None
+
+        before = self._get_step(user_id)
+        if before in route.skip:
+            logger.debug("ignored callback %r at step %s", data, before)
+            return None
+        return await self._run("callback", key, route, before, query, user_id, arg)
+
+    async def _run(self, kind: str, key: str, route: _Route, before, obj, user_id: int, arg):
+        started = time.perf_counter()
+        try:
+            return await route.handler(obj, user_id, arg)
+        finally:
+            elapsed = time.perf_counter() - started
+            after = self._get_step(user_id)
+            if route.to and after != before and after not in route.to:
+                logger.warning("undeclared transition %s %r: %s → %s", kind, key, before, after)
+            for hook in self._hooks:
+                try:
+                    hook(kind, key, elapsed)
+                except Exception:
+                    logger.exception("flow hook failed")
@@ -0,0 +1,249 @@
+# kpi.py
+#
+# شاخص‌های تجمعی هر گمانه و هر دستگاه: متراژ کل، تعداد شیفت، آب و گازوئیل
+# مصرفی و تعداد شیفت‌هایی که هر نوع گل حفاری در آن‌ها مصرف شده.
+#
+# با هر گزارش نهایی، apply در همان تراکنش آرشیو فقط ردیف‌های مربوط را با
+# UPSERT به‌روز می‌کند؛ /stats فقط همین ردیف‌های آماده را می‌خواند و هیچ‌وقت
+# تاریخچه را از اول مرور نمی‌کند. گزارشی که بعد از ویرایش دوباره ثبت شود،
+# اول با retract سهم قبلی‌اش برداشته می‌شود تا هر گزارش فقط یک بار شمرده شود.
+# rebuild برای ساخت دوباره از کل آرشیو است
+# (مهاجرت آرشیو قدیمی یا تغییر تعریف شاخص‌ها) و جمع‌ها را برداری با numpy
+# حساب می‌کند.
+
+import json
+from typing import NamedTuple
+
+from models import SHIFT_KEYS, Report
+
+SCOPES = ("borehole", "rig")
+
+
+def init_schema(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS rollups ("
+        " scope TEXT NOT NULL,"
+        " key TEXT NOT NULL COLLATE NOCASE,"
+        " meters REAL NOT NULL DEFAULT 0,"
+        " shifts INTEGER NOT NULL DEFAULT 0,"
+        " water REAL NOT NULL DEFAULT 0,"
+        " diesel REAL NOT NULL DEFAULT 0,"
+        " PRIMARY KEY (scope, key))"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS mud_usage ("
+        " scope TEXT NOT NULL,"
+        " key TEXT NOT NULL COLLATE NOCASE,"
+        " mud TEXT NOT NULL,"
+        " shifts INTEGER NOT NULL DEFAULT 0,"
+        " PRIMARY KEY (scope, key, mud))"
+    )
+
+
+class Rollup(NamedTuple):
+    scope: str
+    key: str
+    meters: float
+    shifts: int
+    water: float
+    diesel: float
+    mud: dict  # نوع گل → تعداد شیفت
+
+    @property
+    def meters_per_shift(self) -> float:
+        return self.meters / self.shifts if self.shifts else 0.0
+
+    @property
+    def water_per_meter(self) -> float:
+        return self.water / self.meters if self.meters else 0.0
+
+    @property
+    def diesel_per_meter(self) -> float:
+        return self.diesel / self.meters if self.meters else 0.0
+
+
+def _worked_shifts(shifts: dict):
+    """شیفت‌هایی که واقعاً ثبت شده‌اند (مثل پیش‌نمایش: start دارند)."""
+    for key in SHIFT_KEYS:
+        sh = shifts.get(key) or {}
+        if sh.get("start") is not None:
+            yield sh
+
+
+# ==========================
+# به‌روزرسانی افزایشی
+# ==========================
+
+_UPSERT_ROLLUP = (
+    "INSERT INTO rollups (scope, key, meters, shifts, water, diesel) VALUES (?, ?, ?, ?, ?, ?)"
+    " ON CONFLICT (scope, key) DO UPDATE SET"
+    " meters = meters + excluded.meters,"
+    " shifts = shifts + excluded.shifts,"
+    " water = water + excluded.water,"
+    " diesel = diesel + excluded.diesel"
+)
+_UPSERT_MUD = (
+    "INSERT INTO mud_usage (scope, key, mud, shifts) VALUES (?, ?, ?, ?)"
+    " ON CONFLICT (scope, key, mud) DO UPDATE SET shifts = shifts + excluded.shifts"
+)
+
+
+def apply(conn, report: Report):
+    """سهم یک گزارش نهایی؛ داخل تراکنش آرشیو صدا زده می‌شود."""
+    _add(conn, report.to_dict(), 1)
+
+
+def retract(conn, data: dict):
+    """
+    برداشتن سهم قبلی یک گزارش (data همان JSON ذخیره‌شده در آرشیو) پیش از
+    apply نسخه‌ی ویرایش‌شده؛ ردیف‌هایی که شیفتی برایشان نمی‌ماند حذف می‌شوند.
+    """
+    _add(conn, data, -1)
+    conn.execute("DELETE FROM rollups WHERE shifts <= 0")
+    conn.execute("DELETE FROM mud_usage WHERE shifts <= 0")
+
+
+def _add(conn, data: dict, sign: int):
+    shifts = list(_worked_shifts(data.get("shifts") or {}))
+    if not shifts:
+        return
+
+    meters = sum(sh.get("length") or 0 for sh in shifts)
+    water = sum(sh.get("water") or 0 for sh in shifts)
+    diesel = sum(sh.get("diesel") or 0 for sh in shifts)
+    mud = {}
+    for sh in shifts:
+        for name in set(sh.get("mud") or ()):
+            mud[name] = mud.get(name, 0) + 1
+
+    for scope in SCOPES:
+        key = data.get(scope)
+        if not key:
+            continue
+        conn.execute(_UPSERT_ROLLUP, (
+            scope, key, sign * meters, sign * len(shifts), sign * water, sign * diesel,
+        ))
+        conn.executemany(_UPSERT_MUD, [(scope, key, name, sign * n) for name, n in mud.items()])
+
+
+# ==========================
+# خواندن
+# ==========================
+
+def _mud_counts(conn, scope: str) -> dict:
+    counts = {}
+    for key, name, n in conn.execute(
+        "SELECT key, mud, shifts FROM mud_usage WHERE scope = ?", (scope,)
+    ):
+        counts.setdefault(key.lower(), {})[name] = n
+    return counts
+
+
+def get(conn, scope: str, key: str) -> Rollup | None:
+    row = conn.execute(
+        "SELECT key, meters, shifts, water, diesel FROM rollups WHERE scope = ? AND key = ?",
+        (scope, key.strip()),
+    ).fetchone()
+    if row is None:
+        return None
+    mud = dict(conn.execute(
+        "SELECT mud, shifts FROM mud_usage WHERE scope = ? AND key = ?", (scope, row[0])
+    ).fetchall())
+    return Rollup(scope, row[0], row[1], row[2], row[3], row[4], mud)
+
+
+def get_scope(conn, scope: str) -> list[Rollup]:
+    """همه‌ی ردیف‌های یک scope، پرمتراژترین اول."""
+    mud = _mud_counts(conn, scope)
+    rows = conn.execute(
+        "SELECT key, meters, shifts, water, diesel FROM rollups"
+        " WHERE scope = ? ORDER BY meters DESC",
+        (scope,),
+    ).fetchall()
+    return [Rollup(scope, *row, mud.get(row[0].lower(), {})) for row in rows]
+
+
+# ==========================
+# ساخت دوباره از کل آرشیو
+# ==========================
+
+def rebuild(conn):
+    """
+    پاک کردن و ساختن دوباره‌ی rollups و mud_usage از جدول reports.
+
+    هر شیفت یک ردیف از چند آرایه است و جمع هر گروه با np.bincount در یک
+    عبور انجام می‌شود، نه حلقه‌ی پایتونی روی گروه‌ها.
+    """
+    import numpy as np
+
+    boreholes, rigs, meters, water, diesel, muds = [], [], [], [], [], []
+    for borehole, rig, data in conn.execute("SELECT borehole, rig, data FROM reports"):
+        for sh in _worked_shifts(json.loads(data).get("shifts") or {}):
+            boreholes.append(borehole or "")
+            rigs.append(rig or "")
+            meters.append(sh.get("length") or 0)
+            water.append(sh.get("water") or 0)
+            diesel.append(sh.get("diesel") or 0)
+            muds.append(set(sh.get("mud") or ()))
+
+    values = {
+        "meters": np.asarray(meters, dtype=np.float64),
+        "water": np.asarray(water, dtype=np.float64),
+        "diesel": np.asarray(diesel, dtype=np.float64),
+    }
+    mud_names = sorted(set().union(*muds)) if muds else []
+    # ماتریس شیفت × نوع گل
+    mud_matrix = np.zeros((len(muds), len(mud_names)), dtype=np.int64)
+    for col, name in enumerate(mud_names):
+        mud_matrix[:, col] = [name in m for m in muds]
+
+    rollup_rows, mud_rows = [], []
+    for scope, keys in (("borehole", boreholes), ("rig", rigs)):
+        if not keys:
+            continue
+        keys = np.asarray(keys, dtype=object)
+        # گروه‌بندی بدون حساسیت به حروف، مثل COLLATE NOCASE؛ نام نمایشی اولین املاست
+        folded = np.asarray([k.lower() for k in keys])
+        _, first, group = np.unique(folded, return_index=True, return_inverse=True)
+        n = len(first)
+
+        counts = np.bincount(group, minlength=n)
+        sums = {name: np.bincount(group, weights=arr, minlength=n) for name, arr in values.items()}
+        mud_sums = np.stack(
+            [np.bincount(group, weights=mud_matrix[:, col], minlength=n) for col in range(len(mud_names))],
+            axis=1,
+        ) if mud_names else np.zeros((n, 0))
+
+        for g in range(n):
+            key = keys[first[g]]
+            if not key:
+                continue
+            rollup_rows.append((
+                scope, key, float(sums["meters"][g]), int(counts[g]),
+                float(sums["water"][g]), float(sums["diesel"][g]),
+            ))
+            for col, name in enumerate(mud_names):
+                if mud_sums[g, col]:
+                    mud_rows.append((scope, key, name, int(mud_sums[g, col])))
+
+    with conn:
+        conn.execute("DELETE FROM rollups")
+        conn.execute("DELETE FROM mud_usage")
+        conn.executemany(
+            "INSERT INTO rollups (scope, key, meters, shifts, water, diesel) VALUES (?, ?, ?, ?, ?, ?)",
+            rollup_rows,
+        )
+        conn.executemany(
+            "INSERT INTO mud_usage (scope, key, mud, shifts) VALUES (?, ?, ?, ?)",
+            mud_rows,
+        )
+    return len(rollup_rows)
+
+
+if __name__ == "__main__":
+    # python kpi.py  → ساخت دوباره‌ی شاخص‌ها از آرشیو ARCHIVE_DB
+    import archive
+
+    arc = archive.from_env()
+    print(arc.rebuild_stats(), "rollups rebuilt")
+    arc.close()
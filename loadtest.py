@@ -0,0 +1,423 @@
+# loadtest.py
+#
+# تست بار: یک Bot API جعلی محلی (getUpdates، setWebhook، sendMessage،
+# editMessageText، sendDocument، ...) بالا می‌آید، ربات واقعی (main.py) با
+# BOT_API_URL به آن وصل می‌شود و N کاربر مجازی همزمان کل فرم و /pdf را پر
+# می‌کنند؛ مثل تعویض شیفت که همه‌ی اکیپ‌ها با هم گزارش می‌دهند.
+#
+#   python loadtest.py --users 50
+#   python loadtest.py --users 50 --mode webhook --json result.json
+#
+# تأخیر هر مرحله از لحظه‌ی تحویل آپدیت به ربات تا رسیدن آخرین پاسخ مورد
+# انتظار (sendMessage/editMessageText/sendDocument برای همان chat) است.
+# harness برای polling و webhook یکسان است؛ فقط مسیر تحویل آپدیت فرق می‌کند.
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from urllib.parse import parse_qsl
+
+import httpx
+import tornado.web
+
+TOKEN = "123456:LOADTEST"
+SECRET = "loadtest-secret"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "DrillBot", "username": "drill_test_bot"}
+
+# متدهایی که پاسخ ربات به کاربر حساب می‌شوند
+REPLY_METHODS = {"sendMessage", "editMessageText", "sendDocument"}
+
+
+# ==========================
+# Bot API جعلی
+# ==========================
+
+class FakeBotAPI:
+    def __init__(self):
+        self._updates = []
+        self._arrived = asyncio.Event()
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._file_ids = 0
+        self.replies = defaultdict(asyncio.Queue)     # chat_id → (method, زمان)
+        self.calls = defaultdict(int)
+        self.ready = asyncio.Event()
+        self.webhook_url = None
+        self.webhook_secret = None
+        self._client = None
+
+    # ---------- آپدیت به سمت ربات ----------
+
+    def _update_id(self) -> int:
+        uid = self._next_update_id
+        self._next_update_id += 1
+        return uid
+
+    def message_id(self) -> int:
+        mid = self._next_message_id
+        self._next_message_id += 1
+        return mid
+
+    async def deliver(self, update: dict):
+        update["update_id"] = self._update_id()
+        if self.webhook_url is None:
+            self._updates.append(update)
+            self._arrived.set()
+            return
+
+        # سرور webhook ربات ممکن است چند لحظه بعد از setWebhook بالا بیاید
+        for _ in range(50):
+            try:
+                resp = await self._client.post(
+                    self.webhook_url,
+                    json=update,
+                    headers={"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret or ""},
+                )
+                resp.raise_for_status()
+                return
+            except httpx.ConnectError:
+                await asyncio.sleep(0.1)
+        raise RuntimeError("webhook ربات در دسترس نیست")
+
+    # ---------- متدهای Bot API ----------
+
+    def _message(self, chat_id, **extra) -> dict:
+        return {
+            "message_id": self.message_id(),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": BOT_USER,
+            **extra,
+        }
+
+    async def call(self, method: str, params: dict):
+        self.calls[method] += 1
+
+        if method == "getMe":
+            return BOT_USER
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return True
+        if method == "setWebhook":
+            self.webhook_url = params["url"]
+            self.webhook_secret = params.get("secret_token")
+            self.ready.set()
+            return True
+        if method == "getWebhookInfo":
+            return {"url": self.webhook_url or "", "has_custom_certificate": False, "pending_update_count": 0}
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method == "answerCallbackQuery":
+            return True
+        if method in REPLY_METHODS:
+            chat_id = params["chat_id"]
+            self.replies[int(chat_id)].put_nowait((method, time.perf_counter()))
+            if method == "sendDocument":
+                self._file_ids += 1
+                doc = {"file_id": f"DOC{self._file_ids}", "file_unique_id": f"U{self._file_ids}"}
+                return self._message(chat_id, document=doc)
+            return self._message(chat_id, text=params.get("text", ""))
+        if method in ("close", "logOut"):
+            return True
+        raise KeyError(method)
+
+    async def _get_updates(self, params: dict):
+        self.ready.set()
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    # ---------- HTTP ----------
+
+    def app(self):
+        api = self
+
+        class Handler(tornado.web.RequestHandler):
+            async def post(self, token, method):
+                await self._handle(token, method)
+
+            async def get(self, token, method):
+                await self._handle(token, method)
+
+            async def _handle(self, token, method):
+                if token != TOKEN:
+                    self.set_status(401)
+                    return self.finish({"ok": False, "error_code": 401, "description": "Unauthorized"})
+                try:
+                    result = await api.call(method, _params(self.request))
+                except KeyError as e:
+                    self.set_status(400)
+                    return self.finish({"ok": False, "error_code": 400, "description": f"Bad Request: {e}"})
+                self.finish({"ok": True, "result": result})
+
+        return tornado.web.Application([(r"/bot([^/]+)/(\w+)", Handler)])
+
+    async def start(self, port: int):
+        self._client = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=200))
+        self._server = self.app().listen(port, address="127.0.0.1")
+
+    async def stop(self):
+        # getUpdateهای معلق آزاد شوند تا با بستن loop لغو نشوند
+        self._arrived.set()
+        await asyncio.sleep(0)
+        self._server.stop()
+        await self._client.aclose()
+
+
+def _params(request) -> dict:
+    ctype = request.headers.get("Content-Type", "")
+    if ctype.startswith("application/json"):
+        return json.loads(request.body or b"{}")
+    if ctype.startswith("application/x-www-form-urlencoded"):
+        return dict(parse_qsl(request.body.decode()))
+    # multipart (sendDocument) را tornado خودش تجزیه می‌کند
+    params = {k: v[-1].decode() for k, v in request.body_arguments.items()}
+    params.update({k: v[-1].decode() for k, v in request.query_arguments.items()})
+    return params
+
+
+# ==========================
+# کاربر مجازی
+# ==========================
+
+# (نام مرحله، نوع، مقدار، تعداد پاسخ مورد انتظار)
+SCRIPT = (
+    ("start", "cmd", "/start", 1),
+    ("region", "text", "سنگان", 1),
+    ("borehole", "text", "BH-{uid}", 1),
+    ("rig", "cb", "rig_DB1200", 1),
+    ("angle", "text", "60", 1),
+    ("year", "text", "1403", 1),
+    ("month", "text", "7", 1),
+    ("day", "text", "5", 2),
+    ("shift", "cb", "shift_day", 1),
+    ("supervisors", "text", "علی", 1),
+    ("helpers", "text", "حسن, رضا", 1),
+    ("workshop", "text", "مهدی", 1),
+    ("start_depth", "text", "120.5", 1),
+    ("end_depth", "text", "134", 1),
+    ("size", "cb", "size_NQ", 1),
+    ("mud", "cb", "mud_super", 1),
+    ("mud_done", "cb", "mud_done", 1),
+    ("water", "text", "3500", 1),
+    ("diesel", "text", "180", 1),
+    ("shift_ok", "cb", "shift_ok_day", 1),
+    ("notes", "text", "بدون مشکل", 1),
+    ("finish", "cb", "no_more_shift", 3),
+    ("pdf", "cmd", "/pdf", 1),
+)
+
+
+def _user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": f"crew{uid}"}
+
+
+def _chat(uid: int) -> dict:
+    return {"id": uid, "type": "private"}
+
+
+def make_update(api: FakeBotAPI, uid: int, kind: str, value: str) -> dict:
+    now = int(time.time())
+    if kind == "cb":
+        return {
+            "callback_query": {
+                "id": f"{uid}-{api.message_id()}",
+                "from": _user(uid),
+                "chat_instance": str(uid),
+                "data": value,
+                "message": {
+                    "message_id": api.message_id(),
+                    "date": now,
+                    "chat": _chat(uid),
+                    "from": BOT_USER,
+                    "text": "…",
+                },
+            }
+        }
+    message = {
+        "message_id": api.message_id(),
+        "date": now,
+        "chat": _chat(uid),
+        "from": _user(uid),
+        "text": value,
+    }
+    if kind == "cmd":
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(value)}]
+    return {"message": message}
+
+
+async def virtual_user(api: FakeBotAPI, uid: int, think: float, timeout: float, latencies, errors):
+    replies = api.replies[uid]
+    for name, kind, value, expected in SCRIPT:
+        started = time.perf_counter()
+        await api.deliver(make_update(api, uid, kind, value.format(uid=uid)))
+        try:
+            for _ in range(expected):
+                _, last = await asyncio.wait_for(replies.get(), timeout)
+        except asyncio.TimeoutError:
+            errors[name] += 1
+            return False
+        latencies[name].append(last - started)
+        if think:
+            await asyncio.sleep(think)
+    return True
+
+
+# ==========================
+# اجرا
+# ==========================
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def summarize(latencies: dict, errors: dict, elapsed: float, users: int, completed: int) -> dict:
+    steps = {}
+    total_updates = 0
+    for name, *_ in SCRIPT:
+        values = sorted(latencies.get(name, ()))
+        total_updates += len(values)
+        steps[name] = {
+            "count": len(values),
+            "errors": errors.get(name, 0),
+            "p50_ms": _percentile(values, 0.50) * 1000,
+            "p95_ms": _percentile(values, 0.95) * 1000,
+            "p99_ms": _percentile(values, 0.99) * 1000,
+            "max_ms": (values[-1] if values else 0) * 1000,
+            "mean_ms": (statistics.fmean(values) if values else 0) * 1000,
+        }
+    return {
+        "users": users,
+        "completed": completed,
+        "elapsed_s": elapsed,
+        "updates": total_updates,
+        "updates_per_s": total_updates / elapsed if elapsed else 0,
+        "reports_per_s": completed / elapsed if elapsed else 0,
+        "steps": steps,
+    }
+
+
+def print_summary(result: dict):
+    print(
+        f"\n{result['completed']}/{result['users']} users finished in {result['elapsed_s']:.2f}s — "
+        f"{result['updates_per_s']:.1f} updates/s, {result['reports_per_s']:.2f} reports/s\n"
+    )
+    print(f"{'step':14s} {'n':>6s} {'err':>4s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'max':>9s}  (ms)")
+    for name, s in result["steps"].items():
+        print(
+            f"{name:14s} {s['count']:6d} {s['errors']:4d} {s['p50_ms']:9.1f} "
+            f"{s['p95_ms']:9.1f} {s['p99_ms']:9.1f} {s['max_ms']:9.1f}"
+        )
+
+
+def spawn_bot(args, api_port: int, workdir: str):
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": TOKEN,
+        "BOT_API_URL": f"http://127.0.0.1:{api_port}/bot",
+        "BOT_MODE": args.mode,
+        "SESSION_STORE": env.get("SESSION_STORE", "memory"),
+        "SESSION_DB": os.path.join(workdir, "sessions.db"),
+        "ARCHIVE_DB": os.path.join(workdir, "archive.db"),
+    })
+    if args.mode == "webhook":
+        env.update({
+            "WEBHOOK_LISTEN": "127.0.0.1",
+            "WEBHOOK_PORT": str(args.webhook_port),
+            "WEBHOOK_URL": f"http://127.0.0.1:{args.webhook_port}/telegram",
+            "WEBHOOK_PATH": "telegram",
+            "WEBHOOK_SECRET": SECRET,
+        })
+    log = open(os.path.join(workdir, "bot.log"), "wb")
+    proc = subprocess.Popen(
+        [sys.executable, "main.py"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    return proc, log
+
+
+async def run(args) -> dict:
+    api = FakeBotAPI()
+    await api.start(args.api_port)
+
+    workdir = tempfile.mkdtemp(prefix="drill-loadtest-")
+    proc = log = None
+    if not args.attach:
+        proc, log = spawn_bot(args, args.api_port, workdir)
+        print(f"bot pid {proc.pid}, log: {os.path.join(workdir, 'bot.log')}", file=sys.stderr)
+
+    try:
+        await asyncio.wait_for(api.ready.wait(), args.startup_timeout)
+
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        started = time.perf_counter()
+
+        async def crew(i: int):
+            if args.ramp:
+                await asyncio.sleep(args.ramp * i / args.users)
+            return await virtual_user(api, args.first_uid + i, args.think, args.timeout, latencies, errors)
+
+        done = await asyncio.gather(*(crew(i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+        return summarize(latencies, errors, elapsed, args.users, sum(done))
+    finally:
+        if proc is not None:
+            proc.send_signal(signal.SIGINT)
+            try:
+                proc.wait(15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            log.close()
+        await api.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="تست بار ربات با Bot API جعلی")
+    parser.add_argument("--users", type=int, default=20, help="تعداد کاربر همزمان")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--ramp", type=float, default=0.0, help="پخش شروع کاربرها در این چند ثانیه")
+    parser.add_argument("--think", type=float, default=0.0, help="مکث کاربر بین مراحل (ثانیه)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="حداکثر انتظار برای پاسخ هر مرحله")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8443)
+    parser.add_argument("--first-uid", type=int, default=1000)
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    parser.add_argument("--attach", action="store_true",
+                        help="ربات را اجرا نکن؛ به رباتی که خودت با BOT_API_URL به این پورت وصل کرده‌ای")
+    parser.add_argument("--json", help="ذخیره‌ی نتیجه به JSON")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    print_summary(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    return 0 if result["completed"] == result["users"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+# metrics.py
+#
+# شاخص‌های داخلی ربات در قالب متنی Prometheus، روی یک endpoint اختیاری
+# (METRICS_PORT). پیاده‌سازی عمداً کوچک و بدون وابستگی است: هر observe فقط
+# یک bisect و چند جمع است و همه از thread خود event loop صدا زده می‌شوند،
+# پس قفل لازم نیست و روشن ماندنش در production هزینه‌ای ندارد.
+#
+#   METRICS_PORT=9108 python main.py
+#   curl http://127.0.0.1:9108/metrics
+
+import asyncio
+import bisect
+import functools
+import logging
+import os
+import time
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------
+# تنظیمات (از متغیرهای محیطی)
+# -------------------------------
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))       # 0 = خاموش
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+ENABLED = METRICS_PORT > 0
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (50e3, 100e3, 200e3, 400e3, 800e3, 1.6e6, 3.2e6)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}   # labels → [شمارش هر bucket (غیرتجمعی)، جمع، تعداد]
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def collect(self) -> list[str]:
+        lines = []
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = _labels(self.labelnames, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """مقدار لحظه‌ای که هنگام scrape از fn خوانده می‌شود (عدد، یا دیکشنری labels → عدد)."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), fn=None):
+        super().__init__(name, help_text, labelnames)
+        self.fn = fn
+
+    def collect(self) -> list[str]:
+        if self.fn is None:
+            return []
+        value = self.fn()
+        if not isinstance(value, dict):
+            return [f"{self.name} {value}"]
+        return [f"{self.name}{_labels(self.labelnames, k if isinstance(k, tuple) else (k,))} {v}"
+                for k, v in value.items()]
+
+
+REGISTRY = []
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        try:
+            body = metric.collect()
+        except Exception:
+            logger.exception("collecting %s failed", metric.name)
+            continue
+        lines.extend(metric.header())
+        lines.extend(body)
+    return "\n".join(lines) + "\n"
+
+
+# ==========================
+# شاخص‌های ربات
+# ==========================
+
+HANDLER_SECONDS = Histogram(
+    "drill_handler_seconds", "Latency of top-level Telegram handlers.", ("handler",)
+)
+FLOW_SECONDS = Histogram(
+    "drill_flow_seconds", "Latency of conversation step and callback handlers.", ("kind", "key")
+)
+RENDER_SECONDS = Histogram(
+    "drill_pdf_render_seconds", "PDF render time including queueing in the render pool."
+)
+PDF_BYTES = Histogram(
+    "drill_pdf_bytes", "Size of rendered PDFs.", buckets=SIZE_BUCKETS
+)
+PDF_REQUESTS = Counter(
+    "drill_pdf_requests_total", "/pdf requests by outcome.", ("result",)
+)
+BOT_API_SECONDS = Histogram(
+    "drill_bot_api_seconds", "Latency of outbound Bot API calls.", ("method",)
+)
+BOT_API_ERRORS = Counter(
+    "drill_bot_api_errors_total", "Failed outbound Bot API calls.", ("method", "error")
+)
+MESSAGE_EDITS = Counter(
+    "drill_message_edits_total", "Coalesced message edits by outcome (sent, coalesced, dropped).", ("result",)
+)
+OUTBOUND_WAIT = Histogram(
+    "drill_outbound_wait_seconds", "Time outbound requests waited for rate-limit tokens.", ("priority",)
+)
+OUTBOUND_RETRIES = Counter(
+    "drill_outbound_retries_total", "Outbound requests retried after RetryAfter.", ("method",)
+)
+OUTBOUND_QUEUE = Gauge("drill_outbound_queue_depth", "Outbound requests waiting for the global bucket.")
+UPDATE_QUEUE = Gauge("drill_update_queue_depth", "Updates waiting behind an earlier update of the same user.")
+RENDER_QUEUE = Gauge("drill_render_queue_depth", "Render jobs running or waiting.")
+SESSIONS = Gauge("drill_sessions", "Active (in-memory) sessions by conversation step.", ("step",))
+STARTUP = Gauge("drill_startup_seconds", "Time spent in each startup phase.", ("phase",))
+
+
+def flow_hook(kind: str, key: str, elapsed: float):
+    """hook برای fsm.FlowMachine.add_hook"""
+    FLOW_SECONDS.observe(elapsed, kind, key)
+
+
+def timed(name: str):
+    """دکوراتور هندلرهای PTB: زمان هر فراخوانی در drill_handler_seconds."""
+    def wrap(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            started = time.perf_counter()
+            try:
+                return await handler(update, context)
+            finally:
+                HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+        return wrapper
+    return wrap
+
+
+# ==========================
+# درخواست‌های خروجی به Bot API
+# ==========================
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest که زمان و خطای هر متد Bot API را ثبت می‌کند."""
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data, **timeouts)
+        except Exception as e:
+            BOT_API_ERRORS.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            BOT_API_SECONDS.observe(time.perf_counter() - started, api_method)
+        if code >= 400:
+            BOT_API_ERRORS.inc(api_method, str(code))
+        return code, payload
+
+
+# ==========================
+# سرور HTTP
+# ==========================
+
+async def _handle(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    server = await asyncio.start_server(_handle, host, port)
+    logger.info("metrics on http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,135 @@
+# models.py
+from dataclasses import dataclass, field
+
+# ==========================
+# مدل فشرده‌ی گزارش
+# ==========================
+#
+# slots=True: هر نمونه به‌جای __dict__ فقط جای فیلدهایش را دارد؛ برای هزاران
+# جلسه‌ی باز (هر کدام دو شیفت) حافظه چند برابر کمتر از دیکشنری تو در تو است.
+# شکل دیکشنری (to_dict / from_dict) همان ساختار قدیمی user_data است و
+# pdf_generator و ذخیره‌سازی با همان کار می‌کنند.
+
+SHIFT_KEYS = ("day", "night")
+
+# گزینه‌های ثابت فرم (دکمه‌های فلو و ورود یکجا هر دو از همین‌ها می‌خوانند)
+RIGS = {"DB1200": "DB 1200", "DBC": "DBC-S15-A"}   # callback → نام دستگاه
+SIZES = ("BQ", "NQ", "HQ", "PQ")
+MUD_OPTIONS = {
+    "super": "سوپرمیکس",
+    "cmc": "CMC",
+    "sawdust": "خاک اره",
+    "diesel": "گازوئیل",
+}
+
+
+@dataclass(slots=True)
+class Shift:
+    supervisors: list = field(default_factory=list)
+    helpers: list = field(default_factory=list)
+    workshop_bosses: list = field(default_factory=list)
+    start: float | None = None
+    end: float | None = None
+    length: float | None = None
+    size: str | None = None
+    mud: list = field(default_factory=list)
+    water: float | None = None
+    diesel: float | None = None
+    notes: str = ""
+
+    def to_dict(self) -> dict:
+        return {
+            "supervisors": list(self.supervisors),
+            "helpers": list(self.helpers),
+            "workshop_bosses": list(self.workshop_bosses),
+            "start": self.start,
+            "end": self.end,
+            "length": self.length,
+            "size": self.size,
+            "mud": list(self.mud),
+            "water": self.water,
+            "diesel": self.diesel,
+            "notes": self.notes,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict | None):
+        d = d or {}
+        return cls(
+            supervisors=list(d.get("supervisors") or []),
+            helpers=list(d.get("helpers") or []),
+            workshop_bosses=list(d.get("workshop_bosses") or []),
+            start=d.get("start"),
+            end=d.get("end"),
+            length=d.get("length"),
+            size=d.get("size"),
+            mud=list(d.get("mud") or []),
+            water=d.get("water"),
+            diesel=d.get("diesel"),
+            notes=d.get("notes") or "",
+        )
+
+
+@dataclass(slots=True)
+class Report:
+    region: str | None = None
+    borehole: str | None = None
+    rig: str | None = None
+    angle_deg: float | None = None
+    date: str | None = None
+
+    day: Shift = field(default_factory=Shift)
+    night: Shift = field(default_factory=Shift)
+
+    current_shift: str | None = None
+    edit_field: str | None = None  # برای ویرایش متراژ/آب/گازوئیل
+
+    # شناسه‌ی ردیف آرشیو بعد از اولین ثبت؛ ثبت دوباره همان ردیف را به‌روز می‌کند
+    archive_id: int | None = None
+
+    # فقط تا کامل شدن تاریخ لازم‌اند
+    date_year: int | None = None
+    date_month: int | None = None
+
+    def shift(self, key: str) -> Shift:
+        return self.day if key == "day" else self.night
+
+    def to_dict(self) -> dict:
+        d = {
+            "region": self.region,
+            "borehole": self.borehole,
+            "rig": self.rig,
+            "angle_deg": self.angle_deg,
+            "date": self.date,
+            "shifts": {
+                "day": self.day.to_dict(),
+                "night": self.night.to_dict(),
+            },
+            "current_shift": self.current_shift,
+            "edit_field": self.edit_field,
+        }
+        if self.archive_id is not None:
+            d["archive_id"] = self.archive_id
+        if self.date_year is not None:
+            d["date_year"] = self.date_year
+        if self.date_month is not None:
+            d["date_month"] = self.date_month
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        shifts = d.get("shifts") or {}
+        return cls(
+            region=d.get("region"),
+            borehole=d.get("borehole"),
+            rig=d.get("rig"),
+            angle_deg=d.get("angle_deg"),
+            date=d.get("date"),
+            day=Shift.from_dict(shifts.get("day")),
+            night=Shift.from_dict(shifts.get("night")),
+            current_shift=d.get("current_shift"),
+            edit_field=d.get("edit_field"),
+            archive_id=d.get("archive_id"),
+            date_year=d.get("date_year"),
+            date_month=d.get("date_month"),
+        )
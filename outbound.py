@@ -0,0 +1,262 @@
+# outbound.py
+#
+# زمان‌بندی همه‌ی درخواست‌های خروجی به Bot API. به شکل rate_limiter در
+# ApplicationBuilder وصل می‌شود، پس هر reply_text / edit_message_text /
+# reply_document بدون تغییر هندلرها از اینجا می‌گذرد:
+#
+#   - سطل توکن برای هر چت (چت خصوصی و گروه جدا) و یک سطل سراسری
+#   - ترتیب پیام‌ها در هر چت حفظ می‌شود (درخواست بعدی بعد از تمام شدن قبلی)
+#   - در صف سراسری پاسخ‌های تعاملی جلوتر از آپلود PDF هستند
+#   - بعد از RetryAfter همان چت تا پایان مهلت متوقف و درخواست تکرار می‌شود
+
+import asyncio
+import datetime as dt
+import heapq
+import itertools
+import logging
+import os
+import time
+import warnings
+
+from telegram.error import RetryAfter
+from telegram.warnings import PTBDeprecationWarning
+from telegram.ext import BaseRateLimiter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------
+# تنظیمات (از متغیرهای محیطی)
+# -------------------------------
+
+GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))        # پیام در ثانیه برای کل ربات
+# راهنمای تلگرام: در هر چت حدود یک پیام در ثانیه، با اجازه‌ی burstهای کوتاه.
+# کاربر واقعی در این فرم چند ثانیه برای هر جواب وقت می‌گذارد و هر جواب یک تا
+# سه پیام (پاسخ، خلاصه، PDF) دارد؛ burst ده‌تایی یعنی گفتگوی عادی هیچ‌وقت
+# منتظر نمی‌ماند و فقط ارسال پشت‌سرهم طولانی به یک پیام در ثانیه می‌رسد.
+# loadtest.py کاربرهای خیلی سریع‌تر از آدم شبیه‌سازی می‌کند؛ برای اندازه‌گیری
+# تأخیر خود ربات آن‌جا OUTBOUND_CHAT_RATE را بالا ببرید.
+CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))            # پیام در ثانیه برای هر چت خصوصی
+CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", "10"))           # چند پیام پشت‌سرهم بدون انتظار
+GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", str(20 / 60)))  # گروه‌ها: ۲۰ پیام در دقیقه
+MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+
+# وضعیت چتی که این مدت درخواستی نداشته دور ریخته می‌شود (سطلش دوباره پر است)
+IDLE_SECONDS = 60
+
+# اولویت‌ها: عدد کمتر زودتر
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+BULK_ENDPOINTS = frozenset({
+    "sendDocument", "sendPhoto", "sendVideo", "sendAudio", "sendMediaGroup",
+})
+
+
+class TokenBucket:
+    """rate توکن در ثانیه، حداکثر burst توکن؛ pause برای مهلت RetryAfter."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self) -> float:
+        """چند ثانیه تا اینکه یک توکن در دسترس باشد (۰ یعنی همین حالا)."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while (wait := self.delay()) > 0:
+            await asyncio.sleep(wait)
+        self.take()
+
+
+class PriorityGate:
+    """سطل سراسری با صف اولویت‌دار؛ بین هم‌اولویت‌ها به ترتیب رسیدن."""
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self._heap = []
+        self._seq = itertools.count()
+        self._drainer = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    async def acquire(self, priority: int):
+        if not self._heap and self.bucket.delay() == 0:
+            self.bucket.take()
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), fut))
+        if self._drainer is None or self._drainer.done():
+            self._drainer = asyncio.create_task(self._drain())
+        await fut
+
+    async def _drain(self):
+        while self._heap:
+            wait = self.bucket.delay()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, fut = heapq.heappop(self._heap)
+            if fut.done():      # منتظرش لغو شده
+                continue
+            self.bucket.take()
+            fut.set_result(None)
+
+    def close(self):
+        if self._drainer is not None:
+            self._drainer.cancel()
+        for _, _, fut in self._heap:
+            fut.cancel()
+        self._heap.clear()
+
+
+class _Chat:
+    __slots__ = ("lock", "bucket", "last_used")
+
+    def __init__(self, bucket: TokenBucket):
+        self.lock = asyncio.Lock()      # صف FIFO درخواست‌های همین چت
+        self.bucket = bucket
+        self.last_used = time.monotonic()
+
+
+class OutboundScheduler(BaseRateLimiter[int]):
+    """
+    rate limiter برای ApplicationBuilder.rate_limiter.
+
+    rate_limit_args (اختیاری در هر متد Bot) اولویت را صریحاً تعیین می‌کند؛
+    در غیر این صورت ارسال فایل BULK و بقیه INTERACTIVE است. درخواست‌های
+    بدون chat_id (answerCallbackQuery، getMe، ...) فقط مهلت RetryAfter
+    سراسری را رعایت می‌کنند.
+    """
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE,
+                 chat_burst: int = CHAT_BURST, group_rate: float = GROUP_RATE,
+                 max_retries: int = MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        # burst کوچک: در هر پنجره‌ی یک‌ثانیه‌ای حداکثر rate + burst درخواست
+        self.gate = PriorityGate(TokenBucket(global_rate, global_rate / 10))
+        self._chats = {}
+        self._pruned = time.monotonic()
+
+    @classmethod
+    def from_env(cls, workers: int = 1):
+        # با چند worker هر پروسه سهم خودش از سقف سراسری را دارد
+        return cls(GLOBAL_RATE / max(1, workers), CHAT_RATE, CHAT_BURST, GROUP_RATE, MAX_RETRIES)
+
+    def set_global_rate(self, rate: float):
+        """
+        سهم تازه از سقف سراسری؛ dispatcher با اضافه/خارج شدن worker می‌فرستد.
+        توکن‌های جمع‌شده بیشتر از burst جدید دور ریخته می‌شوند.
+        """
+        bucket = self.gate.bucket
+        bucket.delay()      # پر کردن سطل با نرخ قبلی تا همین لحظه
+        bucket.rate = rate
+        bucket.burst = max(1.0, rate / 10)
+        bucket.tokens = min(bucket.tokens, bucket.burst)
+
+    @property
+    def queued(self) -> int:
+        """درخواست‌هایی که منتظر سطل سراسری‌اند."""
+        return len(self.gate)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self.gate.close()
+
+    def _chat(self, chat_id) -> _Chat:
+        now = time.monotonic()
+        if now - self._pruned > IDLE_SECONDS:
+            self._pruned = now
+            for key in [k for k, c in self._chats.items()
+                        if not c.lock.locked() and now - c.last_used > IDLE_SECONDS]:
+                del self._chats[key]
+
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            try:
+                group = int(chat_id) < 0
+            except (TypeError, ValueError):
+                group = True    # @username فقط برای کانال و سوپرگروه
+            bucket = (TokenBucket(self.group_rate, 1) if group
+                      else TokenBucket(self.chat_rate, self.chat_burst))
+            chat = self._chats[chat_id] = _Chat(bucket)
+        chat.last_used = now
+        return chat
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        chat = self._chat(chat_id) if chat_id is not None else None
+        if rate_limit_args is not None:
+            priority = rate_limit_args
+        else:
+            priority = BULK if endpoint in BULK_ENDPOINTS else INTERACTIVE
+
+        # هر تلاش (از جمله تکرار بعد از RetryAfter) دوباره از هر دو سطل توکن
+        # می‌گیرد؛ انتظار مهلت بیرون از قفل چت است و درخواست تکرارشده دوباره
+        # در صف همان چت می‌ایستد (تلگرام پیام رد‌شده را تحویل نداده است).
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._attempt(chat, priority, callback, args, kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = retry_seconds(e) + 0.1
+                metrics.OUTBOUND_RETRIES.inc(endpoint)
+                logger.info("RetryAfter on %s: waiting %.1f s", endpoint, delay)
+                (chat.bucket if chat is not None else self.gate.bucket).pause(delay)
+                await asyncio.sleep(delay)
+
+    async def _attempt(self, chat, priority, callback, args, kwargs):
+        if chat is None:
+            # بدون chat_id (answerCallbackQuery، getMe، ...): فقط مهلت RetryAfter سراسری
+            wait = self.gate.bucket.paused_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            return await callback(*args, **kwargs)
+
+        started = time.perf_counter()
+        # قفل تا پایان خود درخواست نگه داشته می‌شود تا پیام‌های یک چت به ترتیب برسند
+        async with chat.lock:
+            await chat.bucket.acquire()
+            await self.gate.acquire(priority)
+            metrics.OUTBOUND_WAIT.observe(
+                time.perf_counter() - started, PRIORITY_NAMES.get(priority, str(priority))
+            )
+            return await callback(*args, **kwargs)
+
+
+def retry_seconds(error: RetryAfter) -> float:
+    """مهلت RetryAfter به ثانیه؛ retry_after در PTB 22 عدد است (یا timedelta با PTB_TIMEDELTA)."""
+    with warnings.catch_warnings():
+        # هشدار deprecation نوع int؛ هر دو نوع پذیرفته می‌شوند
+        warnings.simplefilter("ignore", PTBDeprecationWarning)
+        value = error.retry_after
+    if isinstance(value, dt.timedelta):
+        return value.total_seconds()
+    return float(value)
@@ -0,0 +1,138 @@
+# pdf_cache.py
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# -------------------------------
+# تنظیمات (از متغیرهای محیطی)
+# -------------------------------
+
+CACHE_BYTES = int(os.getenv("PDF_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+# فیلدهایی که فقط وضعیت گفتگو هستند و در PDF دیده نمی‌شوند
+_SESSION_ONLY = ("current_shift", "edit_field", "archive_id", "date_year", "date_month")
+
+# هزینه‌ی تقریبی هر ورودی جدا از خود PDF (کلید، file_id، ساختار)
+_ENTRY_OVERHEAD = 256
+
+
+def report_key(report_data: dict) -> str:
+    """hash پایدار محتوای گزارش؛ دو گزارش با متن یکسان همیشه یک کلید دارند."""
+    data = {k: v for k, v in report_data.items() if k not in _SESSION_ONLY}
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CachedPDF:
+    __slots__ = ("pdf", "file_id")
+
+    def __init__(self, pdf: bytes, file_id: str | None = None):
+        self.pdf = pdf
+        self.file_id = file_id
+
+    @property
+    def cost(self) -> int:
+        return len(self.pdf) + _ENTRY_OVERHEAD
+
+
+class PDFCache:
+    """
+    PDFهای رندرشده بر اساس hash محتوای گزارش، با حجم محدود (LRU).
+
+    بعد از اولین ارسال، file_id تلگرام هم کنار بایت‌ها نگه داشته می‌شود تا
+    درخواست بعدی همان گزارش نه رندر لازم داشته باشد نه آپلود.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._by_user = {}     # user_id → آخرین کلیدی که برایش ساخته شد
+        self._users = {}       # کلید → user_idهایی که _by_user شان به آن اشاره می‌کند
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(CACHE_BYTES)
+
+    @property
+    def size(self) -> int:
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id: int, key: str) -> CachedPDF | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._link(user_id, key)
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, user_id: int, key: str, pdf: bytes) -> CachedPDF:
+        entry = CachedPDF(pdf)
+        with self._lock:
+            if entry.cost > self.max_bytes:
+                # نگه داشته نمی‌شود، پس چیزی هم برای invalidate نیست
+                return entry
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.cost
+            self._entries[key] = entry
+            self._bytes += entry.cost
+            self._link(user_id, key)
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+        return entry
+
+    def set_file_id(self, key: str, file_id: str | None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.file_id = file_id
+
+    def invalidate_user(self, user_id: int):
+        """
+        گزارش کاربر عوض شده؛ کلید محتوای جدیدش هم فرق دارد. فقط پیوند همین
+        کاربر برداشته می‌شود: کاربر دیگری با گزارش یکسان ممکن است هنوز همان
+        PDF را بخواهد، پس خود ورودی به LRU سپرده می‌شود.
+        """
+        with self._lock:
+            self._unlink(user_id)
+
+    def forget_users(self, user_ids):
+        """جلسه‌ی این کاربرها بیرون رفته؛ خود PDFها تا LRU در کش می‌مانند."""
+        with self._lock:
+            for user_id in user_ids:
+                self._unlink(user_id)
+
+    def _link(self, user_id: int, key: str):
+        if self._by_user.get(user_id) == key:
+            return
+        self._unlink(user_id)
+        self._by_user[user_id] = key
+        self._users.setdefault(key, set()).add(user_id)
+
+    def _unlink(self, user_id: int):
+        key = self._by_user.pop(user_id, None)
+        if key is None:
+            return
+        users = self._users.get(key)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self._users[key]
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.cost
+        for user_id in self._users.pop(key, ()):
+            del self._by_user[user_id]
+
+
+def from_env() -> PDFCache:
+    return PDFCache.from_env()
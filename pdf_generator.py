@@ -1,15 +1,28 @@
 # pdf_generator.py
+import contextlib
+import functools
+import hashlib
+import io
+import logging
 import os
+import re
+import threading
+import time
 
+from typing import Any, Callable, NamedTuple
+
+from reportlab import rl_config
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfdoc import PDFImageXObject
 
 import arabic_reshaper
 from bidi.algorithm import get_display
 
+logger = logging.getLogger(__name__)
+
 # -------------------------------
 # تنظیمات صفحه و گرید
 # -------------------------------
@@ -24,18 +37,19 @@ MARGIN_X = 20
 MARGIN_Y = 20
 
 
+CELL_W = (PAGE_WIDTH - 2 * MARGIN_X) / GRID_COLS
+CELL_H = (PAGE_HEIGHT - 2 * MARGIN_Y) / GRID_ROWS
+
+
 def grid_to_xy(col: float, row: float):
     """
     col: ستون از سمت راست (۰ یعنی نزدیک‌ترین ستون به لبه‌ی راست فرم)
     row: ردیف از بالا
     خروجی: مختصات x, y در PDF
     """
-    cell_w = (PAGE_WIDTH - 2 * MARGIN_X) / GRID_COLS
-    cell_h = (PAGE_HEIGHT - 2 * MARGIN_Y) / GRID_ROWS
-
     # مبدأ از گوشه‌ی بالا-چپ صفحه است ولی ما محور x را از راست در نظر گرفته‌ایم
-    x = PAGE_WIDTH - MARGIN_X - (col + 0.5) * cell_w
-    y = PAGE_HEIGHT - MARGIN_Y - (row + 0.5) * cell_h
+    x = PAGE_WIDTH - MARGIN_X - (col + 0.5) * CELL_W
+    y = PAGE_HEIGHT - MARGIN_Y - (row + 0.5) * CELL_H
     return x, y
 
 
@@ -53,50 +67,381 @@ def register_font():
     pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
 
 
+# بیشتر متن‌های فرم بین گزارش‌ها تکراری‌اند (واحدها، نوع گل، منطقه‌ها)؛
+# پس نتیجه‌ی reshape + bidi در یک LRU محدود نگه داشته می‌شود.
+SHAPE_CACHE_SIZE = int(os.getenv("FA_SHAPE_CACHE_SIZE", "4096"))
+
+
+@functools.lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def _shape_cached(text: str) -> str:
+    reshaped = arabic_reshaper.reshape(text)
+    return get_display(reshaped)
+
+
 def fa_shape(text: str) -> str:
     """شکل‌دهی و bidi برای فارسی/مخلوط"""
     if not text:
         return ""
-    reshaped = arabic_reshaper.reshape(text)
-    return get_display(reshaped)
+    return _shape_cached(text)
+
+
+# عدد ساده (بدون علامت و نماد علمی) در خط راست‌به‌چپ سر جای خودش می‌ماند،
+# پس «عدد + واحد» را می‌شود بدون شکل‌دهی کل رشته ساخت.
+_PLAIN_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def fa_with_unit(number: str, unit: str) -> str:
+    """معادل fa_shape(f"{number} {unit}") که فقط واحد را شکل می‌دهد (و کش می‌کند)."""
+    if _PLAIN_NUMBER.fullmatch(number):
+        return f"{fa_shape(unit)} {number}"
+    return fa_shape(f"{number} {unit}")
+
+
+def shaping_stats() -> dict:
+    """آمار کش شکل‌دهی: hits، misses، اندازه و نرخ hit."""
+    info = _shape_cached.cache_info()
+    total = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "hit_rate": info.hits / total if total else 0.0,
+    }
+
 
+# متن‌های ثابتی که تقریباً در هر گزارش تکرار می‌شوند؛ همین‌جا یک بار شکل می‌گیرند
+STATIC_FA_TEXTS = (
+    "متر",
+    "لیتر",
+    "درجه",
+    "سوپرمیکس",
+    "CMC",
+    "خاک اره",
+    "گازوئیل",
+)
 
-def draw_fa(c: canvas.Canvas, x: float, y: float, text: str, size: int = 12):
-    """نوشتن متن فارسی (یا مخلوط) با سایز مشخص"""
-    c.setFont(FONT_NAME, size)
-    shaped = fa_shape(text)
-    c.drawString(x, y, shaped)
+for _text in STATIC_FA_TEXTS:
+    fa_shape(_text)
 
 
-def draw_en(c: canvas.Canvas, x: float, y: float, text: str, size: int = 12):
-    """نوشتن متن انگلیسی/عدد ساده بدون reshaper"""
-    c.setFont(FONT_NAME, size)
-    c.drawString(x, y, str(text))
+# -------------------------------
+# پروفایل خروجی (اندازه‌ی PDF)
+# -------------------------------
+
+class OutputProfile(NamedTuple):
+    """
+    dpi: سقف رزولوشن پس‌زمینه روی صفحه؛ 0 یعنی JPEG همان‌طور که هست
+    jpeg_quality: کیفیت فشرده‌سازی دوباره‌ی پس‌زمینه (فقط وقتی dpi > 0)
+    grayscale: اگر اسکن فرم عملاً خاکستری است، یک کانال به‌جای سه کانال
+    a85: کدگذاری ASCII85 جریان‌ها (۲۵٪ حجم اضافه، فقط برای کانال‌های ۷ بیتی لازم است)
+    page_compression: فشرده‌سازی جریان صفحه‌ها؛ None یعنی پیش‌فرض reportlab
+    (rl_config.pageCompression)، همان که خروجی قبلی با آن ساخته می‌شد
+    """
+    name: str
+    dpi: int = 0
+    jpeg_quality: int = 0
+    grayscale: bool = False
+    a85: bool = True
+    page_compression: int | None = None
+
+
+OUTPUT_PROFILES = {
+    # همان خروجی قبلی: JPEG اصلی، جریان‌ها با ASCII85
+    "standard": OutputProfile("standard"),
+    # برای لینک‌های ضعیف سر دستگاه: پس‌زمینه‌ی خاکستری و فشرده، جریان‌های باینری
+    "small": OutputProfile(
+        "small",
+        dpi=int(os.getenv("PDF_BG_DPI", "150")),
+        jpeg_quality=int(os.getenv("PDF_BG_QUALITY", "70")),
+        grayscale=True,
+        a85=False,
+        page_compression=1,
+    ),
+}
+
+# small فقط با PDF_PROFILE=small؛ پیش‌فرض همان خروجی قبلی است
+PDF_PROFILE = OUTPUT_PROFILES[os.getenv("PDF_PROFILE", "standard")]
+
+# reportlab کدگذاری جریان‌ها را از rl_config.useA85 (سراسری) هنگام ساختن هر
+# جریان می‌خواند و تنظیم جدایی برای هر canvas ندارد. پس مقدار پروفایل فقط
+# تا وقتی رندری از همین ماژول در جریان است گذاشته می‌شود و بعد از آخرین
+# رندر مقدار قبلی برمی‌گردد (شمارنده، چون رندرها روی چند thread هم‌زمان‌اند).
+_a85_lock = threading.Lock()
+_a85_users = 0
+_a85_saved = None
+
+
+@contextlib.contextmanager
+def stream_encoding(profile: OutputProfile):
+    global _a85_users, _a85_saved
+    with _a85_lock:
+        if _a85_users == 0:
+            _a85_saved = rl_config.useA85
+            rl_config.useA85 = 1 if profile.a85 else 0
+        _a85_users += 1
+    try:
+        yield
+    finally:
+        with _a85_lock:
+            _a85_users -= 1
+            if _a85_users == 0:
+                rl_config.useA85 = _a85_saved
+
+# زیرمجموعه‌سازی فونت لازم نیست جدا انجام شود: TTFont در reportlab فقط
+# گلیف‌های استفاده‌شده را embed می‌کند (نام فونت در PDF: AAAAAA+Vazirmatn-Regular).
+
+# render_pool رندرها را هم‌زمان روی چند thread اجرا می‌کند
+_output = {"renders": 0, "bytes": 0, "last_bytes": 0, "max_bytes": 0}
+_output_lock = threading.Lock()
+
+
+def output_stats() -> dict:
+    """حجم PDFهای رندرشده در این پروسه: تعداد، جمع، آخرین، بیشترین و میانگین."""
+    with _output_lock:
+        stats = dict(_output, profile=PDF_PROFILE.name)
+    stats["mean_bytes"] = stats["bytes"] / stats["renders"] if stats["renders"] else 0.0
+    return stats
+
+
+def _record_output(size: int):
+    with _output_lock:
+        _output["renders"] += 1
+        _output["bytes"] += size
+        _output["last_bytes"] = size
+        _output["max_bytes"] = max(_output["max_bytes"], size)
 
 
 # -------------------------------
-# مختصات فیلدها روی فرم
+# پس‌زمینه‌ی فرم (یک بار در هر پروسه آماده می‌شود)
 # -------------------------------
 
-# هدر (مختصات براساس گریدی که قبلاً تعیین کرده بودیم)
-POS_REGION = (5, 8)     # منطقه
-POS_BOREHOLE = (16, 8)  # شماره گمانه
-POS_RIG = (31, 8)       # دستگاه حفاری
-POS_ANGLE = (38, 8)     # زاویه
-POS_DATE = (45, 8)      # تاریخ
+TEMPLATE_JPG = os.path.join(os.path.dirname(__file__), "form_template.jpg")
+TEMPLATE_PDF = os.path.join(os.path.dirname(__file__), "form_template.pdf")
+
+# auto: قالب PDF فقط وقتی برداری است (نه وقتی فقط یک اسکن را می‌پوشاند)
+# pdf: همیشه قالب PDF؛ jpeg: همیشه تصویر. هر جا قالب PDF نباشد، JPEG.
+BACKGROUND_MODE = os.getenv("PDF_BACKGROUND", "auto")
+
+# بیشترین اختلاف میانگین کانال‌ها که هنوز «خاکستری» حساب می‌شود (نویز JPEG)
+_GRAY_TOLERANCE = 2.0
+
+
+def shrink_jpeg(jpeg_bytes: bytes, profile: OutputProfile) -> bytes:
+    """
+    کوچک کردن پس‌زمینه طبق پروفایل: پایین آوردن رزولوشن تا profile.dpi روی
+    صفحه، خاکستری کردن اسکن‌های بی‌رنگ و فشرده‌سازی دوباره. اگر نتیجه
+    بزرگ‌تر شود همان بایت‌های اصلی برمی‌گردد.
+    """
+    if profile.dpi <= 0:
+        return jpeg_bytes
+
+    try:
+        from PIL import Image, ImageChops, ImageStat
+    except ImportError:
+        logger.warning("Pillow نصب نیست؛ پس‌زمینه‌ی پروفایل %s همان JPEG اصلی است", profile.name)
+        return jpeg_bytes
+
+    image = Image.open(io.BytesIO(jpeg_bytes))
+    image.load()
+
+    max_w = round(PAGE_WIDTH / 72 * profile.dpi)
+    max_h = round(PAGE_HEIGHT / 72 * profile.dpi)
+    if image.width > max_w or image.height > max_h:
+        scale = min(max_w / image.width, max_h / image.height)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS)
+
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if profile.grayscale:
+        r, g, b = image.split()
+        drift = max(
+            ImageStat.Stat(ImageChops.difference(r, g)).mean[0],
+            ImageStat.Stat(ImageChops.difference(g, b)).mean[0],
+        )
+        if drift <= _GRAY_TOLERANCE:
+            image = image.convert("L")
+
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=profile.jpeg_quality or 75, optimize=True)
+    shrunk = out.getvalue()
+    return shrunk if len(shrunk) < len(jpeg_bytes) else jpeg_bytes
+
+
+class FormBackground:
+    """
+    تصویر فرم به شکل یک Image XObject آماده.
+    بایت‌های JPEG همان‌طور که هست (DCTDecode) داخل PDF می‌رود؛ نه decode
+    می‌شود و نه برای هر گزارش دوباره از دیسک خوانده می‌شود.
+    """
+
+    def __init__(self, jpeg_bytes: bytes):
+        self.name = "FormBg" + hashlib.sha1(jpeg_bytes).hexdigest()[:16]
+        self.size = len(jpeg_bytes)
+        xobj = PDFImageXObject(self.name)
+        xobj.loadImageFromJPEG(io.BytesIO(jpeg_bytes))
+        xobj.XObjects = None
+        # reportlab روی هر شیء ثبت‌شده نام داخلی سند را می‌نویسد؛ پس برای هر
+        # سند یک پوسته‌ی تازه می‌سازیم که همین ویژگی‌ها (و همان بایت‌ها) را دارد.
+        self._attrs = dict(vars(xobj))
+
+    def stamp(self, c: canvas.Canvas):
+        """
+        کشیدن پس‌زمینه روی کل صفحه.
+        معادل c.drawImage است، فقط بدون ساختن دوباره‌ی XObject و بدون
+        getRGBData که drawImage برای امضای ImageReader روی کل تصویر اجرا می‌کند.
+        """
+        doc = c._doc
+        reg_name = doc.getXObjectName(self.name)
+        if reg_name not in doc.idToObject:
+            xobj = PDFImageXObject.__new__(PDFImageXObject)
+            xobj.__dict__.update(self._attrs)
+            doc.Reference(xobj, reg_name)
+            doc.addForm(self.name, xobj)
+
+        c._currentPageHasImages = 1
+        c.saveState()
+        c.scale(PAGE_WIDTH, PAGE_HEIGHT)
+        c._code.append("/%s Do" % reg_name)
+        c.restoreState()
+        c._formsinuse.append(self.name)
+
+
+@functools.lru_cache(maxsize=None)
+def load_background(mode: str = BACKGROUND_MODE, profile: OutputProfile = PDF_PROFILE):
+    """
+    پس‌زمینه‌ی آماده‌ی فرم (قالب PDF یا JPEG، طبق mode)؛ اگر هیچ فایل قالبی
+    نباشد None. یک بار در هر پروسه ساخته می‌شود.
+    """
+    # PDFImageXObject فیلترهای جریان را همان لحظه‌ی ساختن برمی‌دارد
+    with stream_encoding(profile):
+        if mode in ("auto", "pdf") and os.path.exists(TEMPLATE_PDF):
+            import pdf_template
+            background = pdf_template.load(TEMPLATE_PDF, PAGE_SIZE, vector_only=mode == "auto")
+            if background is not None:
+                return background
+
+        if not os.path.exists(TEMPLATE_JPG):
+            return None
+        with open(TEMPLATE_JPG, "rb") as f:
+            return FormBackground(shrink_jpeg(f.read(), profile))
+
+
+# -------------------------------
+# چیدمان فرم (جدول اعلانی)
+# -------------------------------
 
-# ستون شیفت روز در جدول پارامترهای حفاری
-# اگر دیدی هنوز یک ستون چپ/راست است، فقط این عدد را یکی دو واحد کم/زیاد کن.
-DAY_COL = 11
+class Field(NamedTuple):
+    """
+    یک فیلد روی فرم.
+    key: مسیر داده در report_data با نقطه (مثل "shifts.day.start") یا تابعی روی report_data
+    fmt: نام قالب‌بندی در FORMATTERS
+    width: عرض مجاز برای شکستن خط (pt)؛ فقط برای fmt="paragraph"
+    """
+    key: Any
+    col: float
+    row: float
+    fmt: str = "fa"
+    size: int = 12
+    align: str = "left"     # left یا right (برای متن‌های راست‌چین داخل کادر توضیحات)
+    label: str = ""
+    max_lines: int = 1
+    width: float = 0.0
+
+
+# ستون‌های شیفت روز/شب/جمع در جدول پارامترهای حفاری
+# اگر دیدی هنوز یک ستون چپ/راست است، فقط این عددها را کمی کم/زیاد کن.
+DAY_COL = 12.6
+NIGHT_COL = 17.4
+TOTAL_COL = 22.2
+
+# ردیف‌های جدول پارامترها (از «متراژ شروع» تا «گازوئیل»)
+PARAM_ROWS = {
+    "start": 11.5,
+    "end": 13.4,
+    "length": 15.25,
+    "size": 17.15,
+    "mud": 19.0,
+    "water": 20.9,
+    "diesel": 22.8,
+}
+
+# کادر توضیحات: پرسنل و توضیحات هر شیفت، راست‌چین
+NOTES_COL = 23.4
+NOTES_WIDTH = 420
+NOTES_ROWS = {"day": 11.5, "night": 24.0}
+NOTES_LEADING = 1.3     # فاصله‌ی سطرها بر حسب ردیف گرید
+NOTES_SIZE = 9
+
+
+def _shift_column(shift: str, col: float):
+    return (
+        Field(f"shifts.{shift}.start", col, PARAM_ROWS["start"], "meters", 10),
+        Field(f"shifts.{shift}.end", col, PARAM_ROWS["end"], "meters", 10),
+        Field(f"shifts.{shift}.length", col, PARAM_ROWS["length"], "meters_2f", 10),
+        Field(f"shifts.{shift}.size", col, PARAM_ROWS["size"], "en", 10),
+        Field(f"shifts.{shift}.mud", col, PARAM_ROWS["mud"], "mud", 8),
+        Field(f"shifts.{shift}.water", col, PARAM_ROWS["water"], "liters", 10),
+        Field(f"shifts.{shift}.diesel", col, PARAM_ROWS["diesel"], "liters", 10),
+    )
+
+
+def _shift_total(key: str):
+    def total(report_data: dict):
+        values = [
+            ((report_data.get("shifts") or {}).get(shift) or {}).get(key)
+            for shift in ("day", "night")
+        ]
+        values = [v for v in values if v is not None]
+        return sum(values) if values else None
+    return total
+
+
+def _total_column(col: float):
+    return (
+        Field(_shift_total("length"), col, PARAM_ROWS["length"], "meters_2f", 10),
+        Field(_shift_total("water"), col, PARAM_ROWS["water"], "liters", 10),
+        Field(_shift_total("diesel"), col, PARAM_ROWS["diesel"], "liters", 10),
+    )
+
+
+def _shift_notes(shift: str, row: float, title: str):
+    step = NOTES_LEADING
+    return (
+        Field(f"shifts.{shift}.supervisors", NOTES_COL, row, "names", NOTES_SIZE, "right",
+              f"مسئول(ین) شیفت {title}: "),
+        Field(f"shifts.{shift}.helpers", NOTES_COL, row + step, "names", NOTES_SIZE, "right",
+              "پرسنل کمکی: "),
+        Field(f"shifts.{shift}.workshop_bosses", NOTES_COL, row + 2 * step, "names", NOTES_SIZE, "right",
+              "سرپرست کارگاه: "),
+        Field(f"shifts.{shift}.notes", NOTES_COL, row + 3 * step, "paragraph", NOTES_SIZE, "right",
+              f"توضیحات شیفت {title}: ", max_lines=6, width=NOTES_WIDTH),
+    )
+
+
+LAYOUT = (
+    # هدر
+    Field("region", 5, 6.8, "fa", 13),
+    Field("borehole", 16, 6.8, "en", 13),   # شماره گمانه معمولاً انگلیسی است
+    Field("rig", 31, 6.8, "en", 13),
+    Field("angle_deg", 39, 6.8, "degrees", 13),
+    Field("date", 46, 6.8, "en", 13),       # تاریخ به صورت روز/ماه/سال از bot_flow می‌آید
+
+    # جدول پارامترهای حفاری
+    *_shift_column("day", DAY_COL),
+    *_shift_column("night", NIGHT_COL),
+    *_total_column(TOTAL_COL),
+
+    # پرسنل و توضیحات
+    *_shift_notes("day", NOTES_ROWS["day"], "روز"),
+    *_shift_notes("night", NOTES_ROWS["night"], "شب"),
+)
 
-POS_DAY_START = (DAY_COL, 11)    # متراژ شروع
-POS_DAY_END = (DAY_COL, 12.3)    # متراژ پایان
-POS_DAY_LEN = (DAY_COL, 13.3)    # متراژ هر شیفت
-POS_DAY_SIZE = (DAY_COL, 14.3)   # سایز حفاری
-POS_DAY_MUD = (DAY_COL, 15.3)    # نوع گل حفاری
-POS_DAY_WATER = (DAY_COL, 16.3)  # آب مصرفی
-POS_DAY_DIESEL = (DAY_COL, 17.3) # گازوئیل
 
+# -------------------------------
+# قالب‌بندی مقدارها
+# -------------------------------
 
 def format_mud_list(muds):
     if not muds:
@@ -104,89 +449,180 @@ def format_mud_list(muds):
     return " + ".join(muds)
 
 
+def wrap_text(text: str, size: int, width: float, max_lines: int):
+    """
+    شکستن متن منطقی (قبل از bidi) به چند سطر با عرض حداکثر width.
+    اگر جا کم باشد سطر آخر با «…» بریده می‌شود.
+    """
+    lines = []
+    current = ""
+    for word in text.split():
+        candidate = f"{current} {word}" if current else word
+        if current and pdfmetrics.stringWidth(candidate, FONT_NAME, size) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        lines.append(current)
+
+    if len(lines) > max_lines:
+        lines = lines[:max_lines]
+        lines[-1] += " …"
+    return lines
+
+
+# هر قالب‌بندی: (Field, مقدار) → سطرهای آماده‌ی رسم (شکل‌داده‌شده)
+FORMATTERS = {
+    "fa": lambda f, v: (fa_shape(f"{f.label}{v}"),),
+    "en": lambda f, v: (f"{f.label}{v}",),
+    "meters": lambda f, v: (fa_with_unit(str(v), "متر"),),
+    "meters_2f": lambda f, v: (fa_with_unit(f"{v:.2f}", "متر"),),
+    "liters": lambda f, v: (fa_with_unit(str(v), "لیتر"),),
+    "degrees": lambda f, v: (fa_with_unit(str(int(round(v))), "درجه"),),
+    "mud": lambda f, v: (fa_shape(format_mud_list(v)),),
+    "names": lambda f, v: (fa_shape(f.label + "، ".join(v)),),
+    "paragraph": lambda f, v: tuple(
+        fa_shape(line) for line in wrap_text(f.label + v, f.size, f.width, f.max_lines)
+    ),
+}
+
+
+# -------------------------------
+# کامپایل چیدمان به برنامه‌ی رندر
+# -------------------------------
+
+class RenderOp(NamedTuple):
+    """یک دستور آماده: مختصات مطلق، فونت و توابع از قبل انتخاب‌شده."""
+    get: Callable[[dict], Any]
+    format: Callable[[Any], tuple]
+    x: float
+    y: float
+    size: int
+    leading: float
+    draw: Callable
+
+
+def _compile_getter(key):
+    if callable(key):
+        return key
+
+    parts = tuple(key.split("."))
+
+    def get(report_data: dict):
+        value = report_data
+        for part in parts:
+            value = value.get(part) if value else None
+        return value
+    return get
+
+
+def compile_layout(layout=LAYOUT):
+    """تبدیل جدول اعلانی به برنامه‌ی رندر؛ فقط یک بار هنگام import اجرا می‌شود."""
+    plan = []
+    for field in layout:
+        x, y = grid_to_xy(field.col, field.row)
+        formatter = FORMATTERS[field.fmt]
+        plan.append(RenderOp(
+            get=_compile_getter(field.key),
+            format=functools.partial(formatter, field),
+            x=x,
+            y=y,
+            size=field.size,
+            leading=NOTES_LEADING * CELL_H,
+            draw=canvas.Canvas.drawRightString if field.align == "right" else canvas.Canvas.drawString,
+        ))
+    return tuple(plan)
+
+
+RENDER_PLAN = compile_layout()
+
+
+def _is_empty(value) -> bool:
+    return value is None or (isinstance(value, (str, list, tuple)) and not value)
+
+
 # -------------------------------
 # تابع اصلی تولید PDF
 # -------------------------------
 
-def generate_pdf(report_data: dict, output_path: str = "daily_drilling_report.pdf") -> str:
+def generate_pdf(report_data: dict, output_path: str | None = None):
     """
     report_data همان user_data[user_id] در bot_flow.py است.
+
+    بدون output_path، PDF در حافظه ساخته می‌شود و bytes برمی‌گردد
+    (هر فراخوانی بافر خودش را دارد و هیچ فایلی روی دیسک نوشته نمی‌شود).
+    با output_path، فایل روی دیسک نوشته و همان مسیر برگردانده می‌شود.
     """
-    register_font()
-    c = canvas.Canvas(output_path, pagesize=PAGE_SIZE)
-
-    # پس‌زمینه‌ی فرم
-    template_jpg = os.path.join(os.path.dirname(__file__), "form_template.jpg")
-    if os.path.exists(template_jpg):
-        bg = ImageReader(template_jpg)
-        c.drawImage(bg, 0, 0, width=PAGE_WIDTH, height=PAGE_HEIGHT)
-
-    # ------------ هدر ------------
-    region = report_data.get("region") or ""
-    borehole = report_data.get("borehole") or ""
-    rig = report_data.get("rig") or ""
-    angle = report_data.get("angle_deg")
-    date_str = report_data.get("date") or ""
-
-    if region:
-        x, y = grid_to_xy(*POS_REGION)
-        draw_fa(c, x, y, str(region), size=13)
-
-    if borehole:
-        x, y = grid_to_xy(*POS_BOREHOLE)
-        # شماره گمانه معمولاً انگلیسی است
-        draw_en(c, x, y, borehole, size=13)
-
-    if rig:
-        x, y = grid_to_xy(*POS_RIG)
-        draw_en(c, x, y, rig, size=13)
-
-    if angle is not None:
-        x, y = grid_to_xy(*POS_ANGLE)
-        txt = f"{int(round(angle))} درجه"
-        draw_fa(c, x, y, txt, size=13)
-
-    if date_str:
-        x, y = grid_to_xy(*POS_DATE)
-        # تاریخ به صورت روز/ماه/سال از bot_flow می‌آید
-        draw_en(c, x, y, date_str, size=13)
-
-    # ------------ شیفت روز در جدول پارامترها ------------
-    shifts = report_data.get("shifts", {})
-    day = shifts.get("day", {})
-
-    if day.get("start") is not None:
-        x, y = grid_to_xy(*POS_DAY_START)
-        draw_fa(c, x, y, f"{day['start']} متر")
-
-    if day.get("end") is not None:
-        x, y = grid_to_xy(*POS_DAY_END)
-        draw_fa(c, x, y, f"{day['end']} متر")
-
-    if day.get("length") is not None:
-        x, y = grid_to_xy(*POS_DAY_LEN)
-        draw_fa(c, x, y, f"{day['length']:.2f} متر")
-
-    if day.get("size"):
-        x, y = grid_to_xy(*POS_DAY_SIZE)
-        draw_en(c, x, y, str(day["size"]))
-
-    mud_text = format_mud_list(day.get("mud") or [])
-    if mud_text:
-        x, y = grid_to_xy(*POS_DAY_MUD)
-        draw_fa(c, x, y, mud_text)
-
-    if day.get("water") is not None:
-        x, y = grid_to_xy(*POS_DAY_WATER)
-        draw_fa(c, x, y, f"{day['water']} لیتر")
-
-    if day.get("diesel") is not None:
-        x, y = grid_to_xy(*POS_DAY_DIESEL)
-        draw_fa(c, x, y, f"{day['diesel']} لیتر")
-
-    # فعلاً توضیحات و پرسنل را روی فرم نمی‌ریزیم
-    # تا مطمئن شویم ستون‌ها و متن‌ها کاملاً درست شده‌اند.
-
-    c.showPage()
-    c.save()
+    if output_path is None:
+        return render_pdf(report_data).getvalue()
+
+    with open(output_path, "wb") as f:
+        render_pdf(report_data, f)
     return output_path
+
+
+# گزارش دورریختنی برای warm_up؛ هر نوع فیلد (عدد، متن فارسی، فهرست، پاراگراف) را دارد
+_WARMUP_SHIFT = {
+    "supervisors": ["سرپرست"], "helpers": ["کمک"], "workshop_bosses": ["سرکارگاه"],
+    "start": 100.0, "end": 110.5, "length": 10.5, "size": "NQ",
+    "mud": ["سوپرمیکس", "CMC"], "water": 3000.0, "diesel": 150.0,
+    "notes": "گرم کردن رندر",
+}
+_WARMUP_REPORT = {
+    "region": "منطقه", "borehole": "BH-1", "rig": "DB 1200", "angle_deg": 90.0,
+    "date": "01/01/1403", "shifts": {"day": _WARMUP_SHIFT, "night": _WARMUP_SHIFT},
+}
+
+
+def warm_up() -> float:
+    """
+    ثبت فونت، آماده کردن پس‌زمینه و یک رندر کامل دورریختنی، تا اولین /pdf
+    واقعی هزینه‌ی شروع سرد را ندهد. در آمار حجم خروجی شمرده نمی‌شود.
+    مدت را (ثانیه) برمی‌گرداند.
+    """
+    started = time.perf_counter()
+    register_font()
+    load_background()
+    render_pdf(_WARMUP_REPORT, record=False)
+    return time.perf_counter() - started
+
+
+def render_pdf(report_data: dict, out=None, record: bool = True):
+    """
+    رندر گزارش داخل یک شیء فایل‌مانند (پیش‌فرض: BytesIO تازه).
+    خروجی همان شیء است که اشاره‌گرش به ابتدای داده برگشته است.
+    record=False: در آمار حجم خروجی شمرده نمی‌شود (warm_up).
+    """
+    if out is None:
+        out = io.BytesIO()
+
+    register_font()
+    with stream_encoding(PDF_PROFILE):
+        c = canvas.Canvas(out, pagesize=PAGE_SIZE, pageCompression=PDF_PROFILE.page_compression)
+
+        # پس‌زمینه‌ی فرم (آماده‌شده‌ی کش؛ هر گزارش فقط لایه‌ی متن خودش را می‌سازد)
+        background = load_background()
+        if background is not None:
+            background.stamp(c)
+
+        # ------------ فیلدها: یک حلقه روی برنامه‌ی کامپایل‌شده ------------
+        current_size = None
+        for op in RENDER_PLAN:
+            value = op.get(report_data)
+            if _is_empty(value):
+                continue
+            if op.size != current_size:
+                c.setFont(FONT_NAME, op.size)
+                current_size = op.size
+            y = op.y
+            for line in op.format(value):
+                op.draw(c, op.x, y, line)
+                y -= op.leading
+
+        c.showPage()
+        c.save()
+    if record:
+        _record_output(out.tell())
+    out.seek(0)
+    return out
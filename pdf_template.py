@@ -0,0 +1,226 @@
+# pdf_template.py
+#
+# فرم PDF (form_template.pdf) به شکل یک Form XObject برای reportlab.
+# صفحه‌ی قالب یک بار در هر پروسه با pypdf خوانده و به بایت‌های آماده‌ی PDF
+# تبدیل می‌شود؛ هر سند فقط چند پوسته‌ی سبک ثبت می‌کند که همان بایت‌ها را
+# می‌نویسند (ارجاع‌ها هنگام نوشتن به شماره‌ی شیء همان سند تبدیل می‌شوند).
+
+import hashlib
+import io
+import logging
+import zlib
+
+from reportlab.pdfbase.pdfdoc import PDFObject
+
+logger = logging.getLogger(__name__)
+
+# قالبی که محتوایش فقط همین عملگرهاست و فقط تصویر می‌کشد، در واقع همان
+# اسکن است و برتری‌ای بر JPEG ندارد
+_RASTER_OPS = {b"q", b"Q", b"cm", b"Do"}
+
+# کلیدهایی که به درخت صفحه‌ها یا ساختار سند برمی‌گردند و داخل فرم معنی ندارند
+_SKIP_KEYS = {"/Parent", "/Annots", "/StructParents", "/StructParent"}
+
+# بیشترین اختلاف نسبی نسبت ابعاد قالب و صفحه. چیدمان فیلدها روی کل صفحه است،
+# پس قالبی با نسبت دیگر یا کشیده می‌شود یا با فیلدها جور درنمی‌آید
+ASPECT_TOLERANCE = 0.01
+
+
+class _RawObject(PDFObject):
+    """
+    شیء PDF از پیش سریال‌شده. chunks ترکیبی از bytes و اندیس اشیای دیگر
+    قالب است که با names به نام ثبت‌شده در سند تبدیل می‌شود.
+    """
+
+    def __init__(self, chunks, names):
+        self.chunks = chunks
+        self.names = names
+
+    def format(self, document):
+        numbers = document.idToObjectNumberAndVersion
+        return b"".join(
+            chunk if isinstance(chunk, bytes) else b"%d %d R" % numbers[self.names[chunk]]
+            for chunk in self.chunks
+        )
+
+
+def _leaf(obj) -> bytes:
+    buf = io.BytesIO()
+    obj.write_to_stream(buf)
+    return buf.getvalue()
+
+
+class _Flattener:
+    """پیمایش گراف اشیای pypdf از یک ریشه و تبدیل هر شیء غیرمستقیم به chunks."""
+
+    def __init__(self):
+        self.objects = []
+        self._seen = {}    # (idnum, generation) → اندیس در objects
+
+    def add(self, chunks) -> int:
+        self.objects.append(chunks)
+        return len(self.objects) - 1
+
+    def indirect(self, ref) -> int:
+        key = (ref.idnum, ref.generation)
+        if key not in self._seen:
+            # اول جا رزرو می‌شود تا ارجاع‌های حلقوی به همین اندیس برسند
+            index = self._seen[key] = self.add(None)
+            chunks = []
+            self.emit(ref.get_object(), chunks)
+            self.objects[index] = chunks
+        return self._seen[key]
+
+    def emit(self, obj, out: list):
+        from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+        if isinstance(obj, IndirectObject):
+            out.append(self.indirect(obj))
+        elif isinstance(obj, StreamObject):
+            self.emit_stream(obj, obj._data, out)
+        elif isinstance(obj, DictionaryObject):
+            self.emit_dict(obj, out)
+        elif isinstance(obj, ArrayObject):
+            out.append(b"[")
+            for item in obj:
+                self.emit(item, out)
+                out.append(b" ")
+            out.append(b"]")
+        else:
+            out.append(_leaf(obj))
+
+    def emit_dict(self, d, out: list, skip=(), extra: bytes = b""):
+        out.append(b"<<")
+        for key, value in d.items():
+            if key in _SKIP_KEYS or key in skip:
+                continue
+            out.append(_leaf(key) + b" ")
+            self.emit(value, out)
+            out.append(b" ")
+        out.append(extra + b">>")
+
+    def emit_stream(self, d, data: bytes, out: list, extra: bytes = b""):
+        self.emit_dict(d, out, skip=("/Length",), extra=extra + b"/Length %d" % len(data))
+        out.append(b"\nstream\n" + data + b"\nendstream")
+
+
+def _inherited(page, key):
+    node = page
+    while node is not None:
+        if key in node:
+            return node[key]
+        node = node.get("/Parent")
+        node = node.get_object() if node is not None else None
+    return None
+
+
+class TemplateForm:
+    """
+    صفحه‌ی اول قالب PDF به شکل Form XObject آماده.
+    vector: آیا قالب چیزی جز تصویر (خط، متن، مسیر) دارد.
+    """
+
+    def __init__(self, objects: list, form_index: int, bbox, page_size, vector: bool):
+        digest = hashlib.sha1(repr(objects).encode()).hexdigest()[:16]
+        self.name = "FormTpl" + digest
+        self.objects = objects
+        self.form_index = form_index
+        self.bbox = bbox
+        self.page_size = page_size
+        self.vector = vector
+
+    @classmethod
+    def from_page(cls, page, page_size):
+        from pypdf.generic import DictionaryObject, NameObject
+
+        rotate = int(_inherited(page, "/Rotate") or 0)
+        if rotate % 360:
+            raise ValueError(f"قالب چرخیده (/Rotate {rotate}) پشتیبانی نمی‌شود")
+
+        bbox = [float(v) for v in page.mediabox]
+        aspect = (bbox[2] - bbox[0]) / (bbox[3] - bbox[1])
+        page_aspect = page_size[0] / page_size[1]
+        if abs(aspect / page_aspect - 1) > ASPECT_TOLERANCE:
+            raise ValueError(
+                f"نسبت ابعاد قالب ({aspect:.3f}) با صفحه ({page_aspect:.3f}) یکی نیست"
+            )
+        contents = page.get_contents()
+        data = contents.get_data() if contents is not None else b""
+        resources = _inherited(page, "/Resources")
+        resources = resources.get_object() if resources is not None else DictionaryObject()
+
+        flat = _Flattener()
+        form = DictionaryObject({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/Resources"): resources,
+        })
+        chunks = []
+        flat.emit_stream(form, zlib.compress(data), chunks, extra=(
+            b"/FormType 1 /BBox [%s] /Filter /FlateDecode " % " ".join("%.4f" % v for v in bbox).encode()
+        ))
+        form_index = flat.add(chunks)
+
+        xobjects = resources.get("/XObject")
+        xobjects = xobjects.get_object() if xobjects is not None else {}
+        only_images = all(
+            xobj.get_object().get("/Subtype") == "/Image" for xobj in xobjects.values()
+        )
+        operators = {op for _, op in contents.operations} if contents is not None else set()
+        vector = not (operators <= _RASTER_OPS and only_images)
+
+        return cls(flat.objects, form_index, bbox, page_size, vector)
+
+    @property
+    def size(self) -> int:
+        """حجم تقریبی بایت‌هایی که قالب به هر PDF اضافه می‌کند."""
+        return sum(len(c) for chunks in self.objects for c in chunks if isinstance(c, bytes))
+
+    def stamp(self, c):
+        """
+        کشیدن قالب روی صفحه (هم‌ارز FormBackground.stamp در pdf_generator)؛
+        با یک مقیاس برای هر دو محور و وسط‌چین، تا فرم کشیده نشود.
+        """
+        doc = c._doc
+        reg_name = doc.getXObjectName(self.name)
+        if reg_name not in doc.idToObject:
+            names = [f"{self.name}.{i}" for i in range(len(self.objects))]
+            names[self.form_index] = reg_name
+            for chunks, name in zip(self.objects, names):
+                doc.Reference(_RawObject(chunks, names), name)
+
+        x0, y0, x1, y1 = self.bbox
+        page_w, page_h = self.page_size
+        scale = min(page_w / (x1 - x0), page_h / (y1 - y0))
+        dx = (page_w - (x1 - x0) * scale) / 2 - x0 * scale
+        dy = (page_h - (y1 - y0) * scale) / 2 - y0 * scale
+        c._currentPageHasImages = 1
+        c.saveState()
+        c.transform(scale, 0, 0, scale, dx, dy)
+        c._code.append("/%s Do" % reg_name)
+        c.restoreState()
+        c._formsinuse.append(self.name)
+
+
+def load(path: str, page_size, vector_only: bool = False) -> TemplateForm | None:
+    """
+    قالب آماده از صفحه‌ی اول path؛ اگر pypdf نصب نباشد یا فایل خوانده نشود None.
+    با vector_only، قالبی که فقط یک تصویر را می‌پوشاند هم None است.
+    """
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PyPdfError
+    except ImportError:
+        logger.warning("pypdf نصب نیست؛ پس‌زمینه از JPEG")
+        return None
+
+    try:
+        form = TemplateForm.from_page(PdfReader(path).pages[0], page_size)
+    except (OSError, ValueError, KeyError, IndexError, PyPdfError):
+        logger.exception("خواندن قالب PDF %s ممکن نشد؛ پس‌زمینه از JPEG", path)
+        return None
+
+    if vector_only and not form.vector:
+        logger.info("قالب %s فقط یک تصویر است؛ پس‌زمینه از JPEG", path)
+        return None
+    return form
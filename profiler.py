@@ -0,0 +1,253 @@
+# profiler.py
+#
+# پروفایل در محل، بدون debugger: با /profile (فقط ادمین‌ها) یا سیگنال،
+# درصدی از آپدیت‌ها زیر cProfile اجرا می‌شوند و tracemalloc رشد حافظه
+# (به‌خصوص جلسه‌ها) را نسبت به لحظه‌ی روشن شدن ثبت می‌کند. خروجی‌ها در
+# PROFILE_DIR با چرخش (فقط PROFILE_KEEP فایل آخر از هر نوع) نوشته می‌شوند.
+#
+#   kill -USR1 <pid>   روشن/خاموش
+#   kill -USR2 <pid>   نوشتن خلاصه‌ها بدون خاموش کردن
+#
+# وقتی خاموش است هزینه‌ی هر هندلر فقط یک بررسی پرچم است.
+
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import signal
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------
+# تنظیمات (از متغیرهای محیطی)
+# -------------------------------
+
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(",", " ").split()}
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.05"))
+KEEP = int(os.getenv("PROFILE_KEEP", "10"))
+TRACE_FRAMES = int(os.getenv("PROFILE_TRACE_FRAMES", "1"))
+SAMPLE_WAIT = float(os.getenv("PROFILE_SAMPLE_WAIT", "10"))   # انتظار dump برای تمام شدن نمونه‌ی فعال
+TOP = 30
+
+# فایل‌هایی که رشد حافظه‌شان «جلسه‌ها» حساب می‌شود
+SESSION_FILES = ("*session_store.py", "*models.py", "*bot_flow.py")
+
+
+class Profiler:
+    """
+    نمونه‌برداری cProfile از هندلرها + tracemalloc.
+
+    cProfile روی thread خود event loop فعال می‌شود، پس وقتی هندلر نمونه
+    await می‌کند کارهای دیگر همان loop هم در نمونه می‌آیند؛ برای پیدا کردن
+    نقطه‌های داغ کافی است و در هر لحظه حداکثر یک نمونه فعال است.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, sample_rate: float = SAMPLE_RATE, keep: int = KEEP):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.enabled = False
+        self.started_at = None
+        self.sessions = None      # تابعی که تعداد جلسه‌ها به تفکیک مرحله را می‌دهد
+        self._prof = None         # یک Profile که همه‌ی نمونه‌ها در آن جمع می‌شوند
+        self._samples = 0
+        self._active = False
+        self._idle = asyncio.Event()  # وقتی نمونه‌ای در حال اجرا نیست set است
+        self._idle.set()
+        self._baseline = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(PROFILE_DIR, SAMPLE_RATE, KEEP)
+
+    # ---------- روشن / خاموش ----------
+
+    def start(self, sample_rate: float | None = None):
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, sample_rate))
+        self._prof = cProfile.Profile()
+        self._samples = 0
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+        self._baseline = tracemalloc.take_snapshot()
+        self.started_at = time.time()
+        self.enabled = True
+        logger.info("profiling on (sample rate %.3f)", self.sample_rate)
+
+    async def stop(self) -> list[str]:
+        if not self.enabled:
+            return []
+        self.enabled = False
+        collected = self._collect(await self._settle())
+        self._prof = None
+        self._baseline = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        logger.info("profiling off")
+        return await asyncio.to_thread(self._write_all, collected)
+
+    def toggle(self):
+        if self.enabled:
+            asyncio.ensure_future(self.stop())
+        else:
+            self.start()
+
+    # ---------- نمونه‌برداری ----------
+
+    def profiled(self, handler):
+        """پوشش هندلر PTB؛ وقتی خاموش است مستقیم همان هندلر را await می‌کند."""
+        async def wrapper(update, context):
+            if not self.enabled or self._active or random.random() >= self.sample_rate:
+                return await handler(update, context)
+            return await self._sample(handler, update, context)
+
+        wrapper.__name__ = getattr(handler, "__name__", "handler")
+        wrapper.__wrapped__ = handler
+        return wrapper
+
+    async def _sample(self, handler, update, context):
+        prof = self._prof
+        self._active = True
+        self._idle.clear()
+        prof.enable()
+        try:
+            return await handler(update, context)
+        finally:
+            prof.disable()
+            self._active = False
+            self._idle.set()
+            self._samples += 1
+
+    async def _settle(self) -> bool:
+        """
+        صبر تا نمونه‌ی در حال اجرا تمام شود (حداکثر SAMPLE_WAIT ثانیه).
+        pstats.Stats روی Profile فعال create_stats را صدا می‌زند که پروفایلر
+        را وسط نمونه خاموش می‌کند؛ False یعنی آمار CPU این بار نوشته نشود.
+        """
+        deadline = time.monotonic() + SAMPLE_WAIT
+        while self._active:
+            remaining = deadline - time.monotonic()
+            try:
+                await asyncio.wait_for(self._idle.wait(), max(0.0, remaining))
+            except asyncio.TimeoutError:
+                logger.warning("profile sample still running; CPU stats skipped")
+                return False
+        return True
+
+    # ---------- خروجی ----------
+
+    def _path(self, kind: str, stamp: str, ext: str) -> str:
+        return os.path.join(self.directory, f"{kind}-{stamp}-{os.getpid()}.{ext}")
+
+    def _rotate(self, kind: str, ext: str):
+        files = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(kind + "-") and name.endswith("." + ext)
+        )
+        for name in files[:-self.keep] if self.keep > 0 else ():
+            os.remove(os.path.join(self.directory, name))
+
+    def _collect(self, cpu: bool = True):
+        """
+        برداشت سریع روی thread خود loop: آمار cProfile، snapshot حافظه و
+        تعداد جلسه‌ها. قالب‌بندی و نوشتن (که کند است) بعداً در thread جدا.
+        cpu فقط وقتی True است که هیچ نمونه‌ای در حال اجرا نباشد (_settle).
+        """
+        stats = None
+        if cpu and self._prof is not None and self._samples:
+            stats = pstats.Stats(self._prof)
+        snapshot = None
+        if tracemalloc.is_tracing() and self._baseline is not None:
+            snapshot = (tracemalloc.take_snapshot(), self._baseline, tracemalloc.get_traced_memory())
+        sessions = self.sessions() if self.sessions is not None else None
+        return stats, self._samples, snapshot, sessions
+
+    async def dump(self) -> list[str]:
+        """نوشتن خلاصه‌ی CPU و حافظه بدون بستن event loop؛ مسیر فایل‌ها را برمی‌گرداند."""
+        return await asyncio.to_thread(self._write_all, self._collect(await self._settle()))
+
+    def _write_all(self, collected) -> list[str]:
+        stats, samples, snapshot, sessions = collected
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        paths = []
+
+        if stats is not None:
+            prof_path = self._path("cpu", stamp, "prof")
+            stats.dump_stats(prof_path)
+            paths.append(prof_path)
+
+            out = io.StringIO()
+            out.write(f"samples: {samples}  sample rate: {self.sample_rate}\n\n")
+            summary = pstats.Stats(prof_path, stream=out)
+            summary.sort_stats("cumulative").print_stats(TOP)
+            summary.sort_stats("tottime").print_stats(TOP)
+            paths.append(self._write("cpu", stamp, out.getvalue()))
+            self._rotate("cpu", "prof")
+
+        if snapshot is not None:
+            paths.append(self._write("mem", stamp, self._memory_summary(*snapshot, sessions)))
+
+        for path in paths:
+            logger.info("profile written: %s", path)
+        return paths
+
+    def _write(self, kind: str, stamp: str, text: str) -> str:
+        path = self._path(kind, stamp, "txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        self._rotate(kind, "txt")
+        return path
+
+    def _memory_summary(self, snapshot, baseline, traced, sessions) -> str:
+        ignore = (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        )
+        snapshot = snapshot.filter_traces(ignore)
+        current, peak = traced
+
+        lines = [
+            f"since: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at))}",
+            f"traced: {current / 1024:.1f} KiB (peak {peak / 1024:.1f} KiB)",
+        ]
+        if sessions is not None:
+            lines.append(f"sessions: {sum(sessions.values())} {dict(sorted(sessions.items()))}")
+
+        lines.append("\n== growth by allocation site ==")
+        for stat in snapshot.compare_to(baseline, "lineno")[:TOP]:
+            lines.append(str(stat))
+
+        # رشد داده‌ی جلسه‌ها (جانشین user_data): فقط تخصیص‌هایی که از این فایل‌ها آمده‌اند
+        session_filter = [tracemalloc.Filter(True, pattern) for pattern in SESSION_FILES]
+        lines.append("\n== session data growth ==")
+        for stat in snapshot.filter_traces(session_filter).compare_to(
+            baseline.filter_traces(session_filter), "traceback"
+        )[:10]:
+            lines.append(str(stat))
+            lines.extend("    " + line for line in stat.traceback.format()[-4:])
+        return "\n".join(lines) + "\n"
+
+    def status(self) -> str:
+        if not self.enabled:
+            return "profiling off"
+        return (
+            f"profiling on since {time.strftime('%H:%M:%S', time.localtime(self.started_at))}, "
+            f"sample rate {self.sample_rate}, {self._samples} samples"
+        )
+
+    def install_signals(self, loop):
+        """SIGUSR1 روشن/خاموش، SIGUSR2 نوشتن خلاصه‌ها."""
+        loop.add_signal_handler(signal.SIGUSR1, self.toggle)
+        loop.add_signal_handler(signal.SIGUSR2, lambda: asyncio.ensure_future(self.dump()))
+
+
+def is_admin(user_id: int) -> bool:
+    return user_id in ADMIN_IDS
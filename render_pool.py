@@ -0,0 +1,125 @@
+# render_pool.py
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# -------------------------------
+# تنظیمات (از متغیرهای محیطی)
+# -------------------------------
+
+POOL_KIND = os.getenv("PDF_POOL_KIND", "thread")          # thread یا process
+POOL_WORKERS = int(os.getenv("PDF_POOL_WORKERS", "2"))
+QUEUE_SIZE = int(os.getenv("PDF_QUEUE_SIZE", "8"))        # کارهای منتظر، جدا از کارهای در حال اجرا
+RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "30"))
+
+
+def _render(report_data: dict) -> bytes:
+    # pdf_generator (reportlab، arabic_reshaper، bidi) اولین بار داخل worker
+    # import می‌شود، نه هنگام راه‌اندازی ربات
+    import pdf_generator
+    return pdf_generator.generate_pdf(report_data)
+
+
+def _warm_up() -> float:
+    import pdf_generator
+    return pdf_generator.warm_up()
+
+
+class RenderBusy(Exception):
+    """صف رندر پر است؛ کاربر باید کمی بعد دوباره تلاش کند."""
+
+
+class RenderTimeout(Exception):
+    """رندر در زمان مجاز تمام نشد."""
+
+
+class RenderPool:
+    """
+    رندر PDF بیرون از event loop، روی thread pool یا process pool.
+
+    تعداد کارهای همزمان (در حال اجرا + منتظر) محدود است؛ وقتی پر باشد
+    render فوراً RenderBusy می‌دهد به‌جای اینکه صف بی‌انتها رشد کند.
+    """
+
+    def __init__(self, kind: str = "thread", workers: int = 2,
+                 queue_size: int = 8, timeout: float = 30.0):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"نوع pool نامعتبر: {kind}")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, queue_size)
+        self.timeout = timeout
+        self._executor = None
+        self._pending = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(POOL_KIND, POOL_WORKERS, QUEUE_SIZE, RENDER_TIMEOUT)
+
+    @property
+    def depth(self) -> int:
+        """تعداد کارهایی که هنوز تمام نشده‌اند (در حال اجرا + منتظر)."""
+        return self._pending
+
+    def _get_executor(self):
+        # executor تنبل ساخته می‌شود تا import این ماژول هزینه‌ای نداشته باشد
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn: فرزندها سوکت‌ها و threadهای ربات را به ارث نمی‌برند
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="pdf-render",
+                )
+        return self._executor
+
+    async def render(self, report_data: dict) -> bytes:
+        if self._pending >= self.capacity:
+            raise RenderBusy()
+
+        loop = asyncio.get_running_loop()
+        fut = self._get_executor().submit(_render, report_data)
+
+        # شمارنده وقتی کم می‌شود که کار واقعاً تمام شود، نه وقتی منتظرش تسلیم شد؛
+        # کاری که timeout خورده هنوز یک worker را اشغال کرده است.
+        self._pending += 1
+        fut.add_done_callback(lambda _f: self._job_done_threadsafe(loop))
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(fut), self.timeout)
+        except asyncio.TimeoutError:
+            fut.cancel()
+            raise RenderTimeout() from None
+
+    async def warm_up(self) -> float:
+        """
+        آماده کردن workerها پیش از اولین /pdf: import، فونت، پس‌زمینه و یک
+        رندر دورریختنی. در process pool هر worker جدا گرم می‌شود (تقریبی:
+        executor کارها را بین workerهای آزاد پخش می‌کند). مدت کل را برمی‌گرداند.
+        """
+        started = time.perf_counter()
+        executor = self._get_executor()
+        count = self.workers if self.kind == "process" else 1
+        await asyncio.gather(*(
+            asyncio.wrap_future(executor.submit(_warm_up)) for _ in range(count)
+        ))
+        return time.perf_counter() - started
+
+    def _job_done_threadsafe(self, loop):
+        # از thread خود executor صدا زده می‌شود
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._job_done)
+
+    def _job_done(self):
+        self._pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,267 @@
+# session_store.py
+import abc
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from models import Report
+
+# -------------------------------
+# تنظیمات (از متغیرهای محیطی)
+# -------------------------------
+
+STORE_KIND = os.getenv("SESSION_STORE", "memory")             # memory یا sqlite
+STORE_PATH = os.getenv("SESSION_DB", "sessions.db")
+FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "0.5"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(24 * 3600)))          # ثانیه
+SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "600"))
+
+
+class SessionStore(abc.ABC):
+    """
+    وضعیت گفتگوی هر کاربر: مرحله‌ی فعلی (step) و گزارش نیمه‌کاره (models.Report).
+
+    هندلرها داده را درجا تغییر می‌دهند؛ set_step و set_data جلسه را «تغییرکرده»
+    علامت می‌زنند و اگر هندلری بدون عوض کردن مرحله داده را تغییر داد،
+    باید touch را صدا بزند.
+    """
+
+    @abc.abstractmethod
+    def get_step(self, user_id: int):
+        ...
+
+    @abc.abstractmethod
+    def set_step(self, user_id: int, step: str):
+        ...
+
+    @abc.abstractmethod
+    def get_data(self, user_id: int):
+        ...
+
+    @abc.abstractmethod
+    def set_data(self, user_id: int, data: Report):
+        ...
+
+    def touch(self, user_id: int):
+        """داده‌ی user_id درجا عوض شده است."""
+
+    @abc.abstractmethod
+    def delete(self, user_id: int):
+        ...
+
+    def evict_idle(self, ttl: float) -> list:
+        """بیرون کردن جلسه‌هایی که ttl ثانیه دست نخورده‌اند؛ user_idهایشان را برمی‌گرداند."""
+        return []
+
+    def count_by_step(self) -> dict:
+        """تعداد جلسه‌های فعال (در حافظه) به تفکیک مرحله."""
+        return {}
+
+    def flush(self):
+        """نوشتن همه‌ی تغییرات معوق (برای backendهای ماندگار)."""
+
+    def close(self):
+        self.flush()
+
+
+class MemorySessionStore(SessionStore):
+    """همه‌چیز در حافظه‌ی همین پروسه؛ با ری‌استارت پاک می‌شود."""
+
+    def __init__(self):
+        self._steps = {}
+        self._data = {}
+        self._seen = {}     # user_id → آخرین تغییر (time.monotonic)
+
+    def get_step(self, user_id: int):
+        return self._steps.get(user_id)
+
+    def set_step(self, user_id: int, step: str):
+        self._steps[user_id] = step
+        self.touch(user_id)
+
+    def get_data(self, user_id: int):
+        return self._data.get(user_id)
+
+    def set_data(self, user_id: int, data: Report):
+        self._data[user_id] = data
+        self.touch(user_id)
+
+    def touch(self, user_id: int):
+        self._seen[user_id] = time.monotonic()
+
+    def delete(self, user_id: int):
+        self._steps.pop(user_id, None)
+        self._data.pop(user_id, None)
+        self._seen.pop(user_id, None)
+
+    def count_by_step(self) -> dict:
+        counts = {}
+        for step in list(self._steps.values()):
+            counts[step] = counts.get(step, 0) + 1
+        return counts
+
+    def _idle_users(self, ttl: float):
+        deadline = time.monotonic() - ttl
+        return [user_id for user_id, seen in self._seen.items() if seen <= deadline]
+
+    def evict_idle(self, ttl: float) -> list:
+        # در حافظه جای دیگری برای نگه داشتن نیست؛ جلسه‌ی رهاشده پاک می‌شود
+        idle = self._idle_users(ttl)
+        for user_id in idle:
+            self.delete(user_id)
+        return idle
+
+
+class SQLiteSessionStore(MemorySessionStore):
+    """
+    جلسه‌ها در SQLite (حالت WAL) ماندگارند و بعد از ری‌استارت برمی‌گردند.
+
+    خواندن از کش حافظه است و نوشتن write-behind: هندلر فقط کاربر را dirty
+    علامت می‌زند و یک thread پس‌زمینه هر FLUSH_INTERVAL ثانیه همه‌ی
+    جلسه‌های dirty را در یک تراکنش می‌نویسد. پس هزینه‌ی fsync به ازای هر
+    پیام پرداخت نمی‌شود؛ در بدترین حالت (کرش) تغییرات همان بازه‌ی کوتاه از دست می‌رود.
+    """
+
+    def __init__(self, path: str = STORE_PATH, flush_interval: float = FLUSH_INTERVAL):
+        super().__init__()
+        self.path = path
+        self.flush_interval = flush_interval
+
+        # _lock فقط مجموعه‌های dirty را می‌پاید و کوتاه نگه داشته می‌شود؛
+        # _db_lock اتصال SQLite را، تا touch هندلرها هیچ‌وقت پشت commit نماند.
+        # ترتیب گرفتن همیشه _db_lock و بعد _lock است.
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._dirty = set()
+        self._deleted = set()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " user_id INTEGER PRIMARY KEY,"
+            " step TEXT,"
+            " data TEXT,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="session-flush", daemon=True)
+        self._flusher.start()
+
+    # ---------- خواندن (کش، و در صورت نبودن، بارگذاری از دیسک) ----------
+
+    def _load(self, user_id: int):
+        if user_id in self._steps or user_id in self._data or user_id in self._deleted:
+            return
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT step, data FROM sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return
+        step, data = row
+        if step is not None:
+            self._steps[user_id] = step
+        if data is not None:
+            self._data[user_id] = Report.from_dict(json.loads(data))
+        self._seen[user_id] = time.monotonic()
+
+    def get_step(self, user_id: int):
+        self._load(user_id)
+        return super().get_step(user_id)
+
+    def get_data(self, user_id: int):
+        self._load(user_id)
+        return super().get_data(user_id)
+
+    # ---------- نوشتن (write-behind) ----------
+
+    def touch(self, user_id: int):
+        super().touch(user_id)
+        with self._lock:
+            self._deleted.discard(user_id)
+            self._dirty.add(user_id)
+
+    def delete(self, user_id: int):
+        super().delete(user_id)
+        with self._lock:
+            self._dirty.discard(user_id)
+            self._deleted.add(user_id)
+
+    def evict_idle(self, ttl: float) -> list:
+        # جلسه روی دیسک می‌ماند و فقط از کش حافظه بیرون می‌رود؛
+        # اگر کاربر برگردد، _load دوباره از SQLite می‌خواندش. روی event loop
+        # صدا زده می‌شود، پس خودش flush (و fsync) نمی‌کند: جلسه‌ی dirty این
+        # دور می‌ماند و thread نوشتن تا دور بعد روی دیسکش برده است.
+        evicted = []
+        with self._lock:
+            for user_id in self._idle_users(ttl):
+                if user_id in self._dirty:
+                    continue
+                self._steps.pop(user_id, None)
+                self._data.pop(user_id, None)
+                self._seen.pop(user_id, None)
+                evicted.append(user_id)
+        return evicted
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        # _db_lock از برداشتن snapshot تا commit نگه داشته می‌شود: دو flush
+        # هم‌زمان (thread نوشتن و close/handoff) نمی‌توانند snapshot قدیمی‌تر را
+        # بعد از جدیدتر بنویسند، و _load جلسه‌ای را که در راه دیسک است نیمه نمی‌خواند.
+        with self._db_lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        with self._lock:
+            if not self._dirty and not self._deleted:
+                return
+            dirty, self._dirty = self._dirty, set()
+            deleted, self._deleted = self._deleted, set()
+
+            now = time.time()
+            rows = []
+            for user_id in dirty:
+                data = self._data.get(user_id)
+                if data is None:
+                    continue
+                # to_dict فقط فیلدها و کپی لیست‌ها را می‌خواند و خطا نمی‌دهد؛ اگر
+                # هندلر همین لحظه گزارش را عوض کند، touch/set_step بعدی جلسه را
+                # دوباره dirty می‌کند و دور بعد نسخه‌ی کامل نوشته می‌شود.
+                payload = json.dumps(data.to_dict(), ensure_ascii=False)
+                rows.append((user_id, self._steps.get(user_id), payload, now))
+
+        with self._conn:
+            if rows:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO sessions (user_id, step, data, updated_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+            if deleted:
+                self._conn.executemany(
+                    "DELETE FROM sessions WHERE user_id = ?",
+                    [(user_id,) for user_id in deleted],
+                )
+
+    def close(self):
+        self._stop.set()
+        self._flusher.join()
+        self.flush()
+        self._conn.close()
+
+
+def from_env() -> SessionStore:
+    if STORE_KIND == "sqlite":
+        return SQLiteSessionStore(STORE_PATH, FLUSH_INTERVAL)
+    if STORE_KIND == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"SESSION_STORE نامعتبر: {STORE_KIND}")
@@ -0,0 +1,319 @@
+# sharding.py
+#
+# حالت چند-worker: یک پروسه‌ی dispatcher آپدیت‌ها را از تلگرام می‌گیرد
+# (polling یا webhook، مثل حالت عادی) و هر آپدیت را بر اساس hash سازگار
+# effective_user.id به یکی از پروسه‌های worker می‌فرستد. هر worker یک
+# Application کامل با همان هندلرهاست و آپدیت‌های هر کاربر را به ترتیب رسیدن
+# پردازش می‌کند؛ پس گفتگوی هر کاربر مرتب و روی یک worker می‌ماند.
+#
+# جلسه‌ها باید در SQLite باشند (SESSION_STORE=sqlite) تا با اضافه/خارج کردن
+# worker، کاربری که جابه‌جا می‌شود گزارش نیمه‌کاره‌اش را از دیسک بردارد.
+# SIGTTIN یک worker اضافه می‌کند و SIGTTOU یکی را drain می‌کند؛ سقف سراسری
+# ارسال به Bot API هر بار دوباره بین workerهای زنده تقسیم می‌شود. SIGUSR1 و
+# SIGUSR2 (پروفایل) از dispatcher به همه‌ی workerها فرستاده می‌شوند.
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, TypeHandler
+
+import bot_app
+import metrics
+import outbound
+import session_store
+
+logger = logging.getLogger(__name__)
+
+VIRTUAL_NODES = 64
+HANDOFF_TIMEOUT = 30.0
+
+
+# ==========================
+# hash سازگار
+# ==========================
+
+def _hash(key) -> int:
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    حلقه‌ی hash سازگار با گره‌های مجازی.
+    با اضافه/حذف یک worker فقط حدود 1/N کاربرها صاحب جدید پیدا می‌کنند.
+    """
+
+    def __init__(self, vnodes: int = VIRTUAL_NODES):
+        self.vnodes = vnodes
+        self._points = []    # hashهای مرتب
+        self._owners = []    # صاحب هر نقطه، هم‌ترتیب با _points
+
+    def add(self, node):
+        for i in range(self.vnodes):
+            h = _hash(f"{node}#{i}")
+            pos = bisect.bisect(self._points, h)
+            self._points.insert(pos, h)
+            self._owners.insert(pos, node)
+
+    def remove(self, node):
+        keep = [(h, n) for h, n in zip(self._points, self._owners) if n != node]
+        self._points = [h for h, _ in keep]
+        self._owners = [n for _, n in keep]
+
+    def get(self, key):
+        if not self._points:
+            raise LookupError("هیچ workerی در حلقه نیست")
+        pos = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[pos]
+
+    @property
+    def nodes(self) -> set:
+        return set(self._owners)
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+# ==========================
+# پروسه‌ی worker
+# ==========================
+
+def worker_main(worker_id: int, inbox, acks):
+    # Ctrl+C به کل گروه پروسه می‌رسد؛ worker فقط با پیام stop از dispatcher بسته می‌شود
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # سیگنال پروفایل که dispatcher پیش از بالا آمدن loop بفرستد پروسه را نکشد
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_worker_loop(worker_id, inbox, acks))
+
+
+async def _worker_loop(worker_id: int, inbox, acks):
+    app = bot_app.build_application(with_updater=False)
+    await app.initialize()
+    await app.start()
+
+    # هر worker شاخص‌های خودش را روی METRICS_PORT + 1 + شماره‌اش می‌دهد
+    metrics_server = None
+    if metrics.ENABLED:
+        metrics_server = await metrics.start_server(metrics.METRICS_PORT + 1 + worker_id)
+
+    loop = asyncio.get_running_loop()
+    bot_app.profiler.install_signals(loop)
+    bot_app.schedule_warm_up(app)
+    try:
+        while True:
+            kind, payload = await loop.run_in_executor(None, inbox.get)
+
+            if kind == "update":
+                # از صف خود Application، تا کاربرهای این worker هم موازی و
+                # هر کاربر به ترتیب (PerUserUpdateProcessor) پردازش شوند
+                await app.update_queue.put(Update.de_json(payload, app.bot))
+
+            elif kind == "rate":
+                # سهم این worker از سقف سراسری ارسال، با تغییر تعداد workerها
+                bot_app.outbound.set_global_rate(payload)
+
+            elif kind == "flush":
+                # جابه‌جایی کاربرها: اول همه‌ی آپدیت‌های رسیده کامل پردازش
+                # می‌شوند، بعد همه‌چیز روی دیسک و کش خالی، تا صاحب جدید هر
+                # کاربر نسخه‌ی تازه را از SQLite بخواند.
+                await app.update_queue.join()
+                await asyncio.to_thread(bot_app.store.flush)
+                bot_app.pdfs.forget_users(bot_app.store.evict_idle(0))
+                acks.put((worker_id, payload))
+
+            elif kind == "stop":
+                await app.update_queue.join()
+                break
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        await app.stop()
+        await app.shutdown()
+        await bot_app.on_shutdown(app)
+        acks.put((worker_id, "stopped"))
+
+
+# ==========================
+# dispatcher
+# ==========================
+
+class _Worker:
+    def __init__(self, worker_id: int, ctx, acks):
+        self.id = worker_id
+        self.inbox = ctx.Queue()
+        self.process = ctx.Process(
+            target=worker_main,
+            args=(worker_id, self.inbox, acks),
+            name=f"bot-worker-{worker_id}",
+        )
+        self.process.start()
+
+
+class ShardedDispatcher:
+    def __init__(self, workers: int):
+        # spawn: workerها هیچ اتصال و threadی از dispatcher به ارث نمی‌برند
+        self._ctx = multiprocessing.get_context("spawn")
+        self._acks = self._ctx.Queue()
+        self._ring = HashRing()
+        self._workers = {}
+        self._next_id = 0
+        self._handoff_seq = 0
+
+        # وقتی clear است (حین جابه‌جایی کاربرها) مسیریابی منتظر می‌ماند
+        self._resume = asyncio.Event()
+        self._resume.set()
+        self._rebalance_lock = asyncio.Lock()
+
+        for _ in range(workers):
+            worker = self._spawn()
+            self._ring.add(worker.id)
+        self._share_rate(self._workers.values(), len(self._workers))
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._next_id, self._ctx, self._acks)
+        self._workers[worker.id] = worker
+        self._next_id += 1
+        return worker
+
+    def _share_rate(self, workers, count: int):
+        """سقف سراسری ارسال (OUTBOUND_GLOBAL_RATE) بین count worker تقسیم می‌شود."""
+        rate = outbound.GLOBAL_RATE / max(1, count)
+        for worker in workers:
+            worker.inbox.put(("rate", rate))
+
+    # ---------- مسیریابی ----------
+
+    async def route(self, update: Update, context):
+        await self._resume.wait()
+        user = update.effective_user
+        key = user.id if user is not None else update.update_id
+        worker = self._workers[self._ring.get(key)]
+        worker.inbox.put(("update", update.to_dict()))
+        raise ApplicationHandlerStop
+
+    # ---------- اضافه/خارج کردن worker ----------
+
+    async def _wait_acks(self, token, count: int):
+        loop = asyncio.get_running_loop()
+        got = 0
+        while got < count:
+            worker_id, ack = await loop.run_in_executor(None, self._acks.get, True, HANDOFF_TIMEOUT)
+            if ack == token:
+                got += 1
+
+    async def _handoff(self, change) -> bool:
+        """
+        مکث مسیریابی، flush همه‌ی workerها (بعد از آپدیت‌هایی که قبلاً گرفته‌اند)،
+        اعمال تغییر حلقه و ادامه‌ی مسیریابی. False یعنی flush به موقع تمام نشد
+        و حلقه دست نخورد.
+        """
+        async with self._rebalance_lock:
+            self._resume.clear()
+            try:
+                self._handoff_seq += 1
+                token = self._handoff_seq
+                live = [self._workers[node] for node in self._ring.nodes]
+                for worker in live:
+                    worker.inbox.put(("flush", token))
+                try:
+                    await self._wait_acks(token, len(live))
+                except queue.Empty:
+                    return False
+                change()
+                return True
+            finally:
+                self._resume.set()
+
+    async def add_worker(self):
+        # اول سهم workerهای فعلی کم می‌شود، بعد worker تازه شروع می‌کند؛ جمع
+        # سهم‌ها هیچ لحظه‌ای از سقف سراسری بیشتر نمی‌شود
+        count = len(self._workers) + 1
+        self._share_rate(self._workers.values(), count)
+        worker = self._spawn()
+        self._share_rate([worker], count)
+        if not await self._handoff(lambda: self._ring.add(worker.id)):
+            # worker تازه هیچ کاربری نگرفته؛ پروسه‌اش بسته می‌شود تا یتیم نماند
+            logger.error("handoff timed out; worker %d not added", worker.id)
+            await self._stop_worker(self._workers.pop(worker.id))
+            self._share_rate(self._workers.values(), len(self._workers))
+            return
+        logger.info("worker %d added (%d active)", worker.id, len(self._ring))
+
+    async def drain_worker(self):
+        if len(self._ring) <= 1:
+            logger.warning("آخرین worker را نمی‌شود drain کرد")
+            return
+        worker_id = max(self._ring.nodes)
+        if not await self._handoff(lambda: self._ring.remove(worker_id)):
+            # کاربرهایش هنوز به همین worker می‌رسند؛ پس باید زنده بماند
+            logger.error("handoff timed out; worker %d kept", worker_id)
+            return
+        await self._stop_worker(self._workers.pop(worker_id))
+        self._share_rate(self._workers.values(), len(self._workers))
+        logger.info("worker %d drained (%d active)", worker_id, len(self._ring))
+
+    def forward_signal(self, signum: int):
+        """SIGUSR1/SIGUSR2 (پروفایل) روی dispatcher به همه‌ی workerها می‌رسد."""
+        for worker in list(self._workers.values()):
+            try:
+                os.kill(worker.process.pid, signum)
+            except (ProcessLookupError, TypeError):
+                # worker تمام شده یا هنوز pid ندارد
+                pass
+        logger.info("signal %s forwarded to %d workers", signal.Signals(signum).name, len(self._workers))
+
+    async def _stop_worker(self, worker: _Worker):
+        worker.inbox.put(("stop", None))
+        await asyncio.get_running_loop().run_in_executor(None, worker.process.join, HANDOFF_TIMEOUT)
+        if worker.process.is_alive():
+            logger.error("worker %d did not stop; terminating", worker.id)
+            worker.process.terminate()
+
+    async def stop_all(self):
+        for worker in list(self._workers.values()):
+            await self._stop_worker(worker)
+        self._workers.clear()
+
+
+def run_sharded(workers: int):
+    if session_store.STORE_KIND != "sqlite":
+        raise SystemExit("حالت چند-worker به SESSION_STORE=sqlite نیاز دارد.")
+
+    dispatcher = None
+
+    async def on_start(app):
+        nonlocal dispatcher
+        dispatcher = ShardedDispatcher(workers)
+        app.add_handler(TypeHandler(Update, dispatcher.route), group=-1)
+
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTTIN, lambda: asyncio.ensure_future(dispatcher.add_worker()))
+        loop.add_signal_handler(signal.SIGTTOU, lambda: asyncio.ensure_future(dispatcher.drain_worker()))
+        # dispatcher هندلری را پروفایل نمی‌کند؛ kill -USR1 <pid dispatcher> پروفایل workerهاست
+        for signum in (signal.SIGUSR1, signal.SIGUSR2):
+            loop.add_signal_handler(signum, dispatcher.forward_signal, signum)
+
+    async def on_stop(app):
+        if dispatcher is not None:
+            await dispatcher.stop_all()
+        # import bot_app در این پروسه هم store (SQLite و نخ flush)، آرشیو و
+        # ستونی را باز کرده؛ بعد از خروج workerها همان‌ها بسته می‌شوند
+        await bot_app.on_shutdown(app)
+
+    # dispatcher خودش هندلر گفتگو و JobQueue ندارد؛ فقط آپدیت‌ها را پخش می‌کند
+    app = (
+        bot_app.application_builder()
+        .job_queue(None)
+        .post_init(on_start)
+        .post_shutdown(on_stop)
+        .build()
+    )
+    bot_app.run_application(app)
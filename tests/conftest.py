@@ -0,0 +1,19 @@
+# tests/conftest.py
+#
+# ماژول‌های ربات تنظیماتشان را هنگام import از متغیرهای محیطی می‌خوانند (و
+# bot_flow همان لحظه آرشیو و جلسه‌ها را باز می‌کند)؛ پس پیش از هر import،
+# همه‌چیز به حافظه و یک پوشه‌ی موقت هدایت می‌شود.
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_TMP = tempfile.mkdtemp(prefix="drill-tests-")
+os.environ["ARCHIVE_DB"] = os.path.join(_TMP, "archive.db")
+os.environ["SESSION_STORE"] = "memory"
+os.environ["PROFILE_DIR"] = os.path.join(_TMP, "profiles")
+os.environ["METRICS_PORT"] = "0"
+os.environ.pop("COLUMNAR_DIR", None)
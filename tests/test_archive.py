@@ -0,0 +1,93 @@
+import pytest
+
+import archive
+from models import Report, Shift
+
+
+def make_report(borehole="BH-1", rig="DB 1200", length=10.0, water=1000.0, mud=("سوپرمیکس",)):
+    return Report(
+        region="سنگان", borehole=borehole, rig=rig, angle_deg=60, date="05/07/1403",
+        day=Shift(start=100.0, end=100.0 + length, length=length, size="NQ",
+                  mud=list(mud), water=water, diesel=50.0),
+    )
+
+
+@pytest.fixture
+def arc(tmp_path):
+    arc = archive.ReportArchive(str(tmp_path / "archive.db"))
+    yield arc
+    arc.close()
+
+
+def test_add_twice_updates_the_same_row(arc):
+    exported = []
+    arc.add_exporter(lambda report_id, report: exported.append(report_id))
+    report = make_report()
+
+    first = arc.add(1, report)
+    second = arc.add(1, report)
+
+    assert first == second == report.archive_id
+    assert len(arc.query("borehole", "BH-1")) == 1
+    assert exported == [first, first]
+
+
+def test_rearchive_does_not_recount_rollups(arc):
+    report = make_report()
+    for _ in range(3):
+        arc.add(1, report)
+
+    stats = arc.stats("borehole", "BH-1")
+    assert stats.meters == pytest.approx(10.0)
+    assert stats.shifts == 1
+    assert stats.mud == {"سوپرمیکس": 1}
+    assert arc.stats("rig", "DB 1200").shifts == 1
+
+
+def test_rearchive_replaces_previous_contribution(arc):
+    other = make_report(length=5.0)
+    arc.add(2, other)
+    report = make_report()
+    arc.add(1, report)
+
+    report.day.length = 12.0
+    report.day.water = 800.0
+    report.day.mud = ["CMC"]
+    arc.add(1, report)
+
+    stats = arc.stats("borehole", "BH-1")
+    assert stats.meters == pytest.approx(17.0)
+    assert stats.water == pytest.approx(1800.0)
+    assert stats.shifts == 2
+    assert stats.mud == {"سوپرمیکس": 1, "CMC": 1}
+
+
+def test_rearchive_moves_contribution_to_new_key(arc):
+    report = make_report()
+    arc.add(1, report)
+
+    report.borehole = "BH-2"
+    report.rig = "DBC-S15-A"
+    arc.add(1, report)
+
+    assert arc.stats("borehole", "BH-1") is None
+    assert arc.stats("rig", "DB 1200") is None
+    assert arc.stats("borehole", "BH-2").meters == pytest.approx(10.0)
+    assert arc.stats("rig", "DBC-S15-A").shifts == 1
+
+
+def test_incremental_rollups_match_rebuild(arc):
+    reports = [make_report(borehole=f"BH-{i % 3}", length=float(i + 1)) for i in range(6)]
+    for r in reports:
+        arc.add(1, r)
+    reports[0].day.length = 40.0
+    arc.add(1, reports[0])
+
+    incremental = sorted(arc.fleet("borehole"))
+    arc.rebuild_stats()
+    rebuilt = sorted(arc.fleet("borehole"))
+
+    assert len(incremental) == len(rebuilt)
+    for a, b in zip(incremental, rebuilt):
+        assert a.key == b.key and a.shifts == b.shifts and a.mud == b.mud
+        assert a.meters == pytest.approx(b.meters)
@@ -0,0 +1,161 @@
+import json
+
+import pytest
+
+import bulk_entry
+from fsm import InvalidInput
+from models import Report
+
+MESSAGE = """
+منطقه: سنگان
+گمانه: BH-12
+دستگاه: db1200
+زاویه: 60
+تاریخ: 1403/07/05
+[روز]
+مسئول: علی، رضا
+کمکی: حسن
+سرپرست: مهدی
+شروع: 120.5
+پایان: 134
+سایز: nq
+گل: سوپرمیکس + CMC
+آب: 3500
+گازوئیل: 180
+توضیحات: بدون مشکل
+شیفت شب:
+شروع: 134
+پایان: 150
+سایز: HQ
+آب: 3000
+گازوئیل: 150
+"""
+
+
+def session_free(report: Report) -> dict:
+    data = report.to_dict()
+    for key in ("current_shift", "edit_field", "archive_id", "date_year", "date_month"):
+        data.pop(key, None)
+    return data
+
+
+def test_parse_text_builds_full_report():
+    report = bulk_entry.parse_text(MESSAGE)
+
+    assert (report.region, report.borehole, report.rig) == ("سنگان", "BH-12", "DB 1200")
+    assert report.angle_deg == 60
+    assert report.date == "05/07/1403"
+    assert report.day.supervisors == ["علی", "رضا"]
+    assert report.day.length == pytest.approx(13.5)
+    assert report.day.size == "NQ"
+    assert report.day.mud == ["سوپرمیکس", "CMC"]
+    assert report.night.length == 16
+    assert report.night.mud == []
+    assert report.current_shift == "day"
+
+
+def test_all_errors_are_reported_together():
+    text = "گمانه: BH-1\nرنگ: آبی\nبدون دونقطه\n[روز]\nشروع: 20\nپایان: 10\nسایز: XQ\n"
+    with pytest.raises(bulk_entry.BulkError) as info:
+        bulk_entry.parse_text(text)
+
+    errors = info.value.errors
+    assert "خط 2: کلید ناشناخته «رنگ»" in errors
+    assert any(e.startswith("خط 3:") for e in errors)
+    assert "منطقه وارد نشده" in errors
+    assert "شیفت روز: آب وارد نشده" in errors
+    assert any("سایز" in e and "XQ" in e for e in errors)
+    assert any("کمتر است" in e for e in errors)
+
+
+def test_json_round_trip_of_to_dict():
+    report = bulk_entry.parse_text(MESSAGE)
+    again = bulk_entry.parse_json(json.dumps(report.to_dict(), ensure_ascii=False))
+    assert session_free(again) == session_free(report)
+
+
+def test_json_with_text_keys_and_shift_objects():
+    obj = {
+        "منطقه": "سنگان", "گمانه": "BH-12", "دستگاه": "DBC", "زاویه": "90",
+        "تاریخ": "05/07/1403",
+        "night": {"شروع": 1, "پایان": 2, "سایز": "BQ", "آب": 10, "گازوئیل": 5, "گل": ["CMC"]},
+    }
+    report = bulk_entry.parse_json(json.dumps(obj, ensure_ascii=False))
+
+    assert report.rig == "DBC-S15-A"
+    assert report.current_shift == "night"
+    assert report.day.start is None
+    assert report.night.mud == ["CMC"]
+
+
+@pytest.mark.parametrize("text", ["[1, 2]", "{not json"])
+def test_invalid_json(text):
+    with pytest.raises(bulk_entry.BulkError):
+        bulk_entry.parse_json(text)
+
+
+def test_two_column_csv_matches_text():
+    rows = []
+    for line in MESSAGE.strip().splitlines():
+        key, _, value = line.partition(":")
+        rows.append(f'"{key}","{value.strip()}"' if value.strip() else key)
+    report = bulk_entry.parse_csv("\n".join(rows))
+    assert session_free(report) == session_free(bulk_entry.parse_text(MESSAGE))
+
+
+def test_tabular_csv_one_row_per_shift():
+    text = (
+        "منطقه,گمانه,دستگاه,زاویه,تاریخ,شیفت,شروع,پایان,سایز,آب,گازوئیل,گل\n"
+        "سنگان,BH-12,DB 1200,60,05/07/1403,شب,134,150,HQ,3000,150,\n"
+        "سنگان,BH-12,DB 1200,60,05/07/1403,روز,120.5,134,NQ,3500,180,CMC + خاک اره\n"
+    )
+    report = bulk_entry.parse_csv(text)
+
+    assert report.day.start == 120.5 and report.night.start == 134
+    assert report.day.mud == ["CMC", "خاک اره"]
+
+
+def test_parse_file_dispatches_and_decodes_cp1256():
+    text = "منطقه,گمانه\n".replace("ی", "ي")
+    with pytest.raises(bulk_entry.BulkError):
+        bulk_entry.parse_file(text.encode("cp1256"), "r.csv")
+    with pytest.raises(bulk_entry.BulkError, match="CSV یا JSON"):
+        bulk_entry.parse_file(b"x", "r.txt")
+    with pytest.raises(bulk_entry.BulkError, match="بزرگ"):
+        bulk_entry.parse_file(b"x" * (bulk_entry.MAX_BYTES + 1), "r.csv")
+
+    report = bulk_entry.parse_file(MESSAGE.encode("utf-8-sig"), "r.csv")
+    assert report.borehole == "BH-12"
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1403/07/05", "05/07/1403"),
+    ("5/7/1403", "05/07/1403"),
+    ("۱۴۰۳-۰۷-۰۵", "05/07/1403"),
+])
+def test_parse_date(value, expected):
+    assert bulk_entry.parse_date(value) == expected
+
+
+@pytest.mark.parametrize("value", ["1403/13/05", "05/07/03", "1403/07"])
+def test_parse_date_rejects(value):
+    with pytest.raises(InvalidInput):
+        bulk_entry.parse_date(value)
+
+
+def test_parse_rig_and_mud():
+    assert bulk_entry.parse_rig("DB-1200") == "DB 1200"
+    assert bulk_entry.parse_rig("dbc s15") == "DBC-S15-A"
+    with pytest.raises(InvalidInput):
+        bulk_entry.parse_rig("CS14")
+    assert bulk_entry.parse_mud("-") == []
+    assert bulk_entry.parse_mud("cmc, CMC، super") == ["CMC", "سوپرمیکس"]
+    with pytest.raises(InvalidInput):
+        bulk_entry.parse_mud("بنتونیت")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("[روز]", "day"), ("شیفت شب", "night"), ("Night", "night"), ("ظهر", None),
+])
+def test_shift_name(text, expected):
+    assert bulk_entry.shift_name(text) == expected
@@ -0,0 +1,121 @@
+import csv
+import io
+
+import numpy as np
+import pytest
+
+import columnar
+from models import Report, Shift
+
+
+def make_report(n: int, night: bool = True) -> Report:
+    report = Report(
+        region="سنگان" if n % 2 else "چادرملو", borehole=f"BH-{n % 5}", rig="DB 1200",
+        angle_deg=60, date=f"0{1 + n % 9}/07/1403",
+        day=Shift(supervisors=["علی", "رضا"], helpers=[], workshop_bosses=["مهدی"],
+                  start=float(n), end=n + 10.5, length=10.5, size="NQ",
+                  mud=["سوپرمیکس", "CMC"], water=3000.0, diesel=None, notes=f"یادداشت {n}"),
+    )
+    if night:
+        report.night = Shift(supervisors=["حسن"], start=n + 10.5, end=n + 20.0, length=9.5,
+                             size="HQ", mud=[], water=2500.0, diesel=150.0, notes="")
+    return report
+
+
+@pytest.fixture(params=["always", "never"])
+def writer(request, tmp_path):
+    w = columnar.ColumnarWriter(str(tmp_path), chunk_rows=7, compress=request.param, flush_interval=0)
+    yield w
+    w.close()
+
+
+def test_round_trip_all_encodings(writer):
+    for n in range(10):
+        writer.append_report(n + 1, make_report(n, night=n % 3 != 0))
+    writer.flush()
+
+    reader = columnar.ColumnarReader(writer.directory)
+    codecs = {spec["codec"] for chunk in reader.chunks
+              for col in chunk.columns.values() for spec in col["blocks"].values()}
+    # بلوک خالی همیشه خام است
+    assert codecs == ({"zlib", "raw"} if writer.compress == "always" else {"raw"})
+
+    expected = [row for n in range(10) for row in columnar.shift_rows(n + 1, make_report(n, night=n % 3 != 0))]
+    got = reader.read(list(columnar.SCHEMA))
+    assert reader.rows == len(expected) == 16
+
+    assert list(got["report_id"]) == [r["report_id"] for r in expected]
+    assert list(got["borehole"]) == [r["borehole"] for r in expected]          # dict
+    assert got["mud"] == [r["mud"] for r in expected]                          # list
+    assert got["helpers"] == [r["helpers"] for r in expected]                  # list خالی
+    assert got["notes"] == [r["notes"] for r in expected]                      # str
+    diesel = [np.nan if r["diesel"] is None else r["diesel"] for r in expected]
+    np.testing.assert_array_equal(got["diesel"], diesel)                       # f8 با NaN
+    assert got["date"][0] == 14030701
+
+
+def test_dict_columns_without_decoding(writer):
+    writer.append_report(1, make_report(1))
+    writer.flush()
+    chunk = next(columnar.ColumnarReader(writer.directory).iter_chunks(["size"], decode=False))
+    codes, values = chunk["size"]
+    assert [values[c] for c in codes] == ["NQ", "HQ"]
+
+
+def test_rearchived_report_replaces_previous_rows(writer):
+    writer.append_report(1, make_report(1))
+    writer.append_report(2, make_report(2))
+    writer.flush()
+    edited = make_report(1, night=False)
+    edited.day.length = 12.0
+    writer.append_report(1, edited)
+    writer.flush()
+
+    reader = columnar.ColumnarReader(writer.directory)
+    got = reader.read(["report_id", "shift", "length"])
+    assert reader.rows == 3
+    rows = sorted(zip(got["report_id"], got["shift"], got["length"]))
+    assert rows == [(1, "day", 12.0), (2, "day", 10.5), (2, "night", 9.5)]
+
+
+def test_export_csv(writer):
+    writer.append_report(1, make_report(1))
+    writer.flush()
+
+    out = io.StringIO()
+    columnar.export_csv(columnar.ColumnarReader(writer.directory), out,
+                        ["date", "borehole", "length", "diesel", "mud", "notes"])
+    rows = list(csv.reader(io.StringIO(out.getvalue())))
+    assert rows == [
+        ["date", "borehole", "length", "diesel", "mud", "notes"],
+        ["14030702", "BH-1", "10.5", "", "سوپرمیکس + CMC", "یادداشت 1"],
+        ["14030702", "BH-1", "9.5", "150", "", ""],
+    ]
+
+
+def test_writer_flushes_on_time_bound(tmp_path):
+    w = columnar.ColumnarWriter(str(tmp_path), chunk_rows=1000, flush_interval=0.05)
+    try:
+        w.append_report(1, make_report(1))
+        for _ in range(100):
+            if columnar.ColumnarReader(str(tmp_path)).rows:
+                break
+            w._stop.wait(0.02)
+        assert columnar.ColumnarReader(str(tmp_path)).rows == 2
+    finally:
+        w.close()
+
+
+def test_chunks_without_version_column_are_read(tmp_path):
+    rows = list(columnar.shift_rows(5, make_report(5)))
+    schema = dict(columnar.SCHEMA)
+    del schema["version"]
+    old = columnar.SCHEMA
+    columnar.SCHEMA = schema
+    try:
+        columnar.write_chunk(str(tmp_path / "chunk-0.col"), rows)
+    finally:
+        columnar.SCHEMA = old
+    reader = columnar.ColumnarReader(str(tmp_path))
+    assert reader.rows == 2
+    assert list(reader.read(["report_id", "version"])["version"]) == [0, 0]
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+from telegram.error import BadRequest
+
+import metrics
+from edit_coalescer import EditCoalescer
+
+
+def edits(result):
+    return metrics.MESSAGE_EDITS._values.get((result,), 0)
+
+
+class FakeQuery:
+    """پیام ساختگی که ویرایش‌ها را ثبت می‌کند؛ با hold هر ویرایش تا release در راه می‌ماند."""
+
+    def __init__(self, message_id=1, hold=False, error=None):
+        self.message = SimpleNamespace(chat_id=1, message_id=message_id)
+        self.edits = []
+        self.error = error
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        if not hold:
+            self.release.set()
+
+    async def edit_message_text(self, text, reply_markup=None):
+        self.started.set()
+        await self.release.wait()
+        self.edits.append(text)
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        return self.message
+
+
+async def drain(coalescer):
+    while len(coalescer):
+        await asyncio.sleep(0.005)
+
+
+def test_rapid_edits_collapse_to_the_last_state():
+    async def scenario():
+        coalescer = EditCoalescer(interval=0.02)
+        query = FakeQuery()
+        for n in range(6):
+            coalescer.edit(query, f"state {n}")
+            await asyncio.sleep(0)
+        await drain(coalescer)
+        return query.edits
+
+    coalesced = edits("coalesced")
+    sent = asyncio.run(scenario())
+    # اولی فوراً، بقیه در یک ویرایش با آخرین وضعیت
+    assert sent[0] == "state 0"
+    assert sent[-1] == "state 5"
+    assert len(sent) == 2
+    assert edits("coalesced") > coalesced
+
+
+def test_unchanged_state_is_not_sent_again():
+    async def scenario():
+        coalescer = EditCoalescer(interval=0.02)
+        query = FakeQuery()
+        coalescer.edit(query, "same")
+        await asyncio.sleep(0)
+        coalescer.edit(query, "other")
+        coalescer.edit(query, "same")   # برگشت به همان وضعیت ارسال‌شده
+        await drain(coalescer)
+        return query.edits
+
+    assert asyncio.run(scenario()) == ["same"]
+
+
+def test_message_not_modified_is_skipped_quietly(caplog):
+    async def scenario():
+        coalescer = EditCoalescer(interval=0.01)
+        query = FakeQuery(error=BadRequest("Message is not modified: specified new message content ..."))
+        coalescer.edit(query, "a")
+        await drain(coalescer)
+        coalescer.edit(query, "b")
+        await drain(coalescer)
+        return query.edits
+
+    with caplog.at_level(logging.WARNING, logger="edit_coalescer"):
+        assert asyncio.run(scenario()) == ["a", "b"]
+    assert not caplog.records
+
+
+def test_other_bad_requests_are_logged(caplog):
+    async def scenario():
+        coalescer = EditCoalescer(interval=0.01)
+        query = FakeQuery(error=BadRequest("Message to edit not found"))
+        coalescer.edit(query, "a")
+        await drain(coalescer)
+
+    with caplog.at_level(logging.WARNING, logger="edit_coalescer"):
+        asyncio.run(scenario())
+    assert "not found" in caplog.text
+
+
+def test_settle_drops_pending_and_waits_for_the_edit_in_flight():
+    async def scenario():
+        coalescer = EditCoalescer(interval=0.01)
+        query = FakeQuery(hold=True)
+        coalescer.edit(query, "in flight")
+        await query.started.wait()
+        coalescer.edit(query, "pending")
+
+        settle = asyncio.create_task(coalescer.settle(query))
+        await asyncio.sleep(0.02)
+        assert not settle.done()        # درخواست در راه لغو نشده، settle منتظرش است
+        query.release.set()
+        await settle
+        await asyncio.sleep(0.03)
+        return query.edits, len(coalescer)
+
+    dropped = edits("dropped")
+    sent, slots = asyncio.run(scenario())
+    assert sent == ["in flight"]
+    assert slots == 0
+    assert edits("dropped") == dropped + 1
+
+
+def test_settle_without_pending_edits_is_a_no_op():
+    async def scenario():
+        coalescer = EditCoalescer(interval=0.01)
+        await coalescer.settle(FakeQuery())
+        return len(coalescer)
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_messages_are_coalesced_separately():
+    async def scenario():
+        coalescer = EditCoalescer(interval=0.02)
+        first, second = FakeQuery(message_id=1), FakeQuery(message_id=2)
+        coalescer.edit(first, "one")
+        coalescer.edit(second, "two")
+        assert len(coalescer) == 2
+        await drain(coalescer)
+        return first.edits, second.edits
+
+    assert asyncio.run(scenario()) == (["one"], ["two"])
@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+import archive
+import bot_flow
+
+
+class FakeMessage:
+    chat_id = 1
+    message_id = 1
+    text = None
+
+    def __init__(self, sent):
+        self.sent = sent
+
+    async def reply_text(self, text, **kwargs):
+        self.sent.append(text)
+        return self
+
+
+class FakeQuery:
+    def __init__(self, user, data, sent):
+        self.from_user = user
+        self.data = data
+        self.message = FakeMessage(sent)
+        self.sent = sent
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, text, **kwargs):
+        self.sent.append(text)
+        return self.message
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+class FakeUpdate:
+    def __init__(self, user_id, sent, text=None, data=None):
+        self.effective_user = FakeUser(user_id)
+        self.message = FakeMessage(sent)
+        self.message.text = text
+        self.callback_query = FakeQuery(self.effective_user, data, sent) if data is not None else None
+
+
+class Chat:
+    """یک کاربر که پیام و دکمه می‌فرستد؛ sent پاسخ‌های ربات را نگه می‌دارد."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.sent = []
+
+    def text(self, text):
+        update = FakeUpdate(self.user_id, self.sent, text=text)
+        if text.startswith("/start"):
+            return asyncio.run(bot_flow.start_flow(update, None))
+        return asyncio.run(bot_flow.flow_router(update, None))
+
+    def press(self, data):
+        update = FakeUpdate(self.user_id, self.sent, data=data)
+        return asyncio.run(bot_flow.handle_callback(update, None))
+
+    @property
+    def step(self):
+        return bot_flow.store.get_step(self.user_id)
+
+    @property
+    def report(self):
+        return bot_flow.store.get_data(self.user_id)
+
+
+def run_conversation(chat: Chat, borehole: str):
+    """گزارش کامل دو شیفته، همان مسیری که یک کاربر واقعی می‌رود."""
+    chat.text("/start")
+    for kind, value in (
+        ("t", "سنگان"), ("t", borehole), ("c", "rig_DB1200"), ("t", "60"),
+        ("t", "1403"), ("t", "7"), ("t", "5"),
+        ("c", "shift_day"), ("t", "علی"), ("t", "حسن, رضا"), ("t", "مهدی"),
+        ("t", "120.5"), ("t", "134"), ("c", "size_NQ"), ("c", "mud_super"),
+        ("c", "mud_done"), ("t", "3500"), ("t", "180"),
+        ("c", "shift_ok_day"), ("t", "بدون مشکل"), ("c", "need_night"),
+        ("c", "shift_night"), ("t", "رضا"), ("t", "-"), ("t", "مهدی"),
+        ("t", "134"), ("t", "150"), ("c", "size_HQ"), ("c", "mud_done"),
+        ("t", "3000"), ("t", "150"), ("c", "shift_ok_night"), ("t", "شب آرام"),
+    ):
+        chat.text(value) if kind == "t" else chat.press(value)
+
+
+@pytest.fixture
+def chat(request):
+    user_id = 10_000 + len(request.node.name)
+    bot_flow.store.delete(user_id)
+    return Chat(user_id)
+
+
+def test_conversation_archives_report_once(chat):
+    run_conversation(chat, "T-ONCE")
+
+    assert chat.step == bot_flow.STEP_DONE
+    assert chat.report.archive_id is not None
+    rows = bot_flow.reports.query("borehole", "T-ONCE")
+    assert len(rows) == 1
+    assert rows[0].meters == pytest.approx(29.5)
+
+
+def test_stale_finalize_buttons_are_ignored(chat):
+    run_conversation(chat, "T-STALE")
+    replies = len(chat.sent)
+
+    chat.press("shift_ok_night")
+    chat.press("no_more_shift")
+    chat.press("need_night")
+
+    assert chat.step == bot_flow.STEP_DONE
+    assert len(chat.sent) == replies
+    assert len(bot_flow.reports.query("borehole", "T-STALE")) == 1
+
+
+def test_refinalizing_an_edited_report_updates_the_same_row(chat):
+    run_conversation(chat, "T-EDIT")
+    archive_id = chat.report.archive_id
+
+    # دکمه‌ی ویرایش روی خلاصه‌ی قدیمی شیفت شب، بعد تأیید دوباره
+    chat.press("edit_end")
+    chat.text("160")
+    chat.press("shift_ok_night")
+
+    assert chat.step == bot_flow.STEP_DONE
+    rows = bot_flow.reports.query("borehole", "T-EDIT")
+    assert [r.id for r in rows] == [archive_id]
+    assert rows[0].meters == pytest.approx(39.5)
+
+
+@pytest.mark.parametrize("args, expected", [
+    (["BH-12"], ("borehole", "BH-12", archive.HISTORY_LIMIT)),
+    (["BH", "12"], ("borehole", "BH 12", archive.HISTORY_LIMIT)),
+    (["BH-12", "limit=3"], ("borehole", "BH-12", 3)),
+    (["-n", "4", "region", "سنگان"], ("region", "سنگان", 4)),
+    (["rig", "DB", "1200"], ("rig", "DB 1200", archive.HISTORY_LIMIT)),
+    (["rig", "DB", "1200", "10"], ("rig", "DB 1200", 10)),
+    (["rig", "DB", "1200", "--limit", "2"], ("rig", "DB 1200", 2)),
+    (["date", "05/07/1403", "5"], ("date", "05/07/1403", 5)),
+    (["region", "منطقه", "5"], ("region", "منطقه 5", archive.HISTORY_LIMIT)),
+    (["BH-12", "-n"], ("borehole", "BH-12 -n", archive.HISTORY_LIMIT)),
+])
+def test_parse_history_args(args, expected):
+    assert bot_flow.parse_history_args(args) == expected
@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import pytest
+from telegram.error import RetryAfter
+
+import outbound
+
+
+def test_bucket_refills_at_rate_up_to_burst():
+    bucket = outbound.TokenBucket(rate=10, burst=3)
+    for _ in range(3):
+        assert bucket.delay() == 0
+        bucket.take()
+    assert bucket.delay() == pytest.approx(0.1, abs=0.01)
+
+    bucket.updated -= 0.25      # ۰٫۲۵ ثانیه بعد: دو توکن و نیم
+    assert bucket.delay() == 0
+    assert bucket.tokens == pytest.approx(2.5, abs=0.01)
+
+    bucket.updated -= 10        # هیچ‌وقت بیشتر از burst جمع نمی‌شود
+    bucket.delay()
+    assert bucket.tokens == 3
+
+
+def test_pause_blocks_until_deadline():
+    bucket = outbound.TokenBucket(rate=100, burst=5)
+    bucket.pause(0.5)
+    assert bucket.delay() == pytest.approx(0.5, abs=0.05)
+
+
+def test_gate_serves_interactive_before_bulk():
+    async def scenario():
+        gate = outbound.PriorityGate(outbound.TokenBucket(rate=50, burst=1))
+        gate.bucket.take()      # سطل خالی، همه در صف می‌مانند
+        order = []
+
+        async def request(name, priority):
+            await gate.acquire(priority)
+            order.append(name)
+
+        tasks = [asyncio.create_task(request(name, prio)) for name, prio in (
+            ("pdf-1", outbound.BULK), ("reply-1", outbound.INTERACTIVE),
+            ("pdf-2", outbound.BULK), ("reply-2", outbound.INTERACTIVE),
+        )]
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["reply-1", "reply-2", "pdf-1", "pdf-2"]
+
+
+def scheduler(**kwargs):
+    kwargs.setdefault("global_rate", 1000)
+    kwargs.setdefault("chat_rate", 1000)
+    kwargs.setdefault("chat_burst", 100)
+    return outbound.OutboundScheduler(**kwargs)
+
+
+def test_requests_in_one_chat_finish_in_order():
+    async def scenario():
+        s = scheduler()
+        done = []
+
+        def send(chat_id, n, delay):
+            async def callback():
+                await asyncio.sleep(delay)
+                done.append((chat_id, n))
+            return s.process_request(callback, (), {}, "sendMessage", {"chat_id": chat_id}, None)
+
+        # درخواست اول کندتر است؛ بقیه‌ی همان چت باید منتظرش بمانند، چت دیگر نه
+        await asyncio.gather(
+            send(1, 1, 0.05), send(1, 2, 0.01), send(1, 3, 0), send(2, 1, 0),
+        )
+        return done
+
+    done = asyncio.run(scenario())
+    assert [n for chat, n in done if chat == 1] == [1, 2, 3]
+    assert done.index((2, 1)) < done.index((1, 1))
+
+
+def test_retry_after_waits_outside_chat_lock_and_retakes_tokens():
+    async def scenario():
+        s = scheduler(chat_rate=0.001, chat_burst=10)    # بدون پر شدن در طول تست
+        calls = []
+
+        async def flooded():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise RetryAfter(1)
+            return "ok"
+
+        chat = s._chat(7)
+        first = asyncio.create_task(
+            s.process_request(flooded, (), {}, "sendMessage", {"chat_id": 7}, None)
+        )
+        await asyncio.sleep(0.2)
+        # در مهلت RetryAfter قفل چت آزاد است؛ ولی سطل چت تا پایان مهلت مکث دارد
+        assert not chat.lock.locked()
+        assert chat.bucket.paused_until > time.monotonic()
+        result = await first
+        tokens_after = chat.bucket.tokens
+        return result, calls, tokens_after
+
+    result, calls, tokens_after = asyncio.run(scenario())
+    assert result == "ok"
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 1.0
+    # هر تلاش یک توکن گرفته است
+    assert tokens_after == pytest.approx(8, abs=0.5)
+
+
+def test_retry_after_gives_up_after_max_retries():
+    async def scenario():
+        s = scheduler(max_retries=1)
+        calls = []
+
+        async def always_flooded():
+            calls.append(1)
+            raise RetryAfter(0)
+
+        with pytest.raises(RetryAfter):
+            await s.process_request(always_flooded, (), {}, "sendMessage", {"chat_id": 3}, None)
+        return len(calls)
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_retry_seconds_accepts_int_and_timedelta():
+    import datetime as dt
+    assert outbound.retry_seconds(RetryAfter(3)) == 3
+    assert outbound.retry_seconds(RetryAfter(dt.timedelta(seconds=1.5))) == 1.5
@@ -0,0 +1,72 @@
+import pdf_cache
+
+
+def check_index(cache):
+    """_by_user و _users همدیگر را دقیق منعکس می‌کنند و مجموعه‌ی خالی نمی‌ماند."""
+    reverse = {}
+    for user_id, key in cache._by_user.items():
+        assert key in cache._entries
+        reverse.setdefault(key, set()).add(user_id)
+    assert reverse == cache._users
+
+
+def test_lru_eviction_forgets_users():
+    cache = pdf_cache.PDFCache(max_bytes=3 * (100 + pdf_cache._ENTRY_OVERHEAD))
+    for user_id in range(10):
+        cache.put(user_id, f"k{user_id}", b"x" * 100)
+
+    assert len(cache) == 3
+    assert set(cache._by_user) == {7, 8, 9}
+    check_index(cache)
+
+
+def test_invalidate_user_unlinks_only_that_user():
+    cache = pdf_cache.PDFCache()
+    cache.put(1, "a", b"pdf")
+    cache.get(2, "a")
+
+    cache.invalidate_user(1)
+
+    # کاربر ۲ همان محتوا را دارد؛ PDF و پیوندش می‌ماند
+    assert len(cache) == 1
+    assert cache._by_user == {2: "a"} and cache._users == {"a": {2}}
+    assert cache.get(2, "a").pdf == b"pdf"
+    check_index(cache)
+
+
+def test_new_key_replaces_users_previous_key():
+    cache = pdf_cache.PDFCache()
+    cache.put(1, "a", b"pdf")
+    cache.put(1, "b", b"pdf")
+
+    assert cache._by_user == {1: "b"}
+    assert cache._users == {"b": {1}}
+    check_index(cache)
+
+
+def test_forget_users_keeps_pdfs():
+    cache = pdf_cache.PDFCache()
+    cache.put(1, "a", b"pdf")
+    cache.get(2, "a")
+
+    cache.forget_users([1])
+    assert cache._users == {"a": {2}}
+    cache.forget_users([2, 3])
+
+    assert len(cache) == 1
+    assert cache._by_user == {} and cache._users == {}
+
+
+def test_oversize_pdf_is_not_indexed():
+    cache = pdf_cache.PDFCache(max_bytes=10)
+    entry = cache.put(1, "a", b"x" * 100)
+
+    assert entry.pdf == b"x" * 100
+    assert len(cache) == 0 and cache._by_user == {}
+
+
+def test_report_key_ignores_session_fields():
+    base = {"borehole": "BH-1", "shifts": {}}
+    assert pdf_cache.report_key(base) == pdf_cache.report_key(
+        dict(base, edit_field="water", archive_id=4, current_shift="day")
+    )
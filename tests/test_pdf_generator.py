@@ -0,0 +1,83 @@
+import sys
+import threading
+
+from reportlab import rl_config
+
+import pdf_generator
+
+
+def test_standard_is_the_default_profile():
+    assert pdf_generator.PDF_PROFILE.name == "standard"
+
+
+def test_stream_encoding_is_scoped_to_renders(monkeypatch):
+    monkeypatch.setattr(rl_config, "useA85", 1)
+    standard = pdf_generator.generate_pdf(pdf_generator._WARMUP_REPORT)
+
+    monkeypatch.setattr(pdf_generator, "PDF_PROFILE", pdf_generator.OUTPUT_PROFILES["small"])
+    small = pdf_generator.generate_pdf(pdf_generator._WARMUP_REPORT)
+
+    # جریان صفحه در small باینری است، ولی تنظیم سراسری reportlab دست نخورده
+    assert small.count(b"ASCII85Decode") < standard.count(b"ASCII85Decode")
+    assert rl_config.useA85 == 1
+
+
+def test_nested_stream_encoding_restores_once():
+    small = pdf_generator.OUTPUT_PROFILES["small"]
+    saved = rl_config.useA85
+    with pdf_generator.stream_encoding(small):
+        with pdf_generator.stream_encoding(small):
+            assert rl_config.useA85 == 0
+        assert rl_config.useA85 == 0
+    assert rl_config.useA85 == saved
+
+
+def test_concurrent_renders_count_every_output():
+    before = pdf_generator.output_stats()["renders"]
+    threads = [
+        threading.Thread(target=pdf_generator.generate_pdf, args=(pdf_generator._WARMUP_REPORT,))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert pdf_generator.output_stats()["renders"] == before + 4
+
+
+def test_warm_up_is_not_counted():
+    before = pdf_generator.output_stats()["renders"]
+    pdf_generator.warm_up()
+    assert pdf_generator.output_stats()["renders"] == before
+
+
+def test_page_compression_follows_the_profile(monkeypatch):
+    monkeypatch.setattr(rl_config, "pageCompression", 0)
+    monkeypatch.setattr(rl_config, "invariant", 1)
+    standard = pdf_generator.generate_pdf(pdf_generator._WARMUP_REPORT)
+
+    monkeypatch.setattr(pdf_generator, "PDF_PROFILE", pdf_generator.OUTPUT_PROFILES["small"])
+    small = pdf_generator.generate_pdf(pdf_generator._WARMUP_REPORT)
+
+    # standard همان پیش‌فرض reportlab را می‌گیرد، small همیشه فشرده است
+    assert small.count(b"FlateDecode") > standard.count(b"FlateDecode")
+
+
+def test_standard_output_is_unchanged(monkeypatch):
+    monkeypatch.setattr(rl_config, "invariant", 1)
+    rendered = pdf_generator.generate_pdf(pdf_generator._WARMUP_REPORT)
+
+    # همان رندر با canvas پیش‌فرض reportlab (خروجی پیش از پروفایل‌ها)
+    original = pdf_generator.canvas.Canvas
+    monkeypatch.setattr(
+        pdf_generator.canvas, "Canvas",
+        lambda out, pagesize, pageCompression: original(out, pagesize=pagesize),
+    )
+    assert pdf_generator.generate_pdf(pdf_generator._WARMUP_REPORT) == rendered
+
+
+def test_shrink_jpeg_without_pillow_keeps_the_original(monkeypatch):
+    monkeypatch.setitem(sys.modules, "PIL", None)
+    jpeg = b"\xff\xd8 not really a jpeg \xff\xd9"
+    assert pdf_generator.shrink_jpeg(jpeg, pdf_generator.OUTPUT_PROFILES["small"]) == jpeg
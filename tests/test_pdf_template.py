@@ -0,0 +1,45 @@
+import io
+
+import pytest
+from reportlab.pdfgen import canvas
+
+import pdf_generator
+import pdf_template
+
+
+def template(path, size):
+    """قالب برداری ساختگی: یک کادر دور صفحه."""
+    c = canvas.Canvas(str(path), pagesize=size)
+    c.rect(10, 10, size[0] - 20, size[1] - 20)
+    c.showPage()
+    c.save()
+    return str(path)
+
+
+def stamped_transform(form):
+    c = canvas.Canvas(io.BytesIO(), pagesize=pdf_generator.PAGE_SIZE)
+    form.stamp(c)
+    cm = next(op for op in c._code if op.endswith(" cm"))
+    return [float(v) for v in cm.split()[:6]]
+
+
+def test_template_is_scaled_uniformly_and_centered(tmp_path):
+    page_w, page_h = pdf_generator.PAGE_SIZE
+    # همان نسبت صفحه، در حد تلورانس کمی پهن‌تر
+    size = (page_w / 2 * 1.005, page_h / 2)
+    form = pdf_template.load(template(tmp_path / "t.pdf", size), pdf_generator.PAGE_SIZE)
+    assert form is not None and form.vector
+
+    a, b, c, d, e, f = stamped_transform(form)
+    assert a == pytest.approx(d)
+    assert b == c == 0
+    assert a * size[0] == pytest.approx(page_w, abs=0.01)     # عرض پر می‌شود
+    assert e == pytest.approx(0, abs=0.01)
+    assert f == pytest.approx((page_h - a * size[1]) / 2, abs=0.01)
+    assert f > 0
+
+
+def test_template_with_another_aspect_ratio_is_rejected(tmp_path):
+    # قالب 612×455.7 روی A4 افقی کشیده می‌شد
+    path = template(tmp_path / "letter.pdf", (612, 455.7))
+    assert pdf_template.load(path, pdf_generator.PAGE_SIZE) is None
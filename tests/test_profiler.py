@@ -0,0 +1,61 @@
+import asyncio
+import sys
+
+import profiler
+
+
+def test_dump_waits_for_running_sample(tmp_path):
+    async def scenario():
+        prof = profiler.Profiler(str(tmp_path), sample_rate=1.0)
+        prof.start()
+        release = asyncio.Event()
+        still_profiling = []
+
+        async def handler(update, context):
+            await release.wait()
+            # dump نباید وسط نمونه پروفایلر را خاموش کرده باشد
+            still_profiling.append(sys.getprofile() is not None)
+            return sum(range(1000))
+
+        wrapped = prof.profiled(handler)
+        sample = asyncio.create_task(wrapped(None, None))
+        await asyncio.sleep(0)
+        assert prof._active
+
+        dump = asyncio.create_task(prof.dump())
+        await asyncio.sleep(0.05)
+        assert not dump.done()
+
+        release.set()
+        await sample
+        paths = await dump
+        await prof.stop()
+        return still_profiling, paths
+
+    still_profiling, paths = asyncio.run(scenario())
+    assert still_profiling == [True]
+    assert any(p.endswith(".prof") for p in paths)
+
+
+def test_dump_skips_cpu_stats_when_sample_does_not_finish(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "SAMPLE_WAIT", 0.05)
+
+    async def scenario():
+        prof = profiler.Profiler(str(tmp_path), sample_rate=1.0)
+        prof.start()
+
+        async def handler(update, context):
+            return sum(range(1000))
+
+        await prof.profiled(handler)(None, None)
+        prof._active = True
+        prof._idle.clear()
+        paths = await prof.dump()
+        prof._active = False
+        prof._idle.set()
+        await prof.stop()
+        return paths
+
+    paths = asyncio.run(scenario())
+    assert not any(p.endswith(".prof") for p in paths)
+    assert any("mem-" in p for p in paths)
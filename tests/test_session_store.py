@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+import session_store
+from models import Report
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        session_store.SessionStore()
+
+
+def test_sqlite_store_round_trips_after_eviction(tmp_path):
+    store = session_store.SQLiteSessionStore(str(tmp_path / "s.db"), flush_interval=60)
+    report = Report(borehole="BH-1")
+    store.set_data(1, report)
+    store.set_step(1, "rig")
+    report.region = "سنگان"
+    store.touch(1)
+
+    # dirty است؛ تا thread نوشتن (یا flush) روی دیسک نبرده بیرون نمی‌رود
+    assert store.evict_idle(0) == []
+    store.flush()
+    assert store.evict_idle(0) == [1]
+    assert store.count_by_step() == {}
+    assert store.get_step(1) == "rig"
+    assert store.get_data(1).region == "سنگان"
+    store.close()
+
+
+class StalledLock:
+    """قفل اتصال که اولین گرفتنش تا release عقب می‌افتد (flush کند یا preempt‌شده)."""
+
+    def __init__(self, lock):
+        self.lock = lock
+        self.waiting = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def __enter__(self):
+        self.calls += 1
+        if self.calls == 1:
+            self.waiting.set()
+            self.release.wait(5)
+        return self.lock.__enter__()
+
+    def __exit__(self, *exc):
+        return self.lock.__exit__(*exc)
+
+
+def test_older_flush_snapshot_never_overwrites_newer(tmp_path):
+    path = str(tmp_path / "s.db")
+    store = session_store.SQLiteSessionStore(path, flush_interval=60)
+    stalled = store._db_lock = StalledLock(store._db_lock)
+    report = Report(borehole="old")
+    store.set_data(1, report)
+
+    first = threading.Thread(target=store.flush)
+    first.start()
+    assert stalled.waiting.wait(5)
+
+    report.borehole = "new"
+    store.touch(1)
+    second = threading.Thread(target=store.flush)
+    second.start()
+    second.join(5)
+    stalled.release.set()
+    first.join()
+
+    # بدون flush آخر close: آنچه روی دیسک مانده باید نسخه‌ی جدید باشد
+    store._stop.set()
+    store._flusher.join()
+    with store._lock:
+        assert not store._dirty
+    store._conn.close()
+    reopened = session_store.SQLiteSessionStore(path)
+    assert reopened.get_data(1).borehole == "new"
+    reopened.close()
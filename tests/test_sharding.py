@@ -0,0 +1,202 @@
+import asyncio
+import queue
+import signal
+from collections import Counter
+
+import pytest
+
+import outbound
+import sharding
+
+
+def test_ring_spreads_keys_over_all_nodes():
+    ring = sharding.HashRing()
+    for node in range(4):
+        ring.add(node)
+
+    owners = Counter(ring.get(user) for user in range(4000))
+    assert set(owners) == {0, 1, 2, 3}
+    assert min(owners.values()) > 500
+
+
+def test_ring_moves_only_the_removed_nodes_keys():
+    ring = sharding.HashRing()
+    for node in range(4):
+        ring.add(node)
+    before = {user: ring.get(user) for user in range(2000)}
+
+    ring.remove(3)
+
+    assert len(ring) == 3
+    for user, owner in before.items():
+        if owner != 3:
+            assert ring.get(user) == owner
+        else:
+            assert ring.get(user) != 3
+
+
+def test_empty_ring_raises():
+    with pytest.raises(LookupError):
+        sharding.HashRing().get(1)
+
+
+class FakeWorker:
+    def __init__(self, worker_id):
+        self.id = worker_id
+        self.inbox = queue.Queue()
+
+
+class FakeDispatcher(sharding.ShardedDispatcher):
+    """بدون پروسه‌ی واقعی؛ timeout با ack_fails شبیه‌سازی می‌شود."""
+
+    def __init__(self, workers):
+        self.ack_fails = False
+        self.stopped = []
+        super().__init__(workers)
+
+    def _spawn(self):
+        worker = FakeWorker(self._next_id)
+        self._workers[worker.id] = worker
+        self._next_id += 1
+        return worker
+
+    async def _wait_acks(self, token, count):
+        if self.ack_fails:
+            raise queue.Empty
+
+    async def _stop_worker(self, worker):
+        self.stopped.append(worker.id)
+
+
+def run(coro_fn):
+    return asyncio.run(coro_fn())
+
+
+def test_add_and_drain_update_ring_and_workers():
+    async def scenario():
+        d = FakeDispatcher(2)
+        await d.add_worker()
+        assert d._ring.nodes == {0, 1, 2} and set(d._workers) == {0, 1, 2}
+
+        await d.drain_worker()
+        assert d._ring.nodes == {0, 1} and set(d._workers) == {0, 1}
+        assert d.stopped == [2]
+
+    run(scenario)
+
+
+def test_drain_timeout_keeps_worker_routable():
+    async def scenario():
+        d = FakeDispatcher(2)
+        d.ack_fails = True
+
+        await d.drain_worker()
+
+        assert d._ring.nodes == {0, 1} and set(d._workers) == {0, 1}
+        assert d.stopped == []
+        assert d._resume.is_set()
+        # همه‌ی کاربرها هنوز به workerی می‌رسند که وجود دارد
+        for user in range(500):
+            assert d._ring.get(user) in d._workers
+
+    run(scenario)
+
+
+def test_add_timeout_stops_the_new_worker():
+    async def scenario():
+        d = FakeDispatcher(2)
+        d.ack_fails = True
+
+        await d.add_worker()
+
+        assert d._ring.nodes == {0, 1} and set(d._workers) == {0, 1}
+        assert d.stopped == [2]
+        assert d._resume.is_set()
+
+    run(scenario)
+
+
+def test_last_worker_is_not_drained():
+    async def scenario():
+        d = FakeDispatcher(1)
+        await d.drain_worker()
+        assert d._ring.nodes == {0} and d.stopped == []
+
+    run(scenario)
+
+
+def rates(d):
+    """آخرین سهم ارسالی که هر worker گرفته."""
+    latest = {}
+    for worker in d._workers.values():
+        for kind, payload in list(worker.inbox.queue):
+            if kind == "rate":
+                latest[worker.id] = payload
+    return latest
+
+
+def test_outbound_share_follows_worker_count():
+    async def scenario():
+        d = FakeDispatcher(2)
+        assert rates(d) == {0: outbound.GLOBAL_RATE / 2, 1: outbound.GLOBAL_RATE / 2}
+
+        await d.add_worker()
+        assert rates(d) == {n: pytest.approx(outbound.GLOBAL_RATE / 3) for n in (0, 1, 2)}
+
+        await d.drain_worker()
+        assert rates(d) == {0: outbound.GLOBAL_RATE / 2, 1: outbound.GLOBAL_RATE / 2}
+
+        d.ack_fails = True
+        await d.add_worker()
+        assert rates(d) == {0: outbound.GLOBAL_RATE / 2, 1: outbound.GLOBAL_RATE / 2}
+
+    run(scenario)
+
+
+def test_set_global_rate_rescales_the_gate():
+    scheduler = outbound.OutboundScheduler(global_rate=30)
+    scheduler.set_global_rate(10)
+
+    bucket = scheduler.gate.bucket
+    assert bucket.rate == 10
+    assert bucket.burst == 1.0
+    assert bucket.tokens <= 1.0
+
+
+def test_profile_signals_are_forwarded_to_workers(monkeypatch):
+    killed = []
+
+    def fake_kill(pid, signum):
+        if pid == 1001:
+            raise ProcessLookupError
+        killed.append((pid, signum))
+
+    monkeypatch.setattr(sharding.os, "kill", fake_kill)
+
+    async def scenario():
+        d = FakeDispatcher(3)
+        for worker in d._workers.values():
+            worker.process = type("P", (), {"pid": 1000 + worker.id})()
+        d.forward_signal(signal.SIGUSR1)
+
+    run(scenario)
+    assert killed == [(1000, signal.SIGUSR1), (1002, signal.SIGUSR1)]
+
+
+def test_dispatcher_closes_what_bot_app_opened(monkeypatch):
+    built = {}
+    closed = []
+
+    async def fake_on_shutdown(app):
+        closed.append(app)
+
+    monkeypatch.setattr(sharding.session_store, "STORE_KIND", "sqlite")
+    monkeypatch.setattr(sharding.bot_app, "TOKEN", "123:test")
+    monkeypatch.setattr(sharding.bot_app, "on_shutdown", fake_on_shutdown)
+    monkeypatch.setattr(sharding.bot_app, "run_application", lambda app: built.setdefault("app", app))
+
+    sharding.run_sharded(2)
+    app = built["app"]
+    run(lambda: app.post_shutdown(app))
+
+    assert closed == [app]
@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+from update_processor import PerUserUpdateProcessor
+
+
+def update(user_id):
+    user = SimpleNamespace(id=user_id) if user_id is not None else None
+    return SimpleNamespace(effective_user=user)
+
+
+class Handlers:
+    """هندلرهای ساختگی که وسط کار await می‌کنند تا آپدیت‌ها در هم بروند."""
+
+    def __init__(self):
+        self.started = []
+        self.finished = []
+        self.running = {}
+        self.peak = 0
+        self.peak_per_user = 0
+
+    async def handle(self, user_id, n, pauses):
+        self.started.append((user_id, n))
+        self.running[user_id] = self.running.get(user_id, 0) + 1
+        self.peak = max(self.peak, sum(self.running.values()))
+        self.peak_per_user = max(self.peak_per_user, self.running[user_id])
+        for _ in range(pauses):
+            await asyncio.sleep(0)
+        self.running[user_id] -= 1
+        self.finished.append((user_id, n))
+
+
+def run(processor, handlers, arrivals):
+    async def scenario():
+        tasks = []
+        for user_id, n, pauses in arrivals:
+            tasks.append(asyncio.create_task(processor.process_update(
+                update(user_id), handlers.handle(user_id, n, pauses),
+            )))
+            await asyncio.sleep(0)      # ترتیب رسیدن مثل صف آپدیت‌های PTB
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+
+
+def test_each_user_runs_in_arrival_order_while_users_interleave():
+    processor = PerUserUpdateProcessor(concurrency=8, backlog=64)
+    handlers = Handlers()
+    # آپدیت اول هر کاربر کندتر است تا بعدی‌ها پشتش صف ببندند
+    arrivals = [(1, 0, 20), (2, 0, 5), (1, 1, 1), (2, 1, 3), (1, 2, 2), (2, 2, 0)]
+
+    run(processor, handlers, arrivals)
+
+    for user_id in (1, 2):
+        mine = [n for u, n in handlers.finished if u == user_id]
+        assert mine == [0, 1, 2]
+    assert handlers.peak_per_user == 1
+    assert handlers.peak == 2           # دو کاربر واقعاً موازی اجرا شدند
+    assert handlers.finished[0][0] == 2  # کاربر ۲ منتظر کاربر ۱ نماند
+    assert processor.users == 0
+    assert processor.waiting == 0
+    assert processor._users == {}
+
+
+def test_concurrency_caps_handlers_across_users():
+    processor = PerUserUpdateProcessor(concurrency=2, backlog=64)
+    handlers = Handlers()
+    arrivals = [(user_id, n, 3) for n in range(2) for user_id in range(5)]
+
+    run(processor, handlers, arrivals)
+
+    assert handlers.peak == 2
+    assert handlers.peak_per_user == 1
+    assert len(handlers.finished) == 10
+    for user_id in range(5):
+        assert [n for u, n in handlers.finished if u == user_id] == [0, 1]
+    assert processor._users == {}
+
+
+def test_waiting_counts_updates_queued_behind_their_user():
+    async def scenario():
+        processor = PerUserUpdateProcessor(concurrency=4, backlog=64)
+        gate = asyncio.Event()
+
+        async def blocked():
+            await gate.wait()
+
+        tasks = [asyncio.create_task(processor.process_update(update(7), blocked()))
+                 for _ in range(3)]
+        tasks.append(asyncio.create_task(processor.process_update(update(8), blocked())))
+        await asyncio.sleep(0)
+        seen = (processor.users, processor.waiting)
+        gate.set()
+        await asyncio.gather(*tasks)
+        return seen, processor._users
+
+    seen, users = asyncio.run(scenario())
+    assert seen == (2, 2)
+    assert users == {}
+
+
+def test_updates_without_a_user_skip_the_lock():
+    processor = PerUserUpdateProcessor(concurrency=4, backlog=64)
+    handlers = Handlers()
+
+    run(processor, handlers, [(None, 0, 4), (None, 1, 0)])
+
+    assert handlers.peak == 2
+    assert [n for _, n in handlers.finished] == [1, 0]
+    assert processor._users == {}
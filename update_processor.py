@@ -0,0 +1,84 @@
+# update_processor.py
+#
+# پردازش هم‌زمان آپدیت‌ها با حفظ ترتیب برای هر کاربر. به شکل
+# concurrent_updates در ApplicationBuilder وصل می‌شود: کاربرهای مختلف موازی
+# جلو می‌روند (یک /pdf کند بقیه را معطل نمی‌کند) ولی پیام‌ها و callbackهای
+# یک کاربر پشت هم و به ترتیب رسیدن اجرا می‌شوند، چون مرحله‌ی گفتگو در
+# session_store با هر آپدیت عوض می‌شود.
+
+import asyncio
+import os
+
+from telegram.ext import BaseUpdateProcessor
+
+# -------------------------------
+# تنظیمات (از متغیرهای محیطی)
+# -------------------------------
+
+CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64"))   # هندلرهایی که هم‌زمان اجرا می‌شوند
+BACKLOG = int(os.getenv("UPDATE_BACKLOG", "4096"))         # آپدیت‌های در حال اجرا یا در صف
+
+
+class _UserQueue:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()      # FIFO: آپدیت بعدی بعد از تمام شدن قبلی
+        self.users = 0                  # آپدیت‌هایی که این قفل را دارند یا منتظرش هستند
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    قفل جدا برای هر کاربر + سقف سراسری هندلرهای در حال اجرا.
+
+    سمافور خود PTB (max_concurrent_updates) پیش از do_process_update گرفته
+    می‌شود، پس آپدیتی که پشت قفل کاربرش منتظر است هم جای آن را می‌گیرد؛ برای
+    همین آن سقف بزرگ (BACKLOG) است و سقف اجرای واقعی (concurrency) بعد از
+    قفل کاربر گرفته می‌شود. قفل کاربری که آپدیتی در صف ندارد همان لحظه حذف
+    می‌شود. آپدیت بدون کاربر (مثلاً پست کانال) بدون قفل اجرا می‌شود.
+    """
+
+    def __init__(self, concurrency: int = CONCURRENCY, backlog: int = BACKLOG):
+        super().__init__(max(backlog, concurrency))
+        self.concurrency = concurrency
+        self._running = asyncio.Semaphore(concurrency)
+        self._users = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(CONCURRENCY, BACKLOG)
+
+    @property
+    def waiting(self) -> int:
+        """آپدیت‌هایی که پشت آپدیت قبلی همان کاربر منتظرند."""
+        return sum(q.users - 1 for q in self._users.values())
+
+    @property
+    def users(self) -> int:
+        return len(self._users)
+
+    async def do_process_update(self, update, coroutine):
+        user = getattr(update, "effective_user", None)
+        if user is None:
+            async with self._running:
+                await coroutine
+            return
+
+        q = self._users.get(user.id)
+        if q is None:
+            q = self._users[user.id] = _UserQueue()
+        q.users += 1
+        try:
+            async with q.lock:
+                async with self._running:
+                    await coroutine
+        finally:
+            q.users -= 1
+            if q.users == 0:
+                del self._users[user.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass